@@ -0,0 +1,339 @@
+import os, sys, io, json, time, types, argparse, platform, subprocess, tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+
+# Sem desktop/áudio (ex.: Linux headless) `soundcard`/`mss` podem nem importar;
+# o benchmark usa fontes sintéticas, então basta que os módulos existam.
+for _mod in ("soundcard", "mss"):
+    try:
+        __import__(_mod)
+    except Exception:
+        sys.modules[_mod] = types.ModuleType(_mod)
+
+import captura_video as cv
+from captura_audio import AudioRecorder
+from metrics import METRICS
+from roi_grab import bgra_view
+
+# ========================= CONFIG =========================
+BENCH_DIR = Path(__file__).resolve().parent / "bench_results"
+BENCH_SIZES = [(640, 360), (1280, 720), (1920, 1080)]  # ROI (largura, altura)
+BENCH_FPS = [30, 60]
+BENCH_MODES = ["fast", "high"]    # QUALITY_MODEs (sem FFmpeg: só o caminho mp4v)
+BENCH_SECONDS = 5.0               # duração de cada cenário
+BENCH_SEED = 1234                 # conteúdo sintético reprodutível
+BENCH_GRAB_MS = 0.0               # custo simulado do grab (mss real: ~2-8 ms)
+BENCH_AUDIO_CHANNELS = 2
+BENCH_YOLO_BACKENDS = ["torch", "openvino", "onnx"]  # ver BACKEND no yolo_roi_detect.py
+BENCH_YOLO_FRAMES = 100
+
+# ========================= Fontes sintéticas =========================
+class FakeShot:
+    """Mesmos campos do ScreenShot do mss usados por `bgra_view`."""
+    __slots__ = ("raw", "width", "height")
+
+    def __init__(self, raw, width: int, height: int):
+        self.raw = raw
+        self.width = width
+        self.height = height
+
+
+class FakeScreen:
+    """Substitui `mss.mss()`: frames BGRA sintéticos com movimento, no tamanho da ROI.
+
+    Gera `n_frames` quadros (gradiente + faixa móvel + ruído, semente fixa) e os
+    percorre em ciclo, então o custo do grab não depende do gerador. Após
+    `seconds` levanta KeyboardInterrupt, que encerra `record_video` como o
+    CTRL+C. `grab_ms` simula o custo do mss real (spin, mesma thread).
+    """
+    def __init__(self, width: int, height: int, seconds: float, n_frames: int = 8,
+                 seed: int = BENCH_SEED, grab_ms: float = BENCH_GRAB_MS):
+        rng = np.random.default_rng(seed)
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        self.frames = []
+        for i in range(n_frames):
+            f = np.empty((height, width, 4), dtype=np.uint8)
+            f[..., 0] = (x + 8 * i) % 256
+            f[..., 1] = (y + 4 * i) % 256
+            f[..., 2] = ((x + y) / 2).astype(np.uint8)
+            f[..., 3] = 255
+            band = (i * width // n_frames)
+            f[:, band:band + max(1, width // 16), :3] = 255
+            f[..., :3] ^= rng.integers(0, 16, size=(height, width, 3), dtype=np.uint8)
+            self.frames.append(f)
+        self.width, self.height = width, height
+        self.seconds = seconds
+        self.grab_sec = grab_ms / 1000.0
+        self.grabs = 0
+        self._t_end = None
+
+    def grab(self, region):
+        now = time.perf_counter()
+        if self._t_end is None:
+            self._t_end = now + self.seconds
+        elif now >= self._t_end:
+            raise KeyboardInterrupt
+        if self.grab_sec:
+            while time.perf_counter() - now < self.grab_sec:
+                pass
+        f = self.frames[self.grabs % len(self.frames)]
+        self.grabs += 1
+        return FakeShot(f.data, self.width, self.height)
+
+
+class FakeLoopback:
+    """Substitui o dispositivo de loopback do `soundcard`: PCM float32 em tempo real.
+
+    `recorder().record(n)` bloqueia até o instante em que um dispositivo real
+    entregaria o bloco (deadline t0 + amostras / samplerate) e devolve um tom
+    com ruído, em `channels` canais.
+    """
+    name = "Loopback sintético"
+    isloopback = True
+
+    def __init__(self, channels: int = BENCH_AUDIO_CHANNELS, seed: int = BENCH_SEED):
+        self.channels = channels
+        self.seed = seed
+
+    def recorder(self, samplerate: int, blocksize: int = 1024, **kw):
+        return _FakeRecorder(samplerate, self.channels, self.seed)
+
+
+class _FakeRecorder:
+    def __init__(self, samplerate: int, channels: int, seed: int):
+        self.samplerate = samplerate
+        self.channels = channels
+        self._rng = np.random.default_rng(seed)
+        self._t0 = None
+        self._n = 0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, numframes: int) -> np.ndarray:
+        deadline = self._t0 + (self._n + numframes) / self.samplerate
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t = (self._n + np.arange(numframes)) / self.samplerate
+        tone = 0.2 * np.sin(2 * np.pi * 440.0 * t).astype(np.float32)
+        noise = 0.01 * self._rng.standard_normal((numframes, self.channels), dtype=np.float32)
+        self._n += numframes
+        return tone[:, None] + noise
+
+
+class FakeMss:
+    """Módulo `mss` falso: `mss.mss()` devolve a tela sintética do cenário."""
+    def __init__(self, screen: FakeScreen):
+        self._screen = screen
+
+    def mss(self):
+        return self._screen
+
+
+# ========================= Utils =========================
+def percentiles(values, qs=(50, 95, 99)) -> dict:
+    if len(values) == 0:
+        return dict({f"p{q}": None for q in qs}, max=None)
+    arr = np.asarray(values, dtype=np.float64)
+    out = {f"p{q}": float(np.percentile(arr, q)) for q in qs}
+    out["max"] = float(arr.max())
+    return out
+
+def cpu_times():
+    """(CPU do processo, CPU dos filhos já encerrados, ex.: FFmpeg) em segundos."""
+    t = os.times()
+    return t.user + t.system, t.children_user + t.children_system
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=Path(__file__).resolve().parent)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+# ========================= Cenários =========================
+def bench_record(width: int, height: int, fps: int, mode: str, seconds: float,
+                 ffmpeg, workdir: Path, quiet: bool = True) -> dict:
+    """Roda record_video + AudioRecorder com fontes sintéticas e o mux final."""
+    METRICS.reset()
+    region = {'left': 0, 'top': 0, 'width': width, 'height': height}
+    screen = FakeScreen(width, height, seconds)
+    cv.mss = FakeMss(screen)
+    qprof = cv.quality_profile(mode, cv.pick_nvenc()) if ffmpeg else None
+    streaming = bool(ffmpeg and cv.STREAM_ENCODE)
+
+    tag = f"{width}x{height}_{fps}_{mode}"
+    tmp_video = workdir / f"{tag}.mp4"
+    tmp_audio = workdir / f"{tag}.wav"
+    out_mp4 = workdir / f"{tag}_final.mp4"
+    sync_log = cv.SyncLog()
+    rec = AudioRecorder(tmp_audio, FakeLoopback(), samplerate=cv.AUDIO_SAMPLERATE, sync_log=sync_log)
+
+    log = io.StringIO()
+    cpu0, child0 = cpu_times()
+    with redirect_stdout(log if quiet else sys.stdout):
+        rec.start()
+        try:
+            if streaming:
+                v0 = cv.record_video(region, fps, tmp_video, ffmpeg=ffmpeg, qprof=qprof,
+                                     sync_log=sync_log)
+            else:
+                v0 = cv.record_video(region, fps, tmp_video, sync_log=sync_log)
+        finally:
+            rec.stop()
+    cpu1, child1 = cpu_times()
+
+    snap = METRICS.snapshot()
+    counters, gauges = snap["counters"], snap["gauges"]
+    vt = np.frombuffer(sync_log.video_t, dtype=np.float64)
+    dur = float(vt[-1] - vt[0]) if len(vt) > 1 else seconds
+    frames = counters.get("video_frames_total", 0)
+    duplicated = counters.get("video_duplicated_frames_total", 0)
+    ticks = frames + duplicated
+
+    # Pós-processamento: mux (cópia do vídeo em streaming, reencode no mp4v)
+    post_sec = None
+    if ffmpeg and tmp_video.exists() and tmp_audio.exists():
+        sync = cv.estimate_sync(sync_log, cv.AUDIO_SAMPLERATE, fps)
+        offset = (sync[0] - sync[1]) if sync else ((rec.start_ts or 0.0) - (v0 or 0.0))
+        t = time.perf_counter()
+        with redirect_stdout(log if quiet else sys.stdout):
+            cv.mux_ffmpeg(ffmpeg, tmp_video, tmp_audio, out_mp4, fps, cv.AUDIO_SAMPLERATE,
+                          cv.AUDIO_BITRATE, offset, qprof, copy_video=streaming)
+        post_sec = time.perf_counter() - t
+
+    return dict(
+        scenario="record", width=width, height=height, fps=fps,
+        mode=mode if ffmpeg else "mp4v", streaming=streaming, seconds=dur,
+        effective_fps=ticks / max(dur, 1e-9),
+        capture_fps=frames / max(dur, 1e-9),
+        frames=frames, duplicated=duplicated,
+        dropped=int(gauges.get("video_dropped_frames", 0)),
+        lost=counters.get("video_lost_ticks_total", 0),
+        frame_interval_ms=percentiles(np.diff(vt) * 1000.0),
+        cpu_ms_per_frame=1000.0 * (cpu1 - cpu0) / max(ticks, 1),
+        encoder_cpu_ms_per_frame=1000.0 * (child1 - child0) / max(ticks, 1),
+        audio_overruns=rec.overruns,
+        audio_write_ms_max=1000.0 * rec.write_time_max,
+        post_sec=post_sec,
+        stages=snap["histograms"],
+    )
+
+
+def bench_yolo(width: int, height: int, backend: str, n_frames: int = BENCH_YOLO_FRAMES):
+    """Tempo de inferência + desenho das caixas em frames sintéticos, por backend
+    do yolo_roi_detect (torch = caminho PyTorch de referência)."""
+    try:
+        import yolo_roi_detect as yd
+        det = yd.make_detector((height, width, 3), backend)
+    except Exception as e:
+        print(f"Aviso: backend YOLO '{backend}' indisponível ({e}).")
+        return None
+    screen = FakeScreen(width, height, seconds=float("inf"))
+    infer, plot = [], []
+    for i in range(n_frames + 5):
+        frame = np.ascontiguousarray(bgra_view(screen.grab(None))[..., :3])
+        t0 = time.perf_counter()
+        xyxy, cls, conf = det.detect(frame)
+        t1 = time.perf_counter()
+        yd.draw_detections(frame, yd.Detections(i, t0, t1, xyxy, cls, conf), det.names)
+        t2 = time.perf_counter()
+        if i >= 5:  # aquecimento
+            infer.append((t1 - t0) * 1000.0)
+            plot.append((t2 - t1) * 1000.0)
+    return dict(scenario="yolo", width=width, height=height, backend=det.name,
+                device=getattr(det, "device", "cpu"), input=list(det.imgsz),
+                model=yd.MODEL_PATH, frames=n_frames,
+                fps=1000.0 * n_frames / max(sum(infer) + sum(plot), 1e-9),
+                inference_ms=percentiles(infer), plot_ms=percentiles(plot))
+
+
+# ========================= Comparação =========================
+def _key(r: dict) -> tuple:
+    return (r["scenario"], r["width"], r["height"], r.get("fps"), r.get("mode"),
+            r.get("backend"), r.get("device"))
+
+def compare(old_path: Path, new_path: Path):
+    """Imprime a variação por cenário entre dois resultados (ex.: dois commits)."""
+    old = {_key(r): r for r in json.loads(Path(old_path).read_text())["results"]}
+    new = json.loads(Path(new_path).read_text())["results"]
+    for r in new:
+        o = old.get(_key(r))
+        if o is None:
+            continue
+        name = " ".join(str(k) for k in _key(r) if k is not None)
+        if r["scenario"] == "record":
+            print(f"{name}: FPS {o['effective_fps']:.1f} -> {r['effective_fps']:.1f}"
+                  f" | p99 {o['frame_interval_ms']['p99'] or 0:.2f} -> {r['frame_interval_ms']['p99'] or 0:.2f}ms"
+                  f" | CPU/frame {o['cpu_ms_per_frame']:.2f} -> {r['cpu_ms_per_frame']:.2f}ms"
+                  f" | overruns {o['audio_overruns']} -> {r['audio_overruns']}")
+        else:
+            print(f"{name}: FPS {o['fps']:.1f} -> {r['fps']:.1f}"
+                  f" | inferência p99 {o['inference_ms']['p99']:.2f} -> {r['inference_ms']['p99']:.2f}ms")
+
+
+# ========================= Main =========================
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark headless (fontes sintéticas) de captura, mux e YOLO.")
+    ap.add_argument("--out", type=Path, help="arquivo JSON de saída (padrão: bench_results/)")
+    ap.add_argument("--seconds", type=float, default=BENCH_SECONDS)
+    ap.add_argument("--quick", action="store_true", help="só o menor tamanho, 30 fps, 1º modo")
+    ap.add_argument("--yolo", action="store_true", help="inclui o cenário de inferência YOLO")
+    ap.add_argument("--compare", nargs=2, type=Path, metavar=("ANTIGO", "NOVO"))
+    ap.add_argument("--verbose", action="store_true", help="mostra a saída dos gravadores")
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    ffmpeg = cv.shutil.which("ffmpeg")
+    if not ffmpeg:
+        print("Aviso: FFmpeg não encontrado; medindo só o caminho mp4v (sem mux).")
+    sizes = BENCH_SIZES[:1] if args.quick else BENCH_SIZES
+    fps_list = BENCH_FPS[:1] if args.quick else BENCH_FPS
+    modes = (BENCH_MODES[:1] if args.quick else BENCH_MODES) if ffmpeg else ["mp4v"]
+
+    meta = dict(commit=git_commit(), date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                platform=platform.platform(), python=platform.python_version(),
+                cpu_count=os.cpu_count(), ffmpeg=cv.ffmpeg_id(ffmpeg) if ffmpeg else None,
+                nvenc=cv.pick_nvenc() if ffmpeg else False,
+                seconds=args.seconds, grab_ms=BENCH_GRAB_MS, seed=BENCH_SEED)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="captura_bench_") as tmp:
+        for (w, h) in sizes:
+            for fps in fps_list:
+                for mode in modes:
+                    r = bench_record(w, h, fps, mode, args.seconds, ffmpeg, Path(tmp),
+                                     quiet=not args.verbose)
+                    results.append(r)
+                    post = f"{r['post_sec']:.2f}s" if r["post_sec"] is not None else "-"
+                    print(f"{w}x{h} @{fps} {r['mode']}: {r['effective_fps']:.1f} fps"
+                          f" | p99 {r['frame_interval_ms']['p99'] or 0:.2f}ms"
+                          f" | CPU {r['cpu_ms_per_frame']:.2f}ms/frame"
+                          f" (+{r['encoder_cpu_ms_per_frame']:.2f} FFmpeg)"
+                          f" | overruns {r['audio_overruns']} | mux {post}")
+            for backend in (BENCH_YOLO_BACKENDS if args.yolo else []):
+                r = bench_yolo(w, h, backend)
+                if r is not None:
+                    results.append(r)
+                    print(f"YOLO {w}x{h} {r['backend']} ({r['device']}): {r['fps']:.1f} fps"
+                          f" | inferência p99 {r['inference_ms']['p99']:.2f}ms")
+
+    out = args.out or BENCH_DIR / f"bench_{meta['commit']}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(dict(meta=meta, results=results), indent=2))
+    print(f"\nResultados em: {out}")
+
+if __name__ == "__main__":
+    main()
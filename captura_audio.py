@@ -1,10 +1,13 @@
-import os, time, wave, shutil, subprocess, threading
+import os, json, mmap, time, queue, asyncio, struct, shutil, subprocess, threading
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
 
 import numpy as np
 import soundcard as sc
 
+from metrics import METRICS, MetricsReporter
+
 # ========================= CONFIG =========================
 OUTPUT_DIR = r"C:\Users\alber\OneDrive\Documentos\CEIA\Meta Glass\Captura\Output-capturas\audios"
 
@@ -12,10 +15,58 @@ AUDIO_SAMPLERATE = 48000
 AUDIO_BITRATE = "320k"   # alvo do AAC (m4a) via FFmpeg
 KEEP_TEMP = False        # manter WAV temporário para debug
 
+# Encode AAC em streaming: o PCM vai direto para um FFmpeg persistente que grava
+# M4A fragmentado (reproduzível mesmo se o processo cair). Sem FFmpeg -> WAV.
+STREAM_AAC = True
+
+# WAV (sem streaming AAC / temporário do captura_video): escrito via memory map em
+# extents pré-alocados; vira RF64 automaticamente acima de 4 GB e o cabeçalho é
+# atualizado a cada WAV_COMMIT_SEC, então o arquivo é válido mesmo se o processo cair
+WAV_EXTENT_MB = 64
+WAV_COMMIT_SEC = 1.0
+
+# Captura x escrita: blocos de AUDIO_BLOCK amostras num anel de AUDIO_RING_BLOCKS
+# buffers (~5 s a 48 kHz); a escrita em disco é feita em lotes de AUDIO_WRITE_BATCH blocos
+AUDIO_BLOCK = 1024
+AUDIO_RING_BLOCKS = 256
+AUDIO_WRITE_BATCH = 32
+
+# Microfones extras gravados junto com o loopback (ex.: a própria voz numa chamada).
+# Nomes (ou trechos do nome) dos dispositivos; "default" = microfone padrão.
+EXTRA_MICS = []
+EXTRA_MIC_GAIN = 1.0
+MIX_MODE = "mix"           # "mix": soma no loopback | "tracks": um canal extra por microfone (WAV/M4A)
+SOURCE_BUFFER_SEC = 4.0    # anel por microfone (memória limitada)
+
+# Janelas de PCM para consumo ao vivo (ex.: ASR) via PcmWindowStream:
+# mono float32 reamostrado, janelas com sobreposição e gate de energia (VAD)
+STREAM_RATE = 16000
+STREAM_WINDOW_SEC = 1.0
+STREAM_HOP_SEC = 0.5
+VAD_THRESHOLD_DB = -45.0   # janelas abaixo disso (dBFS RMS) são descartadas
+VAD_HANGOVER = 1           # janelas mantidas após o fim da fala
+
+# Features log-mel calculadas ao vivo (LogMelTap) e gravadas em chunks .npy ao lado
+# da gravação (pasta <saída>_logmel/)
+LOGMEL_FEATURES = False
+LOGMEL_N_FFT = 1024
+LOGMEL_HOP = 480           # 10 ms a 48 kHz
+LOGMEL_N_MELS = 80
+LOGMEL_FMIN = 0.0
+LOGMEL_FMAX = None         # None = Nyquist
+LOGMEL_CHUNK_FRAMES = 1000 # frames por arquivo de chunk
+
+# Métricas (metrics.py): com METRICS_JSONL, snapshot por segundo em
+# <saída>_metrics.jsonl; com METRICS_PORT > 0, http://127.0.0.1:<porta>/metrics (Prometheus)
+METRICS_JSONL = False
+METRICS_PORT = 0
+
 # ========================= Utils =========================
-def to_pcm16(x: np.ndarray) -> np.ndarray:
-    x = np.clip(x, -1.0, 1.0)
-    return (x * 32767.0).astype(np.int16)
+# FFmpeg em outro grupo de processos (Windows) / sessão (POSIX): o CTRL+C que
+# para a gravação chega só ao Python, que fecha o stdin e deixa o FFmpeg
+# finalizar o M4A.
+FFMPEG_POPEN_KW = (dict(creationflags=subprocess.CREATE_NEW_PROCESS_GROUP) if os.name == "nt"
+                   else dict(start_new_session=True))
 
 def find_ffmpeg() -> Optional[str]:
     ffmpeg = shutil.which("ffmpeg")
@@ -40,46 +91,549 @@ def verify_audio(ffprobe: Optional[str], path: Path) -> bool:
         print(f"Aviso: verificação de áudio falhou: {e}")
         return True
 
+# ========================= WAV / RF64 (memory map) =========================
+class MmapWavWriter:
+    """Writer de WAV PCM via memory map, com RF64 automático e cabeçalho incremental.
+
+    O arquivo cresce em extents de `extent_mb` (um mmap por extent), então cada
+    `writeframes` é só uma cópia de memória. O cabeçalho tem tamanho fixo (80
+    bytes): RIFF + JUNK enquanto couber em 4 GB, RF64 + ds64 (EBU Tech 3306)
+    depois. Ele é regravado a cada `commit_sec` de áudio; um processo morto
+    deixa um arquivo válido até o último commit (o resto do extent é ignorado).
+    Mesma interface usada do `wave` (writeframes/close).
+    """
+    HEADER_SIZE = 80
+    RF64_THRESHOLD = 0xFFFFFFFF  # tamanho RIFF máximo antes de virar RF64 (menor nos testes)
+
+    def __init__(self, path: Path, samplerate: int, channels: int, sampwidth: int = 2,
+                 extent_mb: int = WAV_EXTENT_MB, commit_sec: float = WAV_COMMIT_SEC):
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.block_align = channels * sampwidth
+        gran = mmap.ALLOCATIONGRANULARITY
+        self._extent = max(gran, (extent_mb * 1024 * 1024) // gran * gran)
+        self._commit_bytes = max(1, int(commit_sec * samplerate)) * self.block_align
+        self._since_commit = 0
+        self._data_bytes = 0
+        self._pos = self.HEADER_SIZE
+        self._file_size = 0
+        self._map = None
+        self._map_off = 0
+        self._f = open(path, "w+b")
+        self._map_extent(0)
+        self._commit()
+
+    def _map_extent(self, off: int):
+        if self._map is not None:
+            self._map.close()
+        end = off + self._extent
+        if self._file_size < end:
+            self._f.truncate(end)
+            self._file_size = end
+        self._map = mmap.mmap(self._f.fileno(), self._extent, offset=off, access=mmap.ACCESS_WRITE)
+        self._map_off = off
+
+    def _header(self) -> bytes:
+        data = self._data_bytes
+        riff = self.HEADER_SIZE - 8 + data
+        rf64 = riff > self.RF64_THRESHOLD
+        if rf64:
+            head = (b"RF64" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+                    + b"ds64" + struct.pack("<IQQQI", 28, riff, data, data // self.block_align, 0))
+        else:
+            head = b"RIFF" + struct.pack("<I", riff) + b"WAVE" + b"JUNK" + struct.pack("<I", 28) + bytes(28)
+        head += b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.samplerate,
+                                      self.samplerate * self.block_align, self.block_align,
+                                      8 * self.sampwidth)
+        head += b"data" + struct.pack("<I", 0xFFFFFFFF if rf64 else data)
+        return head
+
+    def _commit(self):
+        self._map.flush()
+        self._f.seek(0)
+        self._f.write(self._header())
+        self._f.flush()
+        self._since_commit = 0
+
+    def writeframes(self, pcm: np.ndarray):
+        buf = memoryview(np.ascontiguousarray(pcm)).cast("B")
+        n = len(buf)
+        i = 0
+        while i < n:
+            rel = self._pos - self._map_off
+            room = self._extent - rel
+            if room == 0:
+                self._map_extent(self._map_off + self._extent)
+                continue
+            k = min(room, n - i)
+            self._map[rel:rel + k] = buf[i:i + k]
+            i += k
+            self._pos += k
+        self._data_bytes += n
+        self._since_commit += n
+        if self._since_commit >= self._commit_bytes:
+            self._commit()
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._commit()
+        self._map.close()
+        self._map = None
+        self._f.truncate(self._pos)
+        self._f.close()
+
+
+# ========================= Encoder AAC (FFmpeg, streaming) =========================
+class FFmpegAacWriter:
+    """Recebe PCM16 intercalado e o envia para um FFmpeg persistente (AAC em M4A).
+
+    Mesma interface usada do `wave` (writeframes/close). O M4A é fragmentado
+    (~1 s por fragmento), então a parte já gravada é reproduzível a qualquer momento.
+    """
+    def __init__(self, ffmpeg: str, out_path: Path, samplerate: int, channels: int,
+                 bitrate: str = AUDIO_BITRATE):
+        self.out_path = out_path
+        self._log = deque(maxlen=50)
+        cmd = [
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-nostats",
+            "-f", "s16le", "-ar", str(samplerate), "-ac", str(channels),
+            "-i", "-",
+            "-c:a", "aac",
+            "-b:a", bitrate,
+            "-ar", str(samplerate),
+            "-ac", str(channels),  # MIX_MODE="tracks": um canal por microfone, sem downmix
+            "-movflags", "+empty_moov+default_base_moof",
+            "-frag_duration", "1000000",
+            str(out_path)
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                     **FFMPEG_POPEN_KW)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        for line in iter(self.proc.stderr.readline, b""):
+            self._log.append(line.decode(errors="replace").rstrip())
+
+    def _error(self) -> RuntimeError:
+        return RuntimeError(f"FFmpeg (AAC) falhou ({self.proc.returncode}). Saída:\n"
+                            + "\n".join(self._log))
+
+    def writeframes(self, pcm: np.ndarray):
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(pcm).data)
+        except (BrokenPipeError, OSError):
+            self.proc.wait()
+            raise self._error()
+
+    def close(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        self.proc.wait()
+        self._stderr_thread.join(timeout=1.0)
+        if self.proc.returncode != 0:
+            raise self._error()
+
+
+class NullAudioWriter:
+    """Writer que descarta o PCM (AudioRecorder sem arquivo, só com taps)."""
+    def writeframes(self, pcm: np.ndarray):
+        pass
+
+    def close(self):
+        pass
+
+
+# ========================= Fontes extras (microfones) =========================
+class AudioSource:
+    """Captura um dispositivo extra (ex.: microfone) em thread própria, para mixagem.
+
+    Os blocos (mono float32) vão para um anel de `SOURCE_BUFFER_SEC` com a
+    contagem de amostras e o instante de chegada. `read` entrega as amostras
+    que correspondem a um bloco do loopback pelo relógio de captura
+    (perf_counter), reamostradas por interpolação linear com razão ajustada
+    continuamente (controle proporcional sobre o erro de alinhamento), o que
+    compensa a diferença de clock entre os dois dispositivos. `read` nunca
+    espera: o trecho que o microfone ainda não entregou sai como silêncio.
+    """
+    MAX_CORRECTION = 0.005     # ajuste máximo da razão (0,5%)
+    RESYNC_SEC = 0.1           # erro acima disso => realinha direto
+
+    def __init__(self, device, samplerate: int = AUDIO_SAMPLERATE, gain: float = EXTRA_MIC_GAIN,
+                 buffer_sec: float = SOURCE_BUFFER_SEC):
+        self.device = device
+        self.name = getattr(device, "name", str(device))
+        self.samplerate = samplerate
+        self.gain = gain
+        self._cap = int(buffer_sec * samplerate)
+        self._buf = np.zeros(self._cap, dtype=np.float32)
+        self._lock = threading.Condition()
+        self._written = 0          # amostras recebidas
+        self._last_ts = None       # chegada do último bloco
+        self._read_pos = None      # posição (fracionária) de leitura
+        self._ratio = 1.0
+        self._err_ema = 0.0
+        self.is_recording = False
+        self.dead = False          # thread de captura terminou (ex.: microfone falhou)
+        self.error = None
+        self.thread = None
+        self.overruns = 0          # amostras sobrescritas antes de lidas
+        self.underruns = 0         # blocos completados com silêncio (microfone atrasado)
+        self.resyncs = 0
+
+    def _loop(self):
+        try:
+            with self.device.recorder(samplerate=self.samplerate, blocksize=AUDIO_BLOCK) as mic:
+                while self.is_recording:
+                    data = mic.record(numframes=AUDIO_BLOCK)
+                    ts = time.perf_counter()
+                    mono = data if data.ndim == 1 else data.mean(axis=1, dtype=np.float32)
+                    n = len(mono)
+                    with self._lock:
+                        i = self._written % self._cap
+                        k = min(n, self._cap - i)
+                        self._buf[i:i + k] = mono[:k]
+                        self._buf[:n - k] = mono[k:]
+                        self._written += n
+                        self._last_ts = ts
+                        self._lock.notify_all()
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Áudio] ERRO no microfone '{self.name}': {e} (segue com silêncio)")
+        finally:
+            with self._lock:
+                self.dead = True
+                self._lock.notify_all()
+
+    def read(self, n: int, ts_end: float, out: np.ndarray):
+        """Preenche `out[:n]` com as amostras alinhadas ao bloco que termina em `ts_end`."""
+        with self._lock:
+            if self._last_ts is None or self.dead:
+                out[:n] = 0.0  # sem microfone: silêncio, sem esperar (não atrasa o loopback)
+                return
+            # O bloco do loopback pode estar à frente do que o microfone já entregou;
+            # não espera (bloquearia a thread de escrita): o que falta vira silêncio
+            written, last_ts = self._written, self._last_ts
+            target_end = written - (last_ts - ts_end) * self.samplerate
+            if self._read_pos is None or abs(target_end - (self._read_pos + n * self._ratio)) \
+                    > self.RESYNC_SEC * self.samplerate:
+                if self._read_pos is not None:
+                    self.resyncs += 1
+                self._read_pos = target_end - n
+                self._ratio = 1.0
+                self._err_ema = 0.0
+            err = target_end - (self._read_pos + n * self._ratio)
+            self._err_ema += 0.01 * (err - self._err_ema)
+            corr = np.clip(self._err_ema / (n * 100.0), -self.MAX_CORRECTION, self.MAX_CORRECTION)
+            self._ratio = 1.0 + corr
+
+            pos = self._read_pos + np.arange(n, dtype=np.float64) * self._ratio
+            oldest = written - self._cap
+            late = pos > written - 1
+            lost = pos < oldest
+            if late.any():
+                self.underruns += 1
+            self.overruns += int(lost.sum())
+            np.clip(pos, max(oldest, 0), max(written - 1, 0), out=pos)
+            i0 = pos.astype(np.int64)
+            frac = (pos - i0).astype(np.float32)
+            i1 = np.minimum(i0 + 1, max(written - 1, 0))
+            a = self._buf[i0 % self._cap]
+            b = self._buf[i1 % self._cap]
+            np.multiply(b - a, frac, out=out[:n])
+            out[:n] += a
+            if self.gain != 1.0:
+                out[:n] *= self.gain
+            out[:n][late] = 0.0
+            self._read_pos += n * self._ratio
+
+    def start(self):
+        self.is_recording = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_recording = False
+        with self._lock:
+            self._lock.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def summary(self) -> str:
+        return (f"Mic '{self.name}': correção {(self._ratio - 1.0) * 1e6:+.0f} ppm"
+                f" | underruns {self.underruns} | overruns {self.overruns} | realinhamentos {self.resyncs}"
+                + (f" | FALHOU: {self.error}" if self.error else ""))
+
+
 # ========================= Áudio (loopback) =========================
 class AudioRecorder:
-    def __init__(self, wav_path: Path, device, samplerate=AUDIO_SAMPLERATE):
+    """Grava o loopback em WAV PCM16 com captura e escrita em threads separadas.
+
+    A thread de captura só lê blocos do dispositivo e os copia para um anel de
+    buffers float32 pré-alocados; a thread de escrita converte para PCM16 no
+    próprio buffer (`np.clip(..., out=)`) e grava em lotes grandes no
+    MmapWavWriter (WAV/RF64). Se o anel
+    encher (disco lento), o bloco é descartado, contado como overrun e
+    substituído por silêncio, mantendo a contagem de amostras (e o sync).
+
+    Opcional: `ffmpeg` (grava AAC/M4A em streaming via FFmpegAacWriter em vez
+    de WAV; `wav_path` passa a ser o .m4a de saída), `segment_sec` (um arquivo
+    por segmento, cortes alinhados com `set_segment_origin`), `sync_log`
+    (instante de chegada de cada bloco), taps (`add_tap`), que recebem cada
+    bloco float32 na thread de escrita, antes da conversão, e `sources`
+    (AudioSource, ex.: microfones), alinhadas ao loopback e somadas a ele
+    (`mix_mode="mix"`) ou gravadas como canais extras (`"tracks"`) na thread de
+    escrita, com memória limitada. Com `wav_path=None` nada vai para disco e o
+    áudio só chega aos taps (ex.: PcmRingTap no modo replay).
+    """
+    def __init__(self, wav_path: Optional[Path], device, samplerate=AUDIO_SAMPLERATE,
+                 segment_sec: float = 0, sync_log=None,
+                 ring_blocks: int = AUDIO_RING_BLOCKS, write_batch: int = AUDIO_WRITE_BATCH,
+                 ffmpeg: Optional[str] = None, bitrate: str = AUDIO_BITRATE,
+                 sources=None, mix_mode: str = MIX_MODE):
         self.wav_path = wav_path
+        self.sources = list(sources or [])
+        self.mix_mode = mix_mode
+        self.ffmpeg = ffmpeg
+        self.bitrate = bitrate
         self.device = device  # objeto soundcard Microphone (loopback)
         self.samplerate = samplerate
         self.is_recording = False
         self.thread = None
-        self.start_ts = None  
+        self.start_ts = None  # perf_counter do 1º chunk
+        self.sync_log = sync_log
+        self.ring_blocks = ring_blocks
+        self.write_batch = write_batch
+        # Modo segmentado: um WAV por segmento, cortes alinhados ao início do vídeo
+        self.segment_frames = int(round(segment_sec * samplerate)) if segment_sec > 0 else 0
+        self.segments = []       # WAVs gerados, em ordem
+        self.segment_starts = [] # amostra inicial de cada WAV
+        self._origin_ts = None   # perf_counter do 1º frame de vídeo
+        self._next_cut = None    # amostra (desde o início do áudio) do próximo corte
+        # Anel captura -> escrita
+        self._ring = []
+        self._free = queue.Queue()
+        self._ready = queue.Queue()
+        self._writer = None
+        self._wf = None
+        self._taps = []
+        self._zeros = None
+        self._captured = 0       # amostras recebidas do dispositivo (inclui descartadas)
+        self._written = 0        # amostras gravadas (inclui silêncio de overruns)
+        # Contadores
+        self.overruns = 0
+        self.max_queue_depth = 0
+        self.writes = 0
+        self.write_time_total = 0.0
+        self.write_time_max = 0.0
+        self.h_write = METRICS.histogram("audio_write_seconds")
+
+    def add_tap(self, tap):
+        """Registra um consumidor ao vivo (ex.: PcmWindowStream), antes de `start`.
+
+        `tap.on_block(block, ts)` recebe cada bloco float32 (N, C) e o instante de
+        chegada; `tap.on_close()` é chamado no fim. Roda na thread de escrita e
+        não deve bloquear.
+        """
+        self._taps.append(tap)
+
+    def _feed_taps(self, block: np.ndarray, ts: float):
+        for tap in self._taps:
+            try:
+                tap.on_block(block, ts)
+            except Exception as e:
+                print(f"[Áudio] ERRO no consumidor {type(tap).__name__}: {e}")
+
+    def set_segment_origin(self, ts: float):
+        """Alinha os cortes dos segmentos ao 1º frame de vídeo (perf_counter)."""
+        self._origin_ts = ts
+
+    def _segment_path(self, i: int) -> Path:
+        return self.wav_path.with_name(f"{self.wav_path.stem}_a{i:03d}{self.wav_path.suffix}")
+
+    def _open_wav(self, channels: int, start: int = 0):
+        if self.wav_path is None:
+            return NullAudioWriter()
+        if self.segment_frames:
+            path = self._segment_path(len(self.segments))
+        else:
+            path = self.wav_path
+        if self.ffmpeg:
+            wf = FFmpegAacWriter(self.ffmpeg, path, self.samplerate, channels, self.bitrate)
+        else:
+            wf = MmapWavWriter(path, self.samplerate, channels)
+        self.segments.append(path)
+        self.segment_starts.append(start)
+        return wf
+
+    # ---------- captura ----------
+    def _push(self, data: np.ndarray, ts: float):
+        if data.ndim == 1:
+            data = data[:, None]
+        n = len(data)
+        self._captured += n
+        if self.sync_log is not None:
+            self.sync_log.audio_t.append(ts)
+            self.sync_log.audio_n.append(self._captured)
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            self.overruns += 1
+            self._ready.put((-1, n, ts))  # escrita preenche com silêncio
+            return
+        np.copyto(self._ring[slot][:n], data)
+        self._ready.put((slot, n, ts))
+        self.max_queue_depth = max(self.max_queue_depth, self._ready.qsize())
 
     def _loop(self):
         try:
-            block = 1024
-            with self.device.recorder(samplerate=self.samplerate, blocksize=block) as mic, \
-                 wave.open(str(self.wav_path), 'wb') as wf:
-
-                first = mic.record(numframes=block)
-                if first.ndim == 1:
-                    channels = 1
-                    first = first[:, None]
-                else:
-                    channels = first.shape[1]
+            with self.device.recorder(samplerate=self.samplerate, blocksize=AUDIO_BLOCK) as mic:
+                first = mic.record(numframes=AUDIO_BLOCK)
+                channels = 1 if first.ndim == 1 else first.shape[1]
 
-                wf.setnchannels(channels)
-                wf.setsampwidth(2)  # PCM16
-                wf.setframerate(self.samplerate)
+                self._ring = [np.empty((AUDIO_BLOCK, channels), dtype=np.float32)
+                              for _ in range(self.ring_blocks)]
+                for i in range(self.ring_blocks):
+                    self._free.put(i)
+                self._writer = threading.Thread(target=self._writer_loop, args=(channels,),
+                                                daemon=True)
+                self._writer.start()
 
-                wf.writeframes(to_pcm16(first).tobytes())
                 if self.start_ts is None:
                     self.start_ts = time.perf_counter()
+                self._push(first, self.start_ts)
 
                 while self.is_recording:
-                    data = mic.record(numframes=block)
-                    if data.ndim == 1:
-                        data = data[:, None]
-                    wf.writeframes(to_pcm16(data).tobytes())
+                    data = mic.record(numframes=AUDIO_BLOCK)
+                    self._push(data, time.perf_counter())
         except Exception as e:
             print(f"[Áudio] ERRO: {e}")
+        finally:
+            if self._writer is not None:
+                self._ready.put(None)
+                self._writer.join()
+
+    # ---------- escrita ----------
+    def _write_pcm(self, pcm: np.ndarray):
+        t0 = time.perf_counter()
+        if self.segment_frames:
+            if self._next_cut is None and self._origin_ts is not None:
+                lead = max(0, int(round((self._origin_ts - self.start_ts) * self.samplerate)))
+                self._next_cut = lead + self.segment_frames
+            while self._next_cut is not None and self._written + len(pcm) > self._next_cut:
+                k = max(0, self._next_cut - self._written)
+                self._wf.writeframes(pcm[:k])
+                self._written += k
+                pcm = pcm[k:]
+                self._wf.close()
+                self._wf = self._open_wav(pcm.shape[1], start=self._written)
+                self._next_cut += self.segment_frames
+        self._wf.writeframes(pcm)
+        self._written += len(pcm)
+        dt = time.perf_counter() - t0
+        self.h_write.observe(dt)
+        self.writes += 1
+        self.write_time_total += dt
+        self.write_time_max = max(self.write_time_max, dt)
+
+    def _mix_sources(self, buf: Optional[np.ndarray], n: int, ts: float,
+                     work: np.ndarray, src_buf: np.ndarray) -> np.ndarray:
+        """Monta em `work` o bloco final: loopback (ou silêncio) + fontes extras."""
+        pc = self._channels
+        out = work[:n]
+        if buf is None:
+            out[:, :pc] = 0.0
+        else:
+            out[:, :pc] = buf
+        for j, src in enumerate(self.sources):
+            src.read(n, ts, src_buf)
+            if self.mix_mode == "tracks":
+                out[:, pc + j] = src_buf[:n]
+            else:
+                out[:, :pc] += src_buf[:n, None]
+        return out
+
+    def _writer_loop(self, channels: int):
+        self._channels = channels
+        out_channels = channels + (len(self.sources) if self.mix_mode == "tracks" else 0)
+        batch = np.empty((AUDIO_BLOCK * self.write_batch, out_channels), dtype=np.int16)
+        self._zeros = np.zeros((AUDIO_BLOCK, channels), dtype=np.float32)
+        work = np.empty((AUDIO_BLOCK, out_channels), dtype=np.float32)
+        src_buf = np.empty(AUDIO_BLOCK, dtype=np.float32)
+        fill = 0
+        try:
+            self._wf = self._open_wav(out_channels)
+            while True:
+                item = self._ready.get()
+                if item is None:
+                    break
+                slot, n, ts = item
+                if fill + n > len(batch):
+                    self._write_pcm(batch[:fill])
+                    fill = 0
+                if self.sources:
+                    buf = self._ring[slot][:n] if slot >= 0 else None
+                    mixed = self._mix_sources(buf, n, ts, work, src_buf)
+                    if slot >= 0:
+                        self._free.put(slot)
+                    if self._taps:
+                        self._feed_taps(mixed, ts)
+                    np.clip(mixed, -1.0, 1.0, out=mixed)
+                    np.multiply(mixed, 32767.0, out=mixed)
+                    batch[fill:fill + n] = mixed
+                elif slot < 0:
+                    if self._taps:
+                        self._feed_taps(self._zeros[:n], ts)
+                    batch[fill:fill + n] = 0
+                else:
+                    buf = self._ring[slot][:n]
+                    if self._taps:
+                        self._feed_taps(buf, ts)
+                    np.clip(buf, -1.0, 1.0, out=buf)
+                    np.multiply(buf, 32767.0, out=buf)
+                    batch[fill:fill + n] = buf  # float32 -> int16 direto no lote
+                    self._free.put(slot)
+                fill += n
+                if fill == len(batch):
+                    self._write_pcm(batch)
+                    fill = 0
+            if fill:
+                self._write_pcm(batch[:fill])
+        except Exception as e:
+            print(f"[Áudio] ERRO na escrita: {e}")
+            # continua drenando o anel para não travar a captura
+            while True:
+                item = self._ready.get()
+                if item is None:
+                    break
+                if item[0] >= 0:
+                    self._free.put(item[0])
+        finally:
+            for tap in self._taps:
+                try:
+                    tap.on_close()
+                except Exception:
+                    pass
+            if self._wf is not None:
+                try:
+                    self._wf.close()
+                except Exception as e:
+                    print(f"[Áudio] ERRO ao fechar: {e}")
 
     def start(self):
+        METRICS.gauge("audio_overruns", lambda: self.overruns)
+        METRICS.gauge("audio_queue_depth", self._ready.qsize)
+        for j, src in enumerate(self.sources):
+            METRICS.gauge(f"mic{j}_overruns", lambda src=src: src.overruns)
+            METRICS.gauge(f"mic{j}_underruns", lambda src=src: src.underruns)
+            src.start()
         self.is_recording = True
         self.thread = threading.Thread(target=self._loop, daemon=True)
         self.thread.start()
@@ -88,6 +642,15 @@ class AudioRecorder:
         self.is_recording = False
         if self.thread:
             self.thread.join()
+        for src in self.sources:
+            src.stop()
+
+    def summary(self) -> str:
+        mean_ms = 1000.0 * self.write_time_total / max(self.writes, 1)
+        lines = [f"Áudio: overruns {self.overruns} | fila máx {self.max_queue_depth}/{self.ring_blocks}"
+                 f" | escrita: média {mean_ms:.1f}ms, máx {1000.0 * self.write_time_max:.1f}ms"]
+        lines += [src.summary() for src in self.sources]
+        return "\n".join(lines)
 
 def find_loopback_device():
     mics = sc.all_microphones(include_loopback=True)
@@ -107,6 +670,448 @@ def find_loopback_device():
             return m
     return None
 
+def find_microphones(names, samplerate: int = AUDIO_SAMPLERATE, gain: float = EXTRA_MIC_GAIN):
+    """Cria uma AudioSource por nome em `names` ("default" = microfone padrão)."""
+    sources = []
+    for name in names:
+        try:
+            mic = sc.default_microphone() if name == "default" else sc.get_microphone(name)
+        except Exception as e:
+            print(f"Aviso: microfone '{name}' não encontrado: {e}")
+            continue
+        print(f"Microfone encontrado: '{mic.name}'")
+        sources.append(AudioSource(mic, samplerate=samplerate, gain=gain))
+    return sources
+
+# ========================= Janelas de PCM (ASR ao vivo) =========================
+class StreamingResampler:
+    """Reamostragem em streaming de sinal mono: FIR passa-baixa + interpolação linear.
+
+    Carrega entre blocos o histórico do filtro e a fase da próxima amostra de
+    saída, então o resultado é contínuo independente do tamanho dos blocos.
+    """
+    def __init__(self, in_rate: int, out_rate: int, taps: int = 63):
+        self.step = in_rate / out_rate
+        if out_rate < in_rate:
+            fc = 0.45 * out_rate / in_rate  # corte (ciclos/amostra), abaixo do Nyquist de saída
+            n = np.arange(taps) - (taps - 1) / 2
+            h = 2 * fc * np.sinc(2 * fc * n) * np.hamming(taps)
+            self._h = (h / h.sum()).astype(np.float32)
+        else:
+            self._h = np.ones(1, dtype=np.float32)
+        self.delay = (len(self._h) - 1) / 2 / in_rate  # atraso de grupo do filtro (s)
+        self._hist = np.zeros(len(self._h) - 1, dtype=np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._pos = 0.0
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        buf = np.concatenate([self._hist, x])
+        y = np.convolve(buf, self._h, mode="valid").astype(np.float32, copy=False)
+        if len(self._hist):
+            self._hist = buf[-len(self._hist):]
+        z = np.concatenate([self._tail, y])
+        if len(z) < 2:
+            self._tail = z
+            return np.zeros(0, dtype=np.float32)
+        pos = np.arange(self._pos, len(z) - 1, self.step)
+        i = pos.astype(np.int64)
+        frac = (pos - i).astype(np.float32)
+        out = z[i] * (1.0 - frac) + z[i + 1] * frac
+        nxt = (pos[-1] + self.step) if len(pos) else self._pos
+        self._pos = nxt - (len(z) - 1)
+        self._tail = z[-1:]
+        return out
+
+
+class PcmWindow(NamedTuple):
+    samples: np.ndarray   # float32 mono, STREAM_RATE
+    t_start: float        # perf_counter da 1ª amostra da janela (mesmo relógio da gravação)
+    index: int            # nº da janela desde o início (inclui as descartadas pelo VAD)
+    rms_db: float         # energia RMS da janela (dBFS)
+
+
+class PcmWindowStream:
+    """Janelas de PCM ao vivo a partir de um AudioRecorder, para ASR com baixa latência.
+
+    Registra-se como tap do recorder: cada bloco é convertido para mono,
+    reamostrado para `rate` e fatiado em janelas de `window_sec` com passo
+    `hop_sec`. Janelas abaixo de `vad_threshold_db` (energia RMS) são
+    descartadas, exceto as `vad_hangover` seguintes a uma janela com fala.
+    Consumo por iteração síncrona (`for w in stream`) ou assíncrona
+    (`async for w in stream`); termina quando o recorder para. Se o consumidor
+    atrasar além de `max_pending` janelas, as novas são descartadas (contadas
+    em `dropped`) em vez de travar a gravação.
+    """
+    def __init__(self, recorder: "AudioRecorder", rate: int = STREAM_RATE,
+                 window_sec: float = STREAM_WINDOW_SEC, hop_sec: float = STREAM_HOP_SEC,
+                 vad_threshold_db: Optional[float] = VAD_THRESHOLD_DB,
+                 vad_hangover: int = VAD_HANGOVER, max_pending: int = 64):
+        self.rate = rate
+        self.window = int(round(window_sec * rate))
+        self.hop = max(1, int(round(hop_sec * rate)))
+        self.vad_threshold_db = vad_threshold_db
+        self.vad_hangover = vad_hangover
+        self._resampler = StreamingResampler(recorder.samplerate, rate)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pending_start = 0   # índice (saída) da 1ª amostra pendente
+        self._out_total = 0       # amostras de saída produzidas
+        self._t_last = None       # chegada do último bloco
+        self._hang = 0
+        self._index = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.emitted = 0
+        self.skipped = 0
+        self.dropped = 0
+        recorder.add_tap(self)
+
+    # ---------- lado do recorder (thread de escrita) ----------
+    def on_block(self, block: np.ndarray, ts: float):
+        mono = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32)
+        y = self._resampler.process(mono)
+        self._out_total += len(y)
+        self._t_last = ts
+        self._pending = np.concatenate([self._pending, y])
+        while len(self._pending) >= self.window:
+            self._emit(self._pending[:self.window].copy())
+            self._pending = self._pending[self.hop:]
+            self._pending_start += self.hop
+
+    def _emit(self, samples: np.ndarray):
+        idx = self._index
+        self._index += 1
+        rms_db = 20.0 * float(np.log10(np.sqrt(np.mean(samples * samples)) + 1e-12))
+        if self.vad_threshold_db is not None:
+            if rms_db >= self.vad_threshold_db:
+                self._hang = self.vad_hangover
+            elif self._hang > 0:
+                self._hang -= 1
+            else:
+                self.skipped += 1
+                return
+        t_start = (self._t_last - (self._out_total - self._pending_start) / self.rate
+                   - self._resampler.delay)
+        try:
+            self._queue.put_nowait(PcmWindow(samples, t_start, idx, rms_db))
+            self.emitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def on_close(self):
+        while True:
+            try:
+                self._queue.put(None, timeout=0.5)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()  # ninguém consumindo: libera espaço para o fim
+                except queue.Empty:
+                    pass
+
+    # ---------- lado do consumidor ----------
+    def __iter__(self):
+        while True:
+            w = self._queue.get()
+            if w is None:
+                return
+            yield w
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        w = await asyncio.get_running_loop().run_in_executor(None, self._queue.get)
+        if w is None:
+            raise StopAsyncIteration
+        return w
+
+
+# ========================= Features log-mel (ao vivo) =========================
+def mel_filterbank(samplerate: int, n_fft: int, n_mels: int, fmin: float = 0.0,
+                   fmax: Optional[float] = None) -> np.ndarray:
+    """Banco de filtros mel triangulares (escala HTK), shape (n_mels, n_fft//2 + 1)."""
+    fmax = samplerate / 2 if fmax is None else fmax
+    hz_to_mel = lambda f: 2595.0 * np.log10(1.0 + np.asarray(f) / 700.0)
+    mel_to_hz = lambda m: 700.0 * (10.0 ** (np.asarray(m) / 2595.0) - 1.0)
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    freqs = np.linspace(0.0, samplerate / 2, n_fft // 2 + 1)
+    lo, mid, hi = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    up = (freqs - lo) / np.maximum(mid - lo, 1e-9)
+    down = (hi - freqs) / np.maximum(hi - mid, 1e-9)
+    return np.maximum(0.0, np.minimum(up, down)).astype(np.float32)
+
+def _logmel_frames(frames: np.ndarray, window: np.ndarray, mel: np.ndarray) -> np.ndarray:
+    spec = np.fft.rfft(frames * window, axis=1)
+    power = (spec.real * spec.real + spec.imag * spec.imag).astype(np.float32)
+    return np.log(power @ mel.T + 1e-10)
+
+def logmel_batch(x: np.ndarray, samplerate: int, n_fft: int = LOGMEL_N_FFT,
+                 hop: int = LOGMEL_HOP, n_mels: int = LOGMEL_N_MELS,
+                 fmin: float = LOGMEL_FMIN, fmax: Optional[float] = LOGMEL_FMAX) -> np.ndarray:
+    """Referência em lote (sinal mono inteiro) para validar o LogMelTap; (frames, n_mels)."""
+    x = np.asarray(x, dtype=np.float32)
+    if len(x) < n_fft:
+        return np.zeros((0, n_mels), dtype=np.float32)
+    window = np.hanning(n_fft + 1)[:-1].astype(np.float32)  # Hann periódica
+    mel = mel_filterbank(samplerate, n_fft, n_mels, fmin, fmax)
+    frames = np.lib.stride_tricks.sliding_window_view(x, n_fft)[::hop]
+    return _logmel_frames(frames, window, mel)
+
+
+class LogMelTap:
+    """Calcula log-mel incrementalmente sobre o áudio do AudioRecorder (tap).
+
+    Mantém entre blocos as amostras que ainda não fecharam um frame (buffer
+    pré-alocado), calcula todos os frames completos de uma vez (FFT vetorizada,
+    janela e banco mel pré-calculados) e grava em `out_dir` como chunks
+    `chunk_00000.npy` (float32, LOGMEL_CHUNK_FRAMES x n_mels) + `meta.json`
+    (parâmetros, `t0` = perf_counter da amostra 0 e total de frames). O frame i
+    começa em t0 + i * hop / samplerate. O resultado é idêntico a
+    `logmel_batch` sobre o sinal mono completo.
+    """
+    def __init__(self, recorder: "AudioRecorder", out_dir: Path, n_fft: int = LOGMEL_N_FFT,
+                 hop: int = LOGMEL_HOP, n_mels: int = LOGMEL_N_MELS, fmin: float = LOGMEL_FMIN,
+                 fmax: Optional[float] = LOGMEL_FMAX, chunk_frames: int = LOGMEL_CHUNK_FRAMES):
+        self.samplerate = recorder.samplerate
+        self.out_dir = Path(out_dir)
+        self.n_fft = n_fft
+        self.hop = hop
+        self.n_mels = n_mels
+        self.fmin = fmin
+        self.fmax = fmax
+        self._window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        self._mel = mel_filterbank(self.samplerate, n_fft, n_mels, fmin, fmax)
+        self._buf = np.empty(n_fft + 4 * AUDIO_BLOCK, dtype=np.float32)
+        self._fill = 0
+        self._chunk = np.empty((chunk_frames, n_mels), dtype=np.float32)
+        self._chunk_fill = 0
+        self._chunks = 0
+        self.frames = 0
+        self.t0 = None
+        self.samples = 0
+        self.compute_time = 0.0
+        recorder.add_tap(self)
+
+    def _write_meta(self):
+        meta = dict(samplerate=self.samplerate, n_fft=self.n_fft, hop=self.hop,
+                    n_mels=self.n_mels, fmin=self.fmin, fmax=self.fmax, t0=self.t0,
+                    chunk_frames=len(self._chunk), chunks=self._chunks, frames=self.frames)
+        with open(self.out_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=1)
+
+    def _flush_chunk(self):
+        if self._chunk_fill:
+            np.save(self.out_dir / f"chunk_{self._chunks:05d}.npy", self._chunk[:self._chunk_fill])
+            self._chunks += 1
+            self._chunk_fill = 0
+
+    def on_block(self, block: np.ndarray, ts: float):
+        t = time.perf_counter()
+        n = len(block)
+        if self.t0 is None:
+            self.t0 = ts - n / self.samplerate
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            self._write_meta()
+        self.samples += n
+        if self._fill + n > len(self._buf):
+            self._buf = np.concatenate([self._buf[:self._fill], np.empty(n, dtype=np.float32)])
+        dst = self._buf[self._fill:self._fill + n]
+        if block.shape[1] == 1:
+            dst[:] = block[:, 0]
+        else:
+            np.mean(block, axis=1, dtype=np.float32, out=dst)
+        self._fill += n
+        if self._fill < self.n_fft:
+            self.compute_time += time.perf_counter() - t
+            return
+
+        k = 1 + (self._fill - self.n_fft) // self.hop
+        frames = np.lib.stride_tricks.sliding_window_view(self._buf[:self._fill], self.n_fft)[::self.hop][:k]
+        feats = _logmel_frames(frames, self._window, self._mel)
+        consumed = k * self.hop
+        rest = self._fill - consumed
+        self._buf[:rest] = self._buf[consumed:self._fill]
+        self._fill = rest
+
+        i = 0
+        while i < k:
+            m = min(k - i, len(self._chunk) - self._chunk_fill)
+            self._chunk[self._chunk_fill:self._chunk_fill + m] = feats[i:i + m]
+            self._chunk_fill += m
+            i += m
+            if self._chunk_fill == len(self._chunk):
+                self._flush_chunk()
+        self.frames += k
+        self.compute_time += time.perf_counter() - t
+
+    def on_close(self):
+        if self.t0 is None:
+            return
+        self._flush_chunk()
+        self._write_meta()
+
+    def summary(self) -> str:
+        audio_sec = self.samples / self.samplerate
+        rt = self.compute_time / max(audio_sec, 1e-9)
+        return f"Log-mel: {self.frames} frames | custo {100.0 * rt:.2f}% do tempo real"
+
+
+def load_logmel(out_dir: Path) -> np.ndarray:
+    """Lê os chunks gravados pelo LogMelTap como um único array (frames, n_mels)."""
+    out_dir = Path(out_dir)
+    parts = [np.load(p) for p in sorted(out_dir.glob("chunk_*.npy"))]
+    if not parts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.concatenate(parts)
+
+
+# ========================= Pré-roll de PCM (replay) =========================
+class PcmRingTap:
+    """Anel circular PCM16 com os últimos `seconds` de áudio do recorder (modo replay).
+
+    Registra-se como tap: cada bloco é convertido para int16 direto na posição
+    do anel, então a memória é fixa (`seconds * samplerate * canais * 2` bytes).
+    Mantém também o mapeamento amostra <-> perf_counter (origem suavizada a
+    partir do instante de chegada de cada bloco), para recortar o mesmo
+    intervalo de tempo do vídeo.
+    """
+    ALPHA = 0.01  # suavização da origem (jitter de chegada dos blocos)
+
+    def __init__(self, recorder: "AudioRecorder", seconds: float):
+        self.samplerate = recorder.samplerate
+        self.capacity = int(round(seconds * self.samplerate))
+        self.channels = 0
+        self._buf = None
+        self._scratch = np.empty((0, 0), dtype=np.float32)
+        self._total = 0        # amostras recebidas desde o início
+        self._origin = None    # perf_counter estimado da amostra 0
+        self._lock = threading.Lock()
+        recorder.add_tap(self)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._buf is None else self._buf.nbytes
+
+    def on_block(self, block: np.ndarray, ts: float):
+        n, ch = block.shape
+        if self._scratch.shape[0] < n or self._scratch.shape[1] != ch:
+            self._scratch = np.empty((max(n, AUDIO_BLOCK), ch), dtype=np.float32)
+        tmp = self._scratch[:n]
+        np.clip(block, -1.0, 1.0, out=tmp)
+        np.multiply(tmp, 32767.0, out=tmp)
+        with self._lock:
+            if self._buf is None:
+                self.channels = ch
+                self._buf = np.zeros((self.capacity, ch), dtype=np.int16)
+            pos = self._total % self.capacity
+            k = min(n, self.capacity - pos)
+            self._buf[pos:pos + k] = tmp[:k]
+            if k < n:
+                self._buf[:n - k] = tmp[k:]
+            self._total += n
+            origin = ts - self._total / self.samplerate
+            if self._origin is None:
+                self._origin = origin
+            else:
+                self._origin += self.ALPHA * (origin - self._origin)
+
+    def on_close(self):
+        pass
+
+    def time_to_sample(self, t: float) -> int:
+        """Índice (desde o início do áudio) da amostra capturada no instante `t`."""
+        with self._lock:
+            if self._origin is None:
+                return 0
+            return int(round((t - self._origin) * self.samplerate))
+
+    def read(self, start: int, n: int) -> np.ndarray:
+        """Copia `n` amostras a partir de `start`; o que já saiu do anel (ou ainda
+        não chegou) vira silêncio."""
+        with self._lock:
+            out = np.zeros((n, max(self.channels, 1)), dtype=np.int16)
+            if self._buf is None:
+                return out
+            lo = max(start, self._total - self.capacity, 0)
+            hi = min(start + n, self._total)
+            i = lo
+            while i < hi:
+                pos = i % self.capacity
+                k = min(hi - i, self.capacity - pos)
+                out[i - start:i - start + k] = self._buf[pos:pos + k]
+                i += k
+            return out
+
+
+# ========================= Sessões sobre um recorder contínuo (daemon) =========================
+class WavSessionTap:
+    """Grava em WAV só os blocos entre `begin` e `end`, com o recorder sempre aberto.
+
+    Permite manter o loopback capturando entre sessões (sem reabrir o
+    dispositivo a cada gravação): cada sessão abre o próprio MmapWavWriter e,
+    com `sync_log`, registra chegada e nº de amostras de cada bloco como o
+    AudioRecorder faz, então `estimate_sync` funciona igual. `start_ts` é o
+    instante do 1º bloco da sessão.
+    """
+    def __init__(self, recorder: "AudioRecorder"):
+        self.samplerate = recorder.samplerate
+        self._wf = None
+        self._sync_log = None
+        self._scratch = np.empty((0, 0), dtype=np.int16)
+        self._work = np.empty((0, 0), dtype=np.float32)
+        self._n = 0
+        self.start_ts = None
+        self.path = None
+        self._lock = threading.Lock()
+        recorder.add_tap(self)
+
+    @property
+    def active(self) -> bool:
+        return self._wf is not None
+
+    def begin(self, path: Path, sync_log=None):
+        with self._lock:
+            if self._wf is not None:
+                raise RuntimeError("sessão de áudio já ativa")
+            self.path = path
+            self._sync_log = sync_log
+            self._n = 0
+            self.start_ts = None
+            self._wf = False  # abre no 1º bloco (nº de canais vem do dispositivo)
+
+    def end(self) -> Optional[Path]:
+        with self._lock:
+            wf, self._wf = self._wf, None
+            self._sync_log = None
+        if wf:
+            wf.close()
+        return self.path if wf else None
+
+    def on_block(self, block: np.ndarray, ts: float):
+        with self._lock:
+            if self._wf is None:
+                return
+            n, ch = block.shape
+            if self._wf is False:
+                self._wf = MmapWavWriter(self.path, self.samplerate, ch)
+                self.start_ts = ts
+            if self._work.shape[0] < n or self._work.shape[1] != ch:
+                self._work = np.empty((max(n, AUDIO_BLOCK), ch), dtype=np.float32)
+                self._scratch = np.empty((max(n, AUDIO_BLOCK), ch), dtype=np.int16)
+            tmp = self._work[:n]
+            np.clip(block, -1.0, 1.0, out=tmp)
+            np.multiply(tmp, 32767.0, out=tmp)
+            pcm = self._scratch[:n]
+            pcm[:] = tmp
+            self._wf.writeframes(pcm)
+            self._n += n
+            if self._sync_log is not None:
+                self._sync_log.audio_t.append(ts)
+                self._sync_log.audio_n.append(self._n)
+
+    def on_close(self):
+        self.end()
+
+
 # ========================= Transcodificação (FFmpeg) =========================
 def transcode_to_m4a(ffmpeg: Optional[str], wav_path: Path, out_m4a: Path,
                      audio_rate: int, audio_bitrate: str) -> bool:
@@ -145,12 +1150,22 @@ def main():
     base = f"audio_{ts}"
     tmp_wav = outdir / f"temp_{base}.wav"
     out_m4a = outdir / f"{base}.m4a"
+    streaming = bool(ffmpeg and STREAM_AAC)
 
-    print(f"Config: Sample Rate: {AUDIO_SAMPLERATE} | Bitrate: {AUDIO_BITRATE}")
+    print(f"Config: Sample Rate: {AUDIO_SAMPLERATE} | Bitrate: {AUDIO_BITRATE}"
+          f" | Streaming AAC: {'on' if streaming else 'off'}")
     print(f"Saída: {out_m4a if ffmpeg else tmp_wav}")
 
     # Inicia áudio
-    rec = AudioRecorder(tmp_wav, loopback, samplerate=AUDIO_SAMPLERATE)
+    mics = find_microphones(EXTRA_MICS, samplerate=AUDIO_SAMPLERATE)
+    if streaming:
+        rec = AudioRecorder(out_m4a, loopback, samplerate=AUDIO_SAMPLERATE,
+                            ffmpeg=ffmpeg, bitrate=AUDIO_BITRATE, sources=mics)
+    else:
+        rec = AudioRecorder(tmp_wav, loopback, samplerate=AUDIO_SAMPLERATE, sources=mics)
+    logmel = LogMelTap(rec, outdir / f"{base}_logmel") if LOGMEL_FEATURES else None
+    reporter = MetricsReporter(path=outdir / f"{base}_metrics.jsonl" if METRICS_JSONL else None,
+                               port=METRICS_PORT)
     print("\n>>> GRAVANDO ÁUDIO (CTRL+C para parar) ...")
     rec.start()
 
@@ -162,11 +1177,24 @@ def main():
 
     # Finaliza
     rec.stop()
+    reporter.close()
     dur = 0.0
     if rec.start_ts:
         dur = max(time.perf_counter() - rec.start_ts, 0.0)
     print(f"\nGravação finalizada! ✅")
     print(f"Duração: {dur:.2f}s")
+    print(rec.summary())
+    if logmel is not None:
+        print(logmel.summary())
+        print(f"Features log-mel em: {logmel.out_dir}")
+
+    if streaming:
+        if not out_m4a.exists() or out_m4a.stat().st_size == 0:
+            print(f"ERRO: M4A vazio: {out_m4a}")
+            return
+        verify_audio(ffprobe, out_m4a)
+        print(f"\nÁudio salvo em: {out_m4a}")
+        return
 
     # Sanidade
     if not tmp_wav.exists() or tmp_wav.stat().st_size == 0:
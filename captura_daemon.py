@@ -0,0 +1,447 @@
+import json, math, time, queue, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import mss
+
+# Captura/encoder de vídeo e áudio reaproveitados dos scripts de gravação
+from captura_video import (FFmpegVideoWriter, SyncLog, record_video, estimate_sync,
+                           save_session_info, mux_ffmpeg, verify_audio, find_ffmpeg,
+                           find_ffprobe, pick_nvenc, quality_profile, auto_quality_profile)
+from captura_audio import AudioRecorder, WavSessionTap, find_loopback_device, find_microphones
+from captura_hub import HubSubscriber
+from metrics import METRICS, MetricsReporter
+from roi_grab import RoiGrabber, parse_regions
+
+# ========================= CONFIG =========================
+OUTPUT_DIR = r"C:\Users\alber\OneDrive\Documentos\CEIA\Meta Glass\Captura\Output-capturas\videos"
+
+# Região da tela (usar o código window_region_setup.py para definir a região)
+MONITOR_REGION = {'left': 469, 'top': 123, 'width': 511, 'height': 889}
+MONITOR_REGIONS = []  # várias ROIs (um MP4 por ROI); vazio = só MONITOR_REGION
+CAPTURE_HUB = None    # nome de um captura_hub.py rodando; None = grab próprio
+
+FPS = 30
+QUALITY_MODE = "insane"  # "fast" | "high" | "insane" | "lossless" | "auto"
+
+# Áudio
+AUDIO_SAMPLERATE = 48000
+AUDIO_BITRATE = "320k"  # AAC
+EXTRA_MICS = []  # microfones somados ao loopback
+EXTRA_MIC_GAIN = 1.0
+
+# API de controle (só local): GET /status, POST /start[?duration=s], POST /stop
+# Pedidos com Origin (vindos de página web) ou Host fora do loopback são recusados.
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+DAEMON_MAX_QUEUE = 4  # sessões na fila além da que está gravando (excedente -> 429)
+METRICS_PORT = 0  # > 0 expõe /metrics (Prometheus) numa porta própria
+
+# Manter arquivos temporários (para debug)
+KEEP_TEMP = False
+
+# ========================= Sessões =========================
+class Session:
+    """Uma gravação pedida pela API: estado, tempos e arquivos de saída."""
+    def __init__(self, sid: int, duration: Optional[float]):
+        self.id = sid
+        self.duration = duration
+        self.state = "queued"  # queued -> recording -> finishing -> done | error
+        self.stop = threading.Event()
+        self.t_requested = time.perf_counter()
+        self.t_started = None  # saiu da fila (= pedido, se nada estava gravando)
+        self.t_first_frame = None
+        self.t_stopped = None
+        self.outputs = []
+        self.error = None
+
+    def info(self) -> dict:
+        latency = None
+        if self.t_first_frame is not None:
+            latency = 1000.0 * (self.t_first_frame - self.t_started)
+        elapsed = None
+        if self.t_first_frame is not None:
+            elapsed = (self.t_stopped or time.perf_counter()) - self.t_first_frame
+        return dict(id=self.id, state=self.state, duration=self.duration,
+                    start_to_first_frame_ms=latency, seconds=elapsed,
+                    outputs=[str(p) for p in self.outputs], error=self.error)
+
+
+class CaptureDaemon:
+    """Mantém tudo pronto entre gravações e grava sessões uma atrás da outra.
+
+    Aquecido uma vez no início: FFmpeg/NVENC/perfil de qualidade, dispositivo de
+    loopback (AudioRecorder sempre capturando, sem arquivo; cada sessão só liga
+    um WavSessionTap), grabber (mss criado na thread de gravação, ou assinante
+    do hub) e um encoder FFmpeg ocioso por ROI, já com o processo aberto
+    esperando frames. Iniciar uma sessão é só ligar o tap e entrar no loop de
+    captura; o próximo encoder ocioso sobe em paralelo e o mux roda numa thread
+    própria, então sessões seguidas não esperam o pós-processamento.
+    """
+    def __init__(self, outdir: Path):
+        self.outdir = outdir
+        t0 = time.perf_counter()
+        self.ffmpeg = find_ffmpeg()
+        self.ffprobe = find_ffprobe()
+        print("Procurando dispositivos de áudio...")
+        loopback = find_loopback_device()
+        if not loopback:
+            raise RuntimeError("nenhum dispositivo de loopback encontrado")
+        self.source = HubSubscriber(CAPTURE_HUB) if CAPTURE_HUB else None
+        self.regions = (self.source.regions if self.source is not None
+                        else parse_regions(MONITOR_REGIONS, MONITOR_REGION))
+        self.use_nvenc = pick_nvenc()
+        if QUALITY_MODE == "auto":
+            self.quality_mode, self.qprof = auto_quality_profile(self.ffmpeg, self.use_nvenc,
+                                                                 self.regions[0], FPS)
+        else:
+            self.quality_mode, self.qprof = QUALITY_MODE, quality_profile(QUALITY_MODE, self.use_nvenc)
+
+        # Áudio sempre aberto; as sessões só recortam (tap)
+        mics = find_microphones(EXTRA_MICS, samplerate=AUDIO_SAMPLERATE, gain=EXTRA_MIC_GAIN)
+        self.rec = AudioRecorder(None, loopback, samplerate=AUDIO_SAMPLERATE, sources=mics)
+        self.tap = WavSessionTap(self.rec)
+        self.rec.start()
+
+        # Encoder ocioso (um por ROI) para a próxima sessão
+        self._temp_n = 0
+        self._spare = None
+        self._spare_ready = threading.Event()
+        self._spawn_spare()
+
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._next_id = 1
+        self._current: Optional[Session] = None
+        self._queue = queue.Queue()
+        self._finishers = []
+        self._ready = threading.Event()
+        self._init_error = None
+        self._worker = threading.Thread(target=self._worker_loop, daemon=True)
+        self._worker.start()
+        self._ready.wait()
+        if self._init_error is not None:
+            # grabber não subiu (sem display, região inválida...): desfaz o aquecimento
+            self._discard_spare()
+            self.rec.stop()
+            if self.source is not None:
+                self.source.close()
+            raise RuntimeError(f"captura de tela indisponível: {self._init_error}") from self._init_error
+        self.warmup_sec = time.perf_counter() - t0
+
+    # ---------- encoders ociosos ----------
+    def _spawn_spare(self):
+        """Abre os processos FFmpeg da próxima sessão (ficam esperando no stdin)."""
+        self._temp_n += 1
+        paths = [self.outdir / f"temp_daemon_{self._temp_n:04d}_roi{i}.mp4"
+                 for i in range(len(self.regions))]
+        try:
+            writers = [FFmpegVideoWriter(self.ffmpeg, p, r['width'], r['height'], FPS, self.qprof,
+                                         in_pix_fmt="bgra")
+                       for p, r in zip(paths, self.regions)]
+            self._spare = (paths, writers)
+        except Exception as e:
+            print(f"[Daemon] ERRO ao abrir o encoder: {e}")
+            self._spare = None
+        self._spare_ready.set()
+
+    def _refill(self):
+        """Sobe o próximo encoder ocioso em segundo plano."""
+        self._spare_ready.clear()  # antes da thread: quem pegar o próximo espera
+        threading.Thread(target=self._spawn_spare, daemon=True).start()
+
+    def _take_spare(self):
+        self._spare_ready.wait()
+        spare, self._spare = self._spare, None
+        if spare is None:
+            raise RuntimeError("encoder indisponível")
+        return spare
+
+    def _discard_spare(self):
+        self._spare_ready.wait()
+        spare, self._spare = self._spare, None
+        if spare is None:
+            return
+        paths, writers = spare
+        for w in writers:
+            try:
+                w.release()
+            except Exception:
+                pass  # sem frames o FFmpeg sai com erro; o arquivo é descartado
+        for p in paths:
+            if p.exists():
+                p.unlink()
+
+    # ---------- API ----------
+    def start(self, duration: Optional[float] = None) -> Optional[dict]:
+        """Enfileira uma sessão; começa na hora se nada estiver gravando.
+
+        Devolve None se a fila já tem DAEMON_MAX_QUEUE sessões esperando.
+        """
+        with self._lock:
+            if sum(1 for s in self._sessions if s.state == "queued") >= DAEMON_MAX_QUEUE:
+                return None
+            sess = Session(self._next_id, duration)
+            self._next_id += 1
+            self._sessions.append(sess)
+        self._queue.put(sess)
+        return sess.info()
+
+    def stop(self) -> Optional[dict]:
+        """Para a sessão em gravação (a próxima da fila começa em seguida)."""
+        with self._lock:
+            sess = self._current
+        if sess is None:
+            return None
+        sess.stop.set()
+        return sess.info()
+
+    def status(self) -> dict:
+        with self._lock:
+            current = self._current.info() if self._current is not None else None
+            queued = sum(1 for s in self._sessions if s.state == "queued")
+            recent = [s.info() for s in self._sessions[-10:]]
+        return dict(recording=current is not None, current=current, queued=queued,
+                    sessions=recent, fps=FPS, quality=self.quality_mode,
+                    encoder="NVENC" if self.use_nvenc else "x264",
+                    regions=self.regions, warmup_sec=self.warmup_sec,
+                    audio_overruns=self.rec.overruns)
+
+    # ---------- gravação ----------
+    def _worker_loop(self):
+        # mss é por thread: o grabber vive na thread que grava
+        try:
+            grabber = self.source if self.source is not None else RoiGrabber(self.regions, mss.mss())
+        except Exception as e:
+            self._init_error = e
+            return
+        finally:
+            self._ready.set()
+        try:
+            while True:
+                sess = self._queue.get()
+                if sess is None:
+                    break
+                try:
+                    self._record(sess, grabber)
+                except Exception as e:
+                    # uma sessão com erro não derruba o daemon: a fila segue
+                    with self._lock:
+                        self._current = None
+                        sess.state, sess.error = "error", sess.error or str(e)
+                    print(f"\n❌ [Daemon] Sessão {sess.id}: {e}\n")
+        finally:
+            if self.source is None:
+                grabber.close()
+
+    def _record(self, sess: Session, grabber):
+        ts = time.strftime("%d-%m-%Y_%H-%M-%S")
+        base = f"video_{ts}_s{sess.id:03d}"
+        tmp_audio = self.outdir / f"temp_{base}.wav"
+        with self._lock:
+            self._current = sess
+            sess.state = "recording"
+            sess.t_started = time.perf_counter()
+        try:
+            paths, writers = self._take_spare()
+        except Exception as e:
+            with self._lock:
+                self._current = None
+                sess.state, sess.error = "error", str(e)
+            self._refill()
+            return
+        # o encoder da próxima sessão sobe enquanto esta grava
+        self._refill()
+
+        sync_log = SyncLog()
+        timer = None
+
+        def first_frame(t):
+            sess.t_first_frame = t
+
+        print(f"\n[Daemon] Sessão {sess.id}: {base}")
+        v0 = None
+        try:
+            self.tap.begin(tmp_audio, sync_log)
+            if sess.duration:
+                timer = threading.Timer(sess.duration, sess.stop.set)
+                timer.daemon = True
+                timer.start()
+            v0 = record_video(self.regions, FPS, paths, writer=writers, sync_log=sync_log,
+                              source=grabber, stop=sess.stop, on_first_frame=first_frame)
+        except Exception as e:
+            sess.error = str(e) or type(e).__name__
+            print(f"\n❌ [Daemon] Erro na sessão {sess.id}:\n{e}\n")
+            for w in writers:  # record_video pode não ter chegado a fechar os encoders
+                try:
+                    w.release()
+                except Exception:
+                    pass
+        finally:
+            sess.t_stopped = time.perf_counter()
+            if timer is not None:
+                timer.cancel()
+            self.tap.end()
+            with self._lock:
+                self._current = None
+                sess.state = "error" if sess.error else "finishing"
+        if sess.error:
+            return
+        latency = 1000.0 * ((sess.t_first_frame or sess.t_stopped) - sess.t_started)
+        print(f"[Daemon] Sessão {sess.id}: 1º frame {latency:.0f}ms após o início")
+        a0 = self.tap.start_ts or sess.t_stopped
+        fin = threading.Thread(target=self._finish,
+                               args=(sess, base, paths, tmp_audio, sync_log, v0, a0))
+        fin.start()
+        self._finishers = [t for t in self._finishers if t.is_alive()] + [fin]
+
+    def _finish(self, sess: Session, base: str, tmp_videos, tmp_audio: Path,
+                sync_log: SyncLog, v0: Optional[float], a0: float):
+        """Sincronia + mux da sessão (mesma lógica do captura_video.main)."""
+        multi = len(self.regions) > 1
+        out_mp4s = [self.outdir / (f"{base}_roi{i}.mp4" if multi else f"{base}.mp4")
+                    for i in range(len(self.regions))]
+        try:
+            sync = estimate_sync(sync_log, AUDIO_SAMPLERATE, FPS)
+            if sync is not None:
+                audio_start, video_start, audio_rate = sync
+                drift_ratio = audio_rate / AUDIO_SAMPLERATE
+            else:
+                audio_start, video_start = a0, (v0 or a0)
+                drift_ratio = None
+            offset = audio_start - video_start
+            if not tmp_audio.exists() or tmp_audio.stat().st_size == 0:
+                raise RuntimeError(f"áudio temporário vazio: {tmp_audio}")
+            for tmp_video, out_mp4, region in zip(tmp_videos, out_mp4s, self.regions):
+                if not tmp_video.exists() or tmp_video.stat().st_size == 0:
+                    raise RuntimeError(f"vídeo temporário vazio: {tmp_video}")
+                save_session_info(out_mp4.with_suffix(".json"), video_start, audio_start,
+                                  offset, FPS, region)
+                mux_ffmpeg(self.ffmpeg, tmp_video, tmp_audio, out_mp4,
+                           FPS, AUDIO_SAMPLERATE, AUDIO_BITRATE, offset, self.qprof,
+                           copy_video=True, drift_ratio=drift_ratio)
+                verify_audio(self.ffprobe, out_mp4)
+        except Exception as e:
+            sess.state, sess.error = "error", str(e)
+            print(f"\n❌ [Daemon] Sessão {sess.id}: {e}\nTemporários preservados.")
+            return
+        if not KEEP_TEMP:
+            for p in list(tmp_videos) + [tmp_audio]:
+                try:
+                    if p.exists(): p.unlink()
+                except Exception as e:
+                    print(f"Aviso: não foi possível remover {p}: {e}")
+        sess.outputs = out_mp4s
+        sess.state = "done"
+        print(f"[Daemon] Sessão {sess.id} salva em: {', '.join(str(p) for p in out_mp4s)}")
+
+    def close(self):
+        with self._lock:
+            for s in self._sessions:
+                if s.state == "queued":
+                    s.state, s.error = "error", "daemon encerrado"
+        self.stop()
+        self._queue.put(None)
+        self._worker.join()
+        for t in self._finishers:
+            t.join()
+        self._discard_spare()
+        self.rec.stop()
+        if self.source is not None:
+            self.source.close()
+
+
+# ========================= API HTTP (local) =========================
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+def make_handler(daemon: CaptureDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        def _local_only(self) -> bool:
+            """Recusa pedidos de navegador (Origin) e DNS rebinding (Host fora do loopback)."""
+            host = urlparse("//" + (self.headers.get("Host") or "")).hostname
+            if self.headers.get("Origin") is not None or host not in LOOPBACK_HOSTS:
+                self._reply(403, dict(error="só aceita pedidos locais"))
+                return False
+            return True
+
+        def _reply(self, code: int, body: dict):
+            data = json.dumps(body, indent=2).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if not self._local_only():
+                return
+            if urlparse(self.path).path != "/status":
+                self.send_error(404)
+                return
+            self._reply(200, daemon.status())
+
+        def do_POST(self):
+            if not self._local_only():
+                return
+            url = urlparse(self.path)
+            if url.path == "/start":
+                duration = parse_qs(url.query).get("duration", [None])[0]
+                if duration is not None:
+                    try:
+                        duration = float(duration)
+                    except ValueError:
+                        duration = math.nan
+                    if not (math.isfinite(duration) and duration > 0):
+                        self._reply(400, dict(error="duration deve ser um número de segundos > 0"))
+                        return
+                info = daemon.start(duration)
+                if info is None:
+                    self._reply(429, dict(error=f"fila cheia ({DAEMON_MAX_QUEUE} sessões esperando)"))
+                else:
+                    self._reply(202, info)
+            elif url.path == "/stop":
+                info = daemon.stop()
+                if info is None:
+                    self._reply(409, dict(error="nenhuma sessão gravando"))
+                else:
+                    self._reply(200, info)
+            else:
+                self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# ========================= Main =========================
+def main():
+    outdir = Path(OUTPUT_DIR); outdir.mkdir(parents=True, exist_ok=True)
+    try:
+        daemon = CaptureDaemon(outdir)
+    except RuntimeError as e:
+        print(f"ERRO: {e}")
+        return
+    reporter = MetricsReporter(port=METRICS_PORT)
+    server = ThreadingHTTPServer((DAEMON_HOST, DAEMON_PORT), make_handler(daemon))
+    server.daemon_threads = True
+    print(f"Config: Encoder: {'NVENC' if daemon.use_nvenc else 'x264'} | Qualidade: {daemon.quality_mode}"
+          f" | FPS: {FPS} | ROIs: {len(daemon.regions)}")
+    print(f"Pronto em {daemon.warmup_sec:.1f}s. API: http://{DAEMON_HOST}:{DAEMON_PORT}"
+          f" (POST /start[?duration=s], POST /stop, GET /status) | CTRL+C encerra")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
+        reporter.close()
+        print(daemon.rec.summary())
+        print(METRICS.summary())
+
+
+if __name__ == "__main__":
+    main()
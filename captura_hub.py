@@ -0,0 +1,333 @@
+import os, json, time
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+import cv2
+import mss
+
+from metrics import METRICS, MetricsReporter
+from roi_grab import RoiGrabber, parse_regions
+
+# ========================= CONFIG =========================
+# Região da tela (usar o código window_region_setup.py para definir a região)
+MONITOR_REGION = {'left': 469, 'top': 123, 'width': 511, 'height': 889}
+MONITOR_REGIONS = []  # várias ROIs (um grab da união); vazio = só MONITOR_REGION
+
+# Hub de captura: um único processo faz o grab e publica os frames em memória
+# compartilhada; gravador (captura_video.py), detector (yolo_roi_detect.py) e
+# preview (roi_preview.py) leem de lá com CAPTURE_HUB = HUB_NAME, sem grab próprio.
+HUB_NAME = "captura_metaglass_hub"
+HUB_FPS = 60          # ritmo do grab; >= FPS do gravador
+HUB_SLOTS = 8         # anel de frames (BGRA); leitor atrasado mais que isso perde frames
+HUB_ATTACH_TIMEOUT = 10.0  # s esperando o hub subir (assinantes)
+
+# Preview: stream reduzido (INTER_AREA, BGR) e com FPS limitado, gerado só
+# enquanto algum preview estiver lendo.
+HUB_PREVIEW_FPS = 10
+HUB_PREVIEW_MAX_W = 700
+HUB_PREVIEW_SLOTS = 3
+HUB_PREVIEW_IDLE_SEC = 2.0  # sem leitura do preview por N s -> para de gerar
+
+# Métricas do hub (metrics.py); 0 = off
+METRICS_PORT = 0
+
+# ========================= Memória compartilhada =========================
+META_BYTES = 4096
+# Controle (int64): seq do último frame, seq do último preview, hub encerrado
+CTL_SEQ, CTL_PREVIEW_SEQ, CTL_CLOSED, CTL_FIELDS = 0, 1, 2, 8
+
+
+class HubLayout:
+    """Mapa da memória compartilhada, igual no hub e nos assinantes.
+
+    [meta JSON][controle int64][heartbeat do preview f8]
+    [frames: seq/índice int64 + t f8 por slot][dados BGRA por slot e ROI]
+    [preview: idem, BGR reduzido]
+
+    Cada slot é protegido por um seqlock: o hub marca o slot como -1, copia,
+    grava t/índice e só então publica o seq no slot e no controle. O leitor
+    confere o seq do slot antes e depois da cópia; se mudou, a cópia é
+    descartada (o hub nunca espera ninguém).
+    """
+    def __init__(self, meta: dict, buf):
+        self.meta = meta
+        self.regions = meta["regions"]
+        off = META_BYTES
+        self.ctl = np.ndarray((CTL_FIELDS,), dtype=np.int64, buffer=buf, offset=off)
+        off += self.ctl.nbytes
+        self.heartbeat = np.ndarray((1,), dtype=np.float64, buffer=buf, offset=off)
+        off += 8
+        self.frames, off = self._ring(buf, off, meta["slots"],
+                                      [(r["height"], r["width"], 4) for r in self.regions])
+        self.preview, off = self._ring(buf, off, meta["preview_slots"],
+                                       [(h, w, 3) for w, h in meta["preview_sizes"]])
+        self.size = off
+
+    @staticmethod
+    def _ring(buf, off, slots, shapes):
+        seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=off); off += seq.nbytes
+        index = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=off); off += index.nbytes
+        t = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=off); off += t.nbytes
+        data = []
+        for _ in range(slots):
+            views = []
+            for shape in shapes:
+                a = np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=off)
+                off += a.nbytes
+                views.append(a)
+            data.append(views)
+        return dict(seq=seq, index=index, t=t, data=data), off
+
+
+def _layout_size(meta: dict) -> int:
+    frame = sum(r["height"] * r["width"] * 4 for r in meta["regions"])
+    preview = sum(w * h * 3 for w, h in meta["preview_sizes"])
+    rings = (meta["slots"] * (24 + frame)) + (meta["preview_slots"] * (24 + preview))
+    return META_BYTES + 8 * CTL_FIELDS + 8 + rings
+
+
+def preview_size(region: dict, max_w: int = HUB_PREVIEW_MAX_W):
+    scale = min(1.0, max_w / region["width"])
+    return max(1, int(region["width"] * scale)), max(1, int(region["height"] * scale))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python 3.13+: o assinante não registra o segmento no resource_tracker
+        # (senão ele seria removido quando o assinante sai)
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name != "nt":
+            # < 3.13 o attach registra o segmento no resource_tracker do assinante
+            # (POSIX): desfaz, senão ele é removido/avisado como vazado na saída
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# ========================= Hub (produtor) =========================
+class CaptureHub:
+    """Dono do grab: captura a união das ROIs em `fps` e publica no anel.
+
+    Nenhuma operação espera assinante: publicar é copiar para o próximo slot e
+    atualizar os seqs. O preview reduzido só é gerado (a `preview_fps`) se
+    algum preview leu nos últimos HUB_PREVIEW_IDLE_SEC.
+    """
+    def __init__(self, regions, name: str = HUB_NAME, fps: float = HUB_FPS,
+                 slots: int = HUB_SLOTS, preview_fps: float = HUB_PREVIEW_FPS,
+                 preview_slots: int = HUB_PREVIEW_SLOTS, sct=None):
+        self.grabber = RoiGrabber(regions, sct if sct is not None else mss.mss())
+        self.fps = fps
+        self.preview_period = 1.0 / preview_fps if preview_fps else None
+        meta = dict(version=1, regions=self.grabber.regions, fps=fps, slots=slots,
+                    preview_slots=preview_slots,
+                    preview_sizes=[preview_size(r) for r in self.grabber.regions])
+        blob = json.dumps(meta).encode()
+        if len(blob) > META_BYTES:
+            raise ValueError("hub: ROIs demais para o cabeçalho")
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=_layout_size(meta))
+        self.shm.buf[:len(blob)] = blob
+        self.layout = HubLayout(meta, self.shm.buf)
+        self.layout.ctl[:] = 0
+        self.layout.heartbeat[0] = 0.0
+        self.layout.frames["seq"][:] = 0
+        self.layout.preview["seq"][:] = 0
+        self.name = name
+        self.seq = 0
+        self.preview_seq = 0
+        self._next_preview = 0.0
+
+    def publish(self, views: List[np.ndarray], t_capture: float, index: int):
+        ring, ctl = self.layout.frames, self.layout.ctl
+        self.seq += 1
+        s = self.seq % len(ring["seq"])
+        ring["seq"][s] = -1  # slot em escrita
+        for dst, src in zip(ring["data"][s], views):
+            np.copyto(dst, src)
+        ring["t"][s] = t_capture
+        ring["index"][s] = index
+        ring["seq"][s] = self.seq
+        ctl[CTL_SEQ] = self.seq
+        if self.preview_period and t_capture >= self._next_preview \
+                and t_capture - self.layout.heartbeat[0] < HUB_PREVIEW_IDLE_SEC:
+            self._next_preview = t_capture + self.preview_period
+            self._publish_preview(views, t_capture, index)
+
+    def _publish_preview(self, views, t_capture: float, index: int):
+        ring, ctl = self.layout.preview, self.layout.ctl
+        self.preview_seq += 1
+        s = self.preview_seq % len(ring["seq"])
+        ring["seq"][s] = -1
+        for dst, src in zip(ring["data"][s], views):
+            h, w = dst.shape[:2]
+            if (h, w) == src.shape[:2]:
+                cv2.cvtColor(src, cv2.COLOR_BGRA2BGR, dst=dst)
+            else:
+                small = cv2.resize(src, (w, h), interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(small, cv2.COLOR_BGRA2BGR, dst=dst)
+        ring["t"][s] = t_capture
+        ring["index"][s] = index
+        ring["seq"][s] = self.preview_seq
+        ctl[CTL_PREVIEW_SEQ] = self.preview_seq
+        METRICS.inc("hub_preview_frames_total")
+
+    def run(self):
+        """Loop de captura (CTRL+C para parar)."""
+        h_grab = METRICS.histogram("hub_grab_seconds")
+        h_publish = METRICS.histogram("hub_publish_seconds")
+        period = 1.0 / self.fps
+        next_t = time.perf_counter()
+        index = 0
+        try:
+            while True:
+                t = time.perf_counter()
+                views = self.grabber.grab()
+                t_capture = self.grabber.t_capture
+                h_grab.observe(t_capture - t)
+                self.publish(views, t_capture, index)
+                h_publish.observe(time.perf_counter() - t_capture)
+                METRICS.inc("hub_frames_total")
+                index += 1
+                next_t += period
+                delay = next_t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_t = time.perf_counter()  # atrasado: não acumula rajada
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        self.layout.ctl[CTL_CLOSED] = 1
+        self.grabber.close()
+        self.layout = None  # solta as views antes de fechar o segmento
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass  # já removido (ex.: resource_tracker de um assinante antigo)
+
+
+# ========================= Assinante =========================
+class HubSubscriber:
+    """Lê frames do hub (mesma interface do RoiGrabber: `grab`, `regions`,
+    `t_capture`, `close`).
+
+    `grab` devolve o frame mais recente já publicado, copiado para buffers
+    próprios (válidos até o próximo grab), sem esperar o hub; só na primeira
+    chamada espera o 1º frame. Com `preview=True`, lê o stream reduzido (BGR).
+    Frames pulados e cópias descartadas pelo seqlock são contados em `missed`
+    e `torn`. Devolve None quando o hub encerra.
+    """
+    def __init__(self, name: str = HUB_NAME, preview: bool = False,
+                 timeout: float = HUB_ATTACH_TIMEOUT):
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                self.shm = _attach(name)
+                break
+            except FileNotFoundError:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError(f"hub '{name}' não encontrado (rodar captura_hub.py)")
+                time.sleep(0.1)
+        blob = bytes(self.shm.buf[:META_BYTES]).rstrip(b"\0")
+        self.layout = HubLayout(json.loads(blob), self.shm.buf)
+        self.regions = self.layout.regions
+        self.preview = preview
+        self.fps = self.layout.meta["fps"]
+        self._ring = self.layout.preview if preview else self.layout.frames
+        self._ctl_seq = CTL_PREVIEW_SEQ if preview else CTL_SEQ
+        self._out = [np.empty_like(a) for a in self._ring["data"][0]]
+        self.seq = 0
+        self.index = -1
+        self.t_capture = None
+        self.fresh = False  # o último grab trouxe frame novo (senão repetiu o anterior)
+        self.repeats = 0    # grabs sem frame novo do hub (under-run)
+        self.missed = 0
+        self.torn = 0
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.layout.ctl[CTL_CLOSED])
+
+    def _read(self, seq: int) -> bool:
+        ring = self._ring
+        s = seq % len(ring["seq"])
+        if ring["seq"][s] != seq:
+            return False
+        for dst, src in zip(self._out, ring["data"][s]):
+            np.copyto(dst, src)
+        t, index = float(ring["t"][s]), int(ring["index"][s])
+        if ring["seq"][s] != seq:
+            return False  # sobrescrito durante a cópia
+        if self.seq and seq > self.seq + 1:
+            self.missed += seq - self.seq - 1
+        self.seq, self.t_capture, self.index = seq, t, index
+        return True
+
+    def wait_newer(self, timeout: Optional[float] = None) -> Optional[List[np.ndarray]]:
+        """Espera (polling) um frame mais novo que o último lido; None em timeout/fim."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        poll = min(0.002, 0.25 / max(1.0, self.fps))
+        while True:
+            if self.preview:
+                self.layout.heartbeat[0] = time.perf_counter()
+            seq = int(self.layout.ctl[self._ctl_seq])
+            if seq > self.seq:
+                if self._read(seq):
+                    return self._out
+                self.torn += 1
+                METRICS.inc("hub_torn_reads_total")
+                continue
+            if self.closed or (deadline is not None and time.perf_counter() > deadline):
+                return None
+            time.sleep(poll)
+
+    def grab(self) -> Optional[List[np.ndarray]]:
+        if self.closed:
+            return None
+        seq = int(self.layout.ctl[self._ctl_seq])
+        if seq > self.seq and self._read(seq):
+            self.fresh = True
+            return self._out
+        if self.seq:
+            # nada novo (ou cópia rasgada): repete o último, com o t_capture dele
+            self.fresh = False
+            self.repeats += 1
+            return self._out
+        out = self.wait_newer(HUB_ATTACH_TIMEOUT)
+        self.fresh = out is not None
+        return out
+
+    def close(self):
+        self._ring = self._out = None
+        self.layout = None
+        self.shm.close()
+
+
+# ========================= Main =========================
+def main():
+    regions = parse_regions(MONITOR_REGIONS, MONITOR_REGION)
+    try:
+        hub = CaptureHub(regions)
+    except FileExistsError:
+        print(f"ERRO: já existe um hub '{HUB_NAME}' rodando.")
+        return
+    reporter = MetricsReporter(port=METRICS_PORT)
+    u = hub.grabber.union
+    print(f"Hub '{HUB_NAME}': {len(regions)} ROI(s) | união {u['width']}x{u['height']}"
+          f" | {HUB_FPS} FPS | {HUB_SLOTS} slots ({hub.shm.size / 2**20:.1f} MB)")
+    print(">>> PUBLICANDO (CTRL+C para parar)")
+    try:
+        hub.run()
+    finally:
+        hub.close()
+        reporter.close()
+        print(f"Hub encerrado. Frames: {hub.seq} | Preview: {hub.preview_seq}")
+        print(METRICS.summary())
+
+
+if __name__ == "__main__":
+    main()
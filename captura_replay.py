@@ -0,0 +1,439 @@
+import sys, json, time, queue, signal, threading, subprocess
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Captura/encoder de vídeo e áudio reaproveitados dos scripts de gravação
+from captura_video import (FFmpegVideoWriter, record_video, find_ffmpeg, find_ffprobe,
+                           pick_nvenc, quality_profile, verify_audio)
+from captura_audio import (AudioRecorder, MmapWavWriter, PcmRingTap,
+                           find_loopback_device, find_microphones)
+
+# ========================= CONFIG =========================
+OUTPUT_DIR = r"C:\Users\alber\OneDrive\Documentos\CEIA\Meta Glass\Captura\Output-capturas\replays"
+
+# Região da tela (usar o código window_region_setup.py para definir a região)
+MONITOR_REGION = {'left': 469, 'top': 123, 'width': 511, 'height': 889}
+
+FPS = 30
+
+# Replay: mantém em memória os últimos REPLAY_SEC segundos (vídeo já encodado +
+# PCM do áudio). A cada gatilho (ENTER no terminal, POST /replay na API local,
+# SIGUSR1 ou ReplayBuffer.trigger()) salva esse trecho + os REPLAY_POST_SEC
+# seguintes num MP4.
+REPLAY_SEC = 60
+REPLAY_POST_SEC = 10
+REPLAY_QUALITY = "fast"          # "fast" | "high" | "insane" (lossless não tem teto de bitrate)
+REPLAY_VIDEO_BITRATE = "8M"      # teto do encoder (maxrate); define a memória do vídeo
+REPLAY_GOP_SEC = 1.0             # keyframe a cada N s (granularidade do início do clipe)
+
+# Gatilho por HTTP (só local, funciona no Windows): POST http://127.0.0.1:<porta>/replay
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 8766  # 0 = desligado
+
+# Áudio
+AUDIO_SAMPLERATE = 48000
+AUDIO_BITRATE = "320k"  # AAC
+EXTRA_MICS = []  # microfones somados ao loopback
+EXTRA_MIC_GAIN = 1.0
+
+# Manter arquivos temporários (para debug)
+KEEP_TEMP = False
+
+# ========================= Utils =========================
+def parse_bitrate(rate: str) -> int:
+    """'8M' / '2500k' / '800000' -> bits por segundo."""
+    rate = str(rate).strip()
+    mult = {"k": 1_000, "m": 1_000_000}.get(rate[-1:].lower(), 1)
+    return int(float(rate[:-1] if mult > 1 else rate) * mult)
+
+def replay_profile(qprof: dict, bitrate: str, fps: int) -> dict:
+    """Perfil de `quality_profile` com teto de bitrate e GOP fechado para o anel."""
+    opts = list(qprof["opts"])
+    opts += ["-maxrate", bitrate, "-bufsize", bitrate, "-g", str(max(1, int(round(fps * REPLAY_GOP_SEC))))]
+    if qprof["codec"] == "h264_nvenc":
+        opts += ["-forced-idr", "1"]  # keyframes forçados viram IDR (pontos de corte)
+    return dict(qprof, opts=opts)
+
+
+# ========================= Bitstream H.264 (Annex B) =========================
+class AnnexBSplitter:
+    """Divide o bitstream H.264 (Annex B) do encoder em GOPs fechados.
+
+    Cada GOP começa no access unit de um IDR (incluindo SPS/PPS/SEI que o
+    precedem) e é entregue a `on_gop(data, n_frames)`. Assume um slice por frame
+    (padrão do x264 e do NVENC), então nº de frames = nº de NALs de slice.
+    """
+    VCL = (1, 5)
+    IDR = 5
+
+    def __init__(self, on_gop):
+        self.on_gop = on_gop
+        self._buf = bytearray()
+        self._scan = 0         # próxima posição a procurar start code
+        self._frames = 0       # frames no GOP em montagem
+        self._au_start = None  # início do 1º NAL não-VCL após um slice
+
+    def feed(self, data: bytes):
+        self._buf += data
+        buf = self._buf
+        while True:
+            p = buf.find(b"\x00\x00\x01", self._scan)
+            if p < 0 or p + 3 >= len(buf):
+                self._scan = max(0, len(buf) - 3) if p < 0 else p
+                return
+            self._scan = p + 3
+            start = p - 1 if p > 0 and buf[p - 1] == 0 else p
+            nal_type = buf[p + 3] & 0x1F
+            if nal_type in self.VCL:
+                if nal_type == self.IDR and self._frames > 0:
+                    cut = self._au_start if self._au_start is not None else start
+                    self._emit(cut)
+                    continue
+                self._frames += 1
+                self._au_start = None
+            elif self._au_start is None:
+                self._au_start = start
+
+    def _emit(self, cut: int):
+        self.on_gop(bytes(self._buf[:cut]), self._frames)
+        del self._buf[:cut]
+        self._scan = 0
+        self._frames = 0
+        self._au_start = None
+
+    def flush(self):
+        if self._buf:
+            # o último frame ainda não foi contado se o NAL dele ficou no fim do buffer
+            tail = self._buf.find(b"\x00\x00\x01", self._scan)
+            if tail >= 0 and tail + 3 < len(self._buf) and (self._buf[tail + 3] & 0x1F) in self.VCL:
+                self._frames += 1
+            if self._frames:
+                self._emit(len(self._buf))
+
+
+# ========================= Anel de replay =========================
+class Gop(NamedTuple):
+    first: int     # índice (tick CFR) do 1º frame
+    frames: int
+    data: bytes
+
+
+class ReplayClip:
+    """GOPs de um clipe em montagem: pré-roll copiado do anel + os que chegarem até `end_frame`."""
+    def __init__(self, gops, end_frame: int):
+        self.gops = list(gops)
+        self.end_frame = end_frame
+
+    @property
+    def first_frame(self) -> int:
+        return self.gops[0].first if self.gops else self.end_frame
+
+    @property
+    def last_frame(self) -> int:
+        return self.gops[-1].first + self.gops[-1].frames if self.gops else self.first_frame
+
+
+class ReplayBuffer:
+    """Pré-roll em memória: GOPs encodados mais recentes, limitados por duração e bytes.
+
+    Mantém pelo menos `seconds` de vídeo (descarta o GOP mais antigo só quando
+    o restante ainda cobre `seconds`) e nunca passa de `max_bytes`. `trigger()`
+    congela o conteúdo atual num ReplayClip e continua anexando GOPs até
+    `post_sec`; o clipe completo sai em `done` para a thread de gravação, que
+    chama `clip_saved()` ao terminar. Só existe um clipe por vez (aberto, na
+    fila ou sendo gravado; gatilhos nesse intervalo são ignorados e contados em
+    `ignored`), então a memória fica limitada ao anel (`max_bytes`) + um clipe
+    (`max_bytes` + pós-roll no teto de bitrate): ver `max_total_bytes`.
+    """
+    def __init__(self, fps: int, seconds: float, max_bytes: int, post_sec: float = REPLAY_POST_SEC):
+        self.fps = fps
+        self.keep_frames = int(round(seconds * fps))
+        self.max_bytes = max_bytes
+        self.post_frames = int(round(post_sec * fps))
+        self.gops = deque()
+        self.frames_total = 0
+        self.nbytes = 0
+        self.max_nbytes = 0
+        self.done = queue.Queue(maxsize=1)
+        self.ignored = 0       # gatilhos recusados (clipe anterior ainda não gravado)
+        self._clip = None
+        self._pending = False  # um clipe entre trigger() e clip_saved()
+        self._lock = threading.Lock()
+
+    def add_gop(self, data: bytes, frames: int):
+        with self._lock:
+            gop = Gop(self.frames_total, frames, data)
+            self.gops.append(gop)
+            self.frames_total += frames
+            self.nbytes += len(data)
+            while len(self.gops) > 1 and (
+                    self.frames_total - self.gops[1].first >= self.keep_frames
+                    or self.nbytes > self.max_bytes):
+                self.nbytes -= len(self.gops.popleft().data)
+            self.max_nbytes = max(self.max_nbytes, self.nbytes)
+            if self._clip is not None:
+                self._clip.gops.append(gop)
+                if self.frames_total >= self._clip.end_frame:
+                    self.done.put(self._clip)
+                    self._clip = None
+
+    @staticmethod
+    def max_total_bytes(max_bytes: int, bitrate_bps: int, post_sec: float) -> int:
+        """Teto da memória de vídeo: anel + um clipe (pré-roll do anel + pós-roll e 1 GOP)."""
+        post_bytes = int(bitrate_bps / 8 * (post_sec + REPLAY_GOP_SEC) * 1.25)
+        return 2 * max_bytes + post_bytes
+
+    def trigger(self) -> bool:
+        """Marca um replay (thread-safe). False se o clipe anterior ainda não foi gravado."""
+        with self._lock:
+            if self._pending:
+                self.ignored += 1
+                return False
+            self._pending = True
+            self._clip = ReplayClip(self.gops, self.frames_total + self.post_frames)
+            return True
+
+    def clip_saved(self):
+        """Chamado pela thread de gravação ao terminar um clipe: libera o próximo gatilho."""
+        with self._lock:
+            self._pending = False
+
+    def close(self):
+        """Entrega o clipe aberto (com o que já chegou) e encerra `done`."""
+        with self._lock:
+            if self._clip is not None and self._clip.gops:
+                self.done.put(self._clip)
+            self._clip = None
+        self.done.put(None)
+
+
+class ReplayVideoEncoder:
+    """Encoder H.264 em streaming para a memória: FFmpeg -> stdout -> GOPs no ReplayBuffer.
+
+    Mesma interface write/release do FFmpegVideoWriter (recebe BGRA de
+    `record_video`); uma thread lê o bitstream (Annex B) e o divide em GOPs.
+    """
+    def __init__(self, ffmpeg: str, width: int, height: int, fps: int, qprof: dict,
+                 replay: ReplayBuffer):
+        self.vw = FFmpegVideoWriter(
+            ffmpeg, "pipe:1", width, height, fps, qprof, in_pix_fmt="bgra",
+            out_args=["-force_key_frames", f"expr:gte(t,n_forced*{REPLAY_GOP_SEC})", "-f", "h264"],
+            stdout=subprocess.PIPE)
+        self.splitter = AnnexBSplitter(replay.add_gop)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        out = self.vw.proc.stdout
+        while True:
+            data = out.read1(1 << 16)
+            if not data:
+                break
+            self.splitter.feed(data)
+        self.splitter.flush()
+
+    def write(self, frame: np.ndarray):
+        self.vw.write(frame)
+
+    def release(self):
+        try:
+            self.vw.release()
+        finally:
+            self._reader.join()
+
+
+# ========================= Gravação do clipe =========================
+def save_clip(ffmpeg: str, clip: ReplayClip, audio: PcmRingTap, v0: float, fps: int,
+              out_mp4: Path, audio_bitrate: str = AUDIO_BITRATE):
+    """Grava o clipe: H.264 copiado sem reencode + o mesmo intervalo de tempo do áudio."""
+    f0, f1 = clip.first_frame, clip.last_frame
+    t_start = v0 + f0 / fps                      # frame k ocupa o tick CFR k (PTS = k / fps)
+    n_audio = int(round((f1 - f0) / fps * audio.samplerate))
+    pcm = audio.read(audio.time_to_sample(t_start), n_audio)
+
+    tmp_video = out_mp4.with_name(f"temp_{out_mp4.stem}.h264")
+    tmp_audio = out_mp4.with_name(f"temp_{out_mp4.stem}.wav")
+    try:
+        with open(tmp_video, "wb") as f:
+            for gop in clip.gops:
+                f.write(gop.data)
+        wf = MmapWavWriter(tmp_audio, audio.samplerate, pcm.shape[1])
+        wf.writeframes(pcm)
+        wf.close()
+        cmd = [ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+               "-fflags", "+genpts", "-framerate", str(fps), "-i", str(tmp_video),
+               "-i", str(tmp_audio),
+               "-map", "0:v:0", "-map", "1:a:0",
+               "-c:v", "copy", "-c:a", "aac", "-b:a", audio_bitrate,
+               "-shortest", "-movflags", "+faststart", str(out_mp4)]
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode(errors="replace"))
+    finally:
+        if not KEEP_TEMP:
+            for p in (tmp_video, tmp_audio):
+                try:
+                    if p.exists(): p.unlink()
+                except Exception as e:
+                    print(f"Aviso: não foi possível remover {p}: {e}")
+    return (f1 - f0) / fps
+
+
+def saver_loop(ffmpeg: str, ffprobe: Optional[str], replay: ReplayBuffer, audio: PcmRingTap,
+               state: dict, outdir: Path):
+    """Thread de gravação: consome `replay.done` fora da thread de captura."""
+    while True:
+        clip = replay.done.get()
+        if clip is None:
+            break
+        try:
+            if state.get("v0") is None or not clip.gops:
+                continue
+            out_mp4 = outdir / f"replay_{time.strftime('%d-%m-%Y_%H-%M-%S')}.mp4"
+            dur = save_clip(ffmpeg, clip, audio, state["v0"], replay.fps, out_mp4)
+            verify_audio(ffprobe, out_mp4)
+            print(f"\nReplay salvo ({dur:.1f}s): {out_mp4} ✅")
+        except Exception as e:
+            print(f"\n❌ Erro ao salvar replay:\n{e}\n")
+        finally:
+            del clip  # solta os GOPs antes de liberar o próximo gatilho
+            replay.clip_saved()
+
+
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def make_trigger_handler(fire):
+    """API local do replay: POST /replay marca um replay (202, ou 409 se o anterior não foi salvo)."""
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            # recusa pedidos de navegador (Origin) e DNS rebinding (Host fora do loopback)
+            host = urlparse("//" + (self.headers.get("Host") or "")).hostname
+            if self.headers.get("Origin") is not None or host not in LOOPBACK_HOSTS:
+                self._reply(403, dict(error="só aceita pedidos locais"))
+            elif urlparse(self.path).path != "/replay":
+                self.send_error(404)
+            elif fire():
+                self._reply(202, dict(pre_sec=REPLAY_SEC, post_sec=REPLAY_POST_SEC))
+            else:
+                self._reply(409, dict(error="replay anterior ainda não foi salvo"))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_triggers(replay: ReplayBuffer) -> Optional[ThreadingHTTPServer]:
+    """Gatilhos: ENTER no terminal, POST /replay (REPLAY_PORT) e SIGUSR1 (onde existir).
+
+    Devolve o servidor HTTP (para `shutdown`), ou None se desligado/indisponível.
+    """
+    def fire() -> bool:
+        if replay.trigger():
+            print(f"\n>>> Replay marcado: últimos {REPLAY_SEC}s + próximos {REPLAY_POST_SEC}s")
+            return True
+        print("\nReplay anterior ainda não foi salvo; gatilho ignorado.")
+        return False
+
+    def stdin_loop():
+        for _ in sys.stdin:
+            fire()
+
+    threading.Thread(target=stdin_loop, daemon=True).start()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: fire())
+    if not REPLAY_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer((REPLAY_HOST, REPLAY_PORT), make_trigger_handler(fire))
+    except OSError as e:
+        print(f"Aviso: API de replay indisponível na porta {REPLAY_PORT}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ========================= Main =========================
+def main():
+    outdir = Path(OUTPUT_DIR); outdir.mkdir(parents=True, exist_ok=True)
+    ffmpeg = find_ffmpeg()
+    ffprobe = find_ffprobe()
+
+    print("Procurando dispositivos de áudio...")
+    loopback = find_loopback_device()
+    if not loopback:
+        print("ERRO: nenhum dispositivo de loopback encontrado.")
+        return
+
+    use_nvenc = pick_nvenc()
+    qprof = replay_profile(quality_profile(REPLAY_QUALITY, use_nvenc), REPLAY_VIDEO_BITRATE, FPS)
+
+    # Memória: vídeo limitado pelo teto de bitrate (anel de pré-roll + no máximo
+    # um clipe com pós-roll), áudio por um anel PCM16 fixo (pré-roll + pós-roll
+    # + folga de GOP, para o clipe aberto não perder o início)
+    bitrate = parse_bitrate(REPLAY_VIDEO_BITRATE)
+    video_bytes = int(bitrate / 8 * (REPLAY_SEC + REPLAY_GOP_SEC) * 1.25)
+    video_total = ReplayBuffer.max_total_bytes(video_bytes, bitrate, REPLAY_POST_SEC)
+    audio_sec = REPLAY_SEC + REPLAY_POST_SEC + 2 * REPLAY_GOP_SEC + 2.0
+    replay = ReplayBuffer(FPS, REPLAY_SEC, video_bytes)
+
+    mics = find_microphones(EXTRA_MICS, samplerate=AUDIO_SAMPLERATE, gain=EXTRA_MIC_GAIN)
+    rec = AudioRecorder(None, loopback, samplerate=AUDIO_SAMPLERATE, sources=mics)
+    audio = PcmRingTap(rec, audio_sec)
+    audio_bytes = audio.capacity * 2 * 2  # PCM16 estéreo
+
+    state = {"v0": None}
+    saver = threading.Thread(target=saver_loop, args=(ffmpeg, ffprobe, replay, audio, state, outdir))
+    saver.start()
+
+    try:
+        enc = ReplayVideoEncoder(ffmpeg, MONITOR_REGION['width'], MONITOR_REGION['height'],
+                                 FPS, qprof, replay)
+    except Exception as e:
+        replay.close(); saver.join()
+        print(f"\n❌ Erro no encoder:\n{e}\n")
+        return
+
+    print(f"Config: Encoder: {'NVENC' if use_nvenc else 'x264'} | Qualidade: {REPLAY_QUALITY}"
+          f" | FPS: {FPS} | Replay: {REPLAY_SEC}s + {REPLAY_POST_SEC}s")
+    print(f"Memória máx.: vídeo {video_total / 2**20:.0f} MB ({REPLAY_VIDEO_BITRATE}bps; anel"
+          f" {video_bytes / 2**20:.0f} MB + 1 clipe) | áudio ~{audio_bytes / 2**20:.0f} MB")
+    print(f"Saída: {outdir}")
+    print("ENTER salva um replay."
+          + (f" API: POST http://{REPLAY_HOST}:{REPLAY_PORT}/replay" if REPLAY_PORT else ""))
+
+    server = start_triggers(replay)
+    rec.start()
+    try:
+        record_video(MONITOR_REGION, FPS, None, writer=enc,
+                     on_first_frame=lambda ts: state.__setitem__("v0", ts))
+    except RuntimeError as e:
+        print(f"\n❌ Erro no encoder:\n{e}\n")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        rec.stop()
+        print(rec.summary())
+        print(f"Anel de vídeo: máx {replay.max_nbytes / 2**20:.1f} MB"
+              f" | áudio {audio.nbytes / 2**20:.1f} MB | gatilhos ignorados: {replay.ignored}")
+        replay.close()
+        saver.join()
+
+if __name__ == "__main__":
+    main()
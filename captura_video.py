@@ -1,34 +1,97 @@
-import os, time, wave, shutil, subprocess, threading
+import os, json, time, queue, shutil, subprocess, threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
 import numpy as np
 import cv2
 import mss
-import soundcard as sc
+
+# Gravação do loopback (AudioRecorder) compartilhada com captura_audio.py
+from captura_audio import AudioRecorder, find_loopback_device, find_microphones
+from metrics import METRICS, MetricsReporter
+from roi_grab import RoiGrabber, parse_regions
+from captura_hub import HubSubscriber
 
 # ========================= CONFIG =========================
 OUTPUT_DIR = r"C:\Users\alber\OneDrive\Documentos\CEIA\Meta Glass\Captura\Output-capturas\videos"
 
 # Região da tela (usar o código window_region_setup.py para definir a região)
 MONITOR_REGION = {'left': 469, 'top': 123, 'width': 511, 'height': 889}
+# Várias ROIs ao mesmo tempo (ex.: uma live e uma chamada lado a lado): a união
+# é capturada uma vez por tick e cada ROI vira um MP4 próprio (<saída>_roi<i>.mp4)
+# com o mesmo áudio. Vazio = só MONITOR_REGION. ROIs próximas saem mais baratas.
+MONITOR_REGIONS = []
+# Ler os frames de um captura_hub.py já rodando (memória compartilhada) em vez
+# de capturar a tela aqui; as ROIs passam a ser as do hub. None = grab próprio.
+CAPTURE_HUB = None  # ex.: "captura_metaglass_hub"
 
 FPS = 30 # FPS alvo (ex.: 30 ou 60)
-QUALITY_MODE = "insane"  # Qualidade do vídeo: "high" | "insane" | "lossless"
+QUALITY_MODE = "insane"  # Qualidade do vídeo: "fast" | "high" | "insane" | "lossless" | "auto"
+# "auto": mede (uma vez, com cache em disco) a velocidade do encoder na ROI/FPS
+# configurados e escolhe o modo de maior qualidade que ainda roda acima do tempo real
+ENCODER_PROBE_SEC = 2.0          # duração do clipe sintético do benchmark
+ENCODER_REALTIME_MARGIN = 1.25   # velocidade mínima exigida (x tempo real)
+ENCODER_CACHE = Path.home() / ".captura_metaglass" / "encoder_cache.json"
 
 # Áudio
 AUDIO_SAMPLERATE = 48000
 AUDIO_BITRATE = "320k"  # AAC
+EXTRA_MICS = []  # microfones somados ao loopback (ex.: ["default"] para a própria voz numa chamada)
+EXTRA_MIC_GAIN = 1.0
 NVENC_MODE = "auto"  # NVENC (encoder da NVIDIA): "auto" (detecta), "on" (força), "off" (usa x264)
 
+# Encode em streaming: frames crus vão direto para o FFmpeg durante a captura
+# (sem mp4v temporário + reencode). No final só o áudio é multiplexado.
+STREAM_ENCODE = True
+
+# Pipeline captura -> encoder: nº de buffers pré-alocados no anel de frames.
+# Se o encoder atrasar e o anel encher, o frame é descartado (contado) em vez de
+# atrasar o relógio da captura.
+FRAME_POOL_SIZE = 8
+
+# Ritmo CFR: dorme até ~PACER_SPIN_SEC antes do deadline e faz spin no restante
+PACER_SPIN_SEC = 0.002
+
+# Dedup de frames estáticos (só com STREAM_ENCODE): ticks sem mudança na ROI não
+# são copiados para o anel nem encodados; o arquivo sai em VFR com timestamps
+# corretos. Limite: o rawvideo não tem timestamps, então o tick estático ainda
+# reenvia o último frame pelo pipe e o mpdecimate o compara antes de descartar;
+# a economia é a do encoder (x264/NVENC), não a da cópia para o FFmpeg.
+DEDUP_STATIC = False
+DEDUP_STEP = 8             # amostragem da ROI para comparação (1 a cada N pixels)
+DEDUP_THRESHOLD = 8        # diferença máx. por canal (0-255) ainda considerada "igual"
+DEDUP_MAX_GAP_SEC = 1.0    # força um frame real pelo menos a cada N segundos
+
+# Gravação segmentada (só com STREAM_ENCODE): a cada SEGMENT_SEC fecha um par
+# vídeo (MP4 fragmentado) + áudio (WAV) já reproduzível; no final os pares são
+# multiplexados em paralelo e concatenados sem reencode. 0 = desativado.
+SEGMENT_SEC = 0
+SEGMENT_MUX_WORKERS = 4
+
+# Sincronia A/V: timestamps por bloco de áudio e por frame vão para um sidecar
+# (temp_*_ts.npz); o mux aplica offset e taxa real do áudio estimados da sessão
+# inteira (sem aresample async). Drift só é estimado a partir de SYNC_MIN_SEC.
+SYNC_MIN_SEC = 60.0
+SYNC_MAX_PPM = 2000.0     # acima disso a estimativa é descartada (falha de medição)
+
+# Métricas (metrics.py): tempos por etapa, filas, descartes e overruns.
+# METRICS_JSONL grava um snapshot por segundo em <saída>_metrics.jsonl;
+# METRICS_PORT > 0 expõe http://127.0.0.1:<porta>/metrics (Prometheus).
+METRICS_JSONL = False
+METRICS_PORT = 0
+
 # Manter arquivos temporários (para debug)
 KEEP_TEMP = False 
 
 # ========================= Utils =========================
-def to_pcm16(x: np.ndarray) -> np.ndarray:
-    """Converte float32 [-1,1] -> int16 PCM (N, C)."""
-    x = np.clip(x, -1.0, 1.0)
-    return (x * 32767.0).astype(np.int16)
+# FFmpeg em outro grupo de processos (Windows) / sessão (POSIX): o CTRL+C que
+# para a gravação chega só ao Python, que fecha o stdin e deixa o FFmpeg
+# finalizar o arquivo (sem isso o FFmpeg morre junto e o MP4 fica sem moov).
+FFMPEG_POPEN_KW = (dict(creationflags=subprocess.CREATE_NEW_PROCESS_GROUP) if os.name == "nt"
+                   else dict(start_new_session=True))
 
 def find_ffmpeg() -> str:
     ffmpeg = shutil.which("ffmpeg")
@@ -39,13 +102,43 @@ def find_ffmpeg() -> str:
 def find_ffprobe() -> Optional[str]:
     return shutil.which("ffprobe")
 
+def ffmpeg_id(ffmpeg: str) -> str:
+    """Identifica o binário do FFmpeg (caminho + mtime + tamanho) sem executá-lo."""
+    st = os.stat(ffmpeg)
+    return f"{os.path.abspath(ffmpeg)}|{st.st_mtime_ns}|{st.st_size}"
+
+def load_encoder_cache() -> dict:
+    try:
+        with open(ENCODER_CACHE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_encoder_cache(cache: dict):
+    try:
+        ENCODER_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        with open(ENCODER_CACHE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1)
+    except OSError as e:
+        print(f"Aviso: não foi possível salvar o cache de encoders: {e}")
+
 def detect_nvenc() -> bool:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return False
+    cache = load_encoder_cache()
+    key = f"encoders|{ffmpeg_id(ffmpeg)}"
+    if key in cache:
+        return cache[key]
     try:
-        out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
-                             capture_output=True, text=True, check=True).stdout.lower()
-        return "h264_nvenc" in out
+        out = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True,
+                             text=True, check=True, timeout=10).stdout.lower()
+        found = "h264_nvenc" in out
     except Exception:
-        return False
+        return False  # falha/timeout não vai para o cache
+    cache[key] = found
+    save_encoder_cache(cache)
+    return found
 
 def pick_nvenc() -> bool:
     if NVENC_MODE == "on":  return True
@@ -70,6 +163,13 @@ def quality_profile(mode: str, use_nvenc: bool):
             return dict(codec="libx264", pix="yuv420p",
                         opts=["-preset","slower","-crf","12","-x264-params",
                               "ref=6:bframes=6:subme=9:me=umh:rc-lookahead=60:aq-mode=2:aq-strength=1.2:deblock=-1,-1:psy-rd=1.00,0.15"])
+    if mode == "fast":
+        # Para máquinas que não sustentam "high" em tempo real
+        if use_nvenc:
+            return dict(codec="h264_nvenc", pix="yuv420p",
+                        opts=["-preset","p2","-cq","20","-bf","2"])
+        else:
+            return dict(codec="libx264", pix="yuv420p", opts=["-preset","veryfast","-crf","16"])
     # "high" (padrão)
     if use_nvenc:
         return dict(codec="h264_nvenc", pix="yuv420p",
@@ -77,118 +177,659 @@ def quality_profile(mode: str, use_nvenc: bool):
     else:
         return dict(codec="libx264", pix="yuv420p", opts=["-preset","slow","-crf","14"])
 
+def _bench_clip(ffmpeg: str, w: int, h: int, fps: int, n: int) -> Optional[np.ndarray]:
+    """Pré-gera (fora da medição) até `n` frames testsrc2 em BGRA, limitados a ~128 MB."""
+    k = max(2, min(n, (128 << 20) // (w * h * 4)))
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostats",
+           "-f", "lavfi", "-i", f"testsrc2=size={w}x{h}:rate={fps}",
+           "-frames:v", str(k), "-f", "rawvideo", "-pix_fmt", "bgra", "-"]
+    try:
+        raw = subprocess.run(cmd, capture_output=True, check=True, timeout=60).stdout
+    except Exception:
+        return None
+    k = len(raw) // (w * h * 4)
+    if k == 0:
+        return None
+    return np.frombuffer(raw, dtype=np.uint8, count=k * w * h * 4).reshape(k, h, w, 4)
+
+def _bench_run(ffmpeg: str, qprof: dict, clip: np.ndarray, n: int, fps: int,
+               timeout: float) -> Optional[float]:
+    """Encoda `n` frames do clipe (em ciclo) pelo stdin, como na gravação; tempo de parede ou None."""
+    h, w = clip.shape[1:3]
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-nostats",
+           "-f", "rawvideo", "-pix_fmt", "bgra", "-s", f"{w}x{h}", "-r", str(fps), "-i", "-",
+           "-c:v", qprof["codec"], *qprof["opts"], "-pix_fmt", qprof["pix"],
+           "-f", "null", "-"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    watchdog = threading.Timer(timeout, proc.kill)  # encoder travado (ex.: driver) = falha
+    watchdog.start()
+    try:
+        for i in range(n):
+            proc.stdin.write(clip[i % len(clip)].data)
+        proc.stdin.close()
+    except OSError:
+        pass  # FFmpeg saiu antes (erro/timeout): o código de saída diz
+    finally:
+        rc = proc.wait()
+        watchdog.cancel()
+    elapsed = time.perf_counter() - t0
+    return elapsed if rc == 0 else None
+
+def bench_encoder(ffmpeg: str, qprof: dict, width: int, height: int, fps: int,
+                  seconds: float = ENCODER_PROBE_SEC) -> float:
+    """Mede a velocidade do encoder (x tempo real) na resolução da ROI; 0.0 = falhou.
+
+    Os frames (testsrc2) são gerados antes e entram em BGRA pelo stdin, como na
+    gravação. Partida do processo e init do encoder são descontadas: o tempo de
+    um clipe de poucos frames sai do tempo do clipe completo.
+    """
+    w, h = width + width % 2, height + height % 2
+    n = max(4, int(round(seconds * fps)))
+    clip = _bench_clip(ffmpeg, w, h, fps, n)
+    if clip is None:
+        return 0.0
+    timeout = max(30.0, 20 * seconds)
+    few = 2
+    t_few = _bench_run(ffmpeg, qprof, clip, few, fps, timeout)
+    t_all = _bench_run(ffmpeg, qprof, clip, n, fps, timeout) if t_few is not None else None
+    if t_all is None:
+        return 0.0
+    elapsed = t_all - t_few
+    if elapsed <= 0:
+        elapsed = t_all  # ruído de medição: fica com o tempo total (pessimista)
+    return (n - few) / fps / elapsed
+
+def auto_quality_profile(ffmpeg: str, use_nvenc: bool, region, fps: int):
+    """Escolhe o modo de maior qualidade que encoda acima de ENCODER_REALTIME_MARGIN.
+
+    Resultados do benchmark ficam em ENCODER_CACHE, por binário do FFmpeg,
+    encoder, geometria da ROI e FPS. Retorna (modo, qprof).
+    """
+    cache = load_encoder_cache()
+    codec = "h264_nvenc" if use_nvenc else "libx264"
+    key = f"bench|{ffmpeg_id(ffmpeg)}|{codec}|{region['width']}x{region['height']}@{fps}"
+    # 0.0 = medição que falhou/estourou o tempo: nunca vem do cache, mede de novo
+    speeds = {m: s for m, s in cache.get(key, {}).items() if s > 0}
+    ladder = ("insane", "high", "fast")
+    for mode in ladder:
+        qprof = quality_profile(mode, use_nvenc)
+        if mode not in speeds:
+            print(f"Medindo encoder ({codec}, {mode})...")
+            speeds[mode] = bench_encoder(ffmpeg, qprof, region['width'], region['height'], fps)
+            if speeds[mode] > 0:
+                cache[key] = {m: s for m, s in speeds.items() if s > 0}
+                save_encoder_cache(cache)
+        if speeds[mode] >= ENCODER_REALTIME_MARGIN:
+            print(f"Auto: modo '{mode}' ({speeds[mode]:.2f}x tempo real)")
+            return mode, qprof
+    print(f"Aviso: nenhum modo acima de {ENCODER_REALTIME_MARGIN}x tempo real; usando 'fast'.")
+    return "fast", quality_profile("fast", use_nvenc)
+
+
+# ========================= Encoder de vídeo (FFmpeg, streaming) =========================
+class FFmpegVideoWriter:
+    """Recebe frames BGR/BGRA e os envia como rawvideo para um FFmpeg persistente.
+
+    Mesma interface usada do cv2.VideoWriter (write/release), mas já grava no
+    codec final de `quality_profile`. Com `dedup_max_gap > 0`, frames repetidos
+    são removidos antes do encoder (mpdecimate) e a saída fica em VFR,
+    preservando o timestamp CFR original de cada frame mantido.
+
+    Com `segment_sec > 0`, `out_path` é um padrão (ex.: `temp_x_v%03d.mp4`) e a
+    saída é dividida em MP4s fragmentados de `segment_sec` segundos, com
+    keyframe forçado em cada corte; cada segmento fechado já é reproduzível.
+    `out_args` entra antes da saída (ex.: `["-f", "h264"]` com `out_path="pipe:1"`
+    e `stdout=subprocess.PIPE` para ler o bitstream em memória).
+    """
+    def __init__(self, ffmpeg: str, out_path: Path, width: int, height: int,
+                 fps: int, qprof: dict, in_pix_fmt: str = "bgr24", dedup_max_gap: int = 0,
+                 segment_sec: float = 0, out_args: Optional[list] = None,
+                 stdout=subprocess.DEVNULL):
+        self.out_path = out_path
+        self._log = deque(maxlen=50)
+        filters, vsync = [], []
+        if dedup_max_gap > 0:
+            # Só descarta cópias exatas (a decisão de "estático" é da captura)
+            filters.append(f"mpdecimate=hi=0:lo=0:frac=0:max={dedup_max_gap}")
+            vsync = ["-vsync", "vfr"]
+        if qprof["pix"] == "yuv420p":
+            # yuv420p exige dimensões pares (ex.: ROI 511x889)
+            filters.append("pad=ceil(iw/2)*2:ceil(ih/2)*2")
+        vf = ["-vf", ",".join(filters)] if filters else []
+        mux = []
+        if segment_sec > 0:
+            mux = ["-force_key_frames", f"expr:gte(t,n_forced*{segment_sec})",
+                   "-f", "segment", "-segment_time", str(segment_sec),
+                   "-segment_format", "mp4",
+                   "-segment_format_options", "movflags=+frag_keyframe+empty_moov+default_base_moof",
+                   "-reset_timestamps", "1"]
+        cmd = [
+            ffmpeg, "-y", "-hide_banner", "-loglevel", "error", "-nostats",
+            "-f", "rawvideo", "-pix_fmt", in_pix_fmt,
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            *vf, *vsync,
+            "-c:v", qprof["codec"], *qprof["opts"],
+            "-pix_fmt", qprof["pix"],
+            "-an",
+            *mux, *(out_args or []),
+            str(out_path)
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=stdout, stderr=subprocess.PIPE, **FFMPEG_POPEN_KW)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+
+    def _drain_stderr(self):
+        for line in iter(self.proc.stderr.readline, b""):
+            self._log.append(line.decode(errors="replace").rstrip())
 
-# ========================= Áudio (loopback) =========================
-class AudioRecorder:
-    def __init__(self, wav_path: Path, device, samplerate=AUDIO_SAMPLERATE):
-        self.wav_path = wav_path
-        self.device = device  # sem anotação de tipo para compatibilidade com soundcard
-        self.samplerate = samplerate
-        self.is_recording = False
-        self.thread = None
-        self.start_ts = None  # perf_counter do 1º chunk
+    def _error(self) -> RuntimeError:
+        return RuntimeError(f"FFmpeg (encoder) falhou ({self.proc.returncode}). Saída:\n"
+                            + "\n".join(self._log))
 
-    def _loop(self):
+    def write(self, frame: np.ndarray):
         try:
-            with self.device.recorder(samplerate=self.samplerate, blocksize=1024) as mic, \
-                 wave.open(str(self.wav_path), 'wb') as wf:
-                first = mic.record(numframes=1024)
-                if first.ndim == 1:
-                    channels = 1
-                    first = first[:, None]
-                else:
-                    channels = first.shape[1]
-
-                wf.setnchannels(channels)
-                wf.setsampwidth(2)  # PCM16
-                wf.setframerate(self.samplerate)
-
-                wf.writeframes(to_pcm16(first).tobytes())
-                if self.start_ts is None:
-                    self.start_ts = time.perf_counter()
-
-                while self.is_recording:
-                    data = mic.record(numframes=1024)
-                    if data.ndim == 1:
-                        data = data[:, None]
-                    wf.writeframes(to_pcm16(data).tobytes())
-        except Exception as e:
-            print(f"[Áudio] ERRO: {e}")
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError):
+            self.proc.wait()
+            raise self._error()
 
-    def start(self):
-        self.is_recording = True
-        self.thread = threading.Thread(target=self._loop, daemon=True)
-        self.thread.start()
+    def release(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        self.proc.wait()
+        self._stderr_thread.join(timeout=1.0)
+        if self.proc.returncode != 0:
+            raise self._error()
 
-    def stop(self):
-        self.is_recording = False
-        if self.thread:
-            self.thread.join()
 
-def find_loopback_device():
-    print("Procurando dispositivos de áudio...")
-    mics = sc.all_microphones(include_loopback=True)
-    if not mics:
+# ========================= Sincronia A/V =========================
+class SyncLog:
+    """Timestamps (perf_counter) por bloco de áudio e por frame de vídeo.
+
+    audio_t/audio_n: instante de chegada de cada bloco e nº de amostras já
+    recebidas até o fim dele. video_t/video_k: instante da captura de cada frame
+    e o índice do tick CFR (PTS = k / fps) que ele ocupa.
+    """
+    def __init__(self):
+        self.audio_t = array("d")
+        self.audio_n = array("q")
+        self.video_t = array("d")
+        self.video_k = array("q")
+
+    def save(self, path: Path):
+        np.savez(path,
+                 audio_t=np.array(self.audio_t, dtype=np.float64),
+                 audio_n=np.array(self.audio_n, dtype=np.int64),
+                 video_t=np.array(self.video_t, dtype=np.float64),
+                 video_k=np.array(self.video_k, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: Path) -> "SyncLog":
+        log = cls()
+        with np.load(path) as d:
+            log.audio_t.extend(d["audio_t"].tolist())
+            log.audio_n.extend(d["audio_n"].tolist())
+            log.video_t.extend(d["video_t"].tolist())
+            log.video_k.extend(d["video_k"].tolist())
+        return log
+
+def estimate_sync(log: SyncLog, samplerate: int, fps: int):
+    """Estima (audio_start, video_start, taxa_real_do_audio) a partir do SyncLog.
+
+    audio_start/video_start são os instantes (perf_counter) da amostra 0 e do
+    tick 0. A taxa real do áudio vem de um ajuste linear chegada x amostras na
+    sessão inteira; os inícios usam o envelope inferior (latência mínima).
+    Retorna None se não houver dados suficientes.
+    """
+    if len(log.audio_t) < 2 or len(log.video_t) < 1:
         return None
+    at = np.array(log.audio_t, dtype=np.float64)
+    an = np.array(log.audio_n, dtype=np.float64)
+    vt = np.array(log.video_t, dtype=np.float64)
+    vk = np.array(log.video_k, dtype=np.float64)
+
+    rate = float(samplerate)
+    if at[-1] - at[0] >= SYNC_MIN_SEC:
+        slope = np.polyfit(an - an[0], at - at[0], 1)[0]
+        if slope > 0 and abs(1.0 / (slope * samplerate) - 1.0) * 1e6 <= SYNC_MAX_PPM:
+            rate = 1.0 / slope
+    audio_start = float(np.min(at - an / rate))
+    video_start = float(np.min(vt - vk / fps))
+    return audio_start, video_start, rate
+
+
+def save_session_info(path: Path, video_start: float, audio_start: float, offset: float,
+                      fps: int, region: dict):
+    """Sidecar JSON do MP4 para juntar eventos externos (ex.: detecções do
+    yolo_roi_detect.py) à gravação: PTS no MP4 = perf_counter - pts_origin.
+
+    perf_counter é monotônico do sistema (QueryPerformanceCounter no Windows),
+    então vale entre processos na mesma máquina; `wall_minus_perf` converte
+    para horário de parede.
+    """
+    # mux_ffmpeg atrasa o stream que começou depois; o MP4 começa no mais cedo
+    pts_origin = video_start if offset >= 0 else audio_start
+    info = dict(clock="perf_counter", pts_origin=pts_origin, video_start=video_start,
+                audio_start=audio_start, fps=fps, region=region,
+                wall_minus_perf=time.time() - time.perf_counter())
     try:
-        spk = sc.default_speaker()
-        for m in mics:
-            if getattr(m, "isloopback", False) and m.name == spk.name:
-                print(f"Dispositivo encontrado: '{m.name}'")
-                return m
-    except Exception:
-        pass
-    for m in mics:
-        if getattr(m, "isloopback", False):
-            print(f"Dispositivo encontrado: '{m.name}'")
-            return m
-    return None
+        path.write_text(json.dumps(info, indent=2))
+    except Exception as e:
+        print(f"Aviso: não foi possível gravar {path}: {e}")
+
+
+# ========================= Pipeline captura -> encoder =========================
+class FrameRing:
+    """Pool fixo de buffers pré-alocados + fila limitada entre captura e encoder.
+
+    A captura pega um slot livre (`acquire`), preenche e publica (`publish`);
+    o writer consome (`next_ready`) e devolve o slot (`release`). Nada é alocado
+    por frame. `publish_repeat` pede ao writer que repita o último frame (tick
+    sem captura nova), mantendo o CFR.
+    """
+    REPEAT = -1
+
+    def __init__(self, shape, slots: int, dtype=np.uint8):
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(slots)]
+        self._free = queue.Queue()
+        for i in range(slots):
+            self._free.put(i)
+        # slots frames + marcadores de repetição + sentinela de fim
+        self._ready = queue.Queue(maxsize=4 * slots + 1)
+        self.dropped = 0
+        self.max_depth = 0
+
+    def acquire(self) -> Optional[int]:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return None
+
+    def publish(self, idx: int):
+        self._ready.put(idx)
+        self.max_depth = max(self.max_depth, self._ready.qsize())
+
+    def publish_repeat(self) -> bool:
+        """Enfileira um frame duplicado; False se a fila estiver cheia (tick perdido)."""
+        try:
+            self._ready.put_nowait(self.REPEAT)
+        except queue.Full:
+            return False
+        self.max_depth = max(self.max_depth, self._ready.qsize())
+        return True
+
+    def next_ready(self) -> Optional[int]:
+        return self._ready.get()
+
+    def release(self, idx: int):
+        self._free.put(idx)
+
+    def depth(self) -> int:
+        return self._ready.qsize()
+
+    def close(self):
+        self._ready.put(None)
+
+
+class FrameWriterThread(threading.Thread):
+    """Consome frames do FrameRing e os entrega ao writer (cv2/FFmpeg) em ordem.
+
+    Um único worker por saída: o stream de vídeo é sequencial e o paralelismo
+    fica a cargo do próprio encoder (threads do x264/NVENC). O slot do último
+    frame fica retido até chegar o próximo, para atender `FrameRing.REPEAT`.
+    """
+    def __init__(self, ring: FrameRing, writer):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.writer = writer
+        self.written = 0
+        self.error: Optional[Exception] = None
+        self.h_write = METRICS.histogram("video_write_seconds")
+
+    def run(self):
+        last = None
+        while True:
+            idx = self.ring.next_ready()
+            if idx is None:
+                break
+            if idx == FrameRing.REPEAT:
+                if last is None:
+                    continue
+                frame = self.ring.buffers[last]
+            else:
+                if last is not None:
+                    self.ring.release(last)
+                last = idx
+                frame = self.ring.buffers[idx]
+            try:
+                if self.error is None:
+                    t = time.perf_counter()
+                    self.writer.write(frame)
+                    self.h_write.observe(time.perf_counter() - t)
+                    self.written += 1
+            except Exception as e:
+                self.error = e  # continua drenando para não travar a captura
+        if last is not None:
+            self.ring.release(last)
+
+
+class FramePacer:
+    """Agenda ticks CFR em deadlines absolutos (t0 + k/fps).
+
+    `wait` dorme até perto do deadline e faz spin no restante (menos jitter que
+    sleep puro, sem queimar CPU o tempo todo). Se a captura atrasar mais de um
+    período, retorna quantos ticks foram perdidos, para que o chamador os
+    preencha com o último frame.
+    """
+    def __init__(self, fps: int, spin_sec: float = PACER_SPIN_SEC):
+        self.period = 1.0 / fps
+        self.spin_sec = spin_sec
+        self.t0 = None
+        self.tick = 0
+        self.lateness = array("d")  # atraso (s) de cada tick em relação ao deadline
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        self.tick = 0
+
+    def wait(self) -> int:
+        deadline = self.t0 + self.tick * self.period
+        now = time.perf_counter()
+        if now < deadline:
+            remaining = deadline - now - self.spin_sec
+            if remaining > 0:
+                time.sleep(remaining)
+            while time.perf_counter() < deadline:
+                pass
+            now = time.perf_counter()
+        late = now - deadline
+        missed = int(late / self.period)
+        self.lateness.append(late - missed * self.period)
+        self.tick += missed + 1
+        return missed
+
+    def summary(self) -> str:
+        if not self.lateness:
+            return "Atraso por tick: -"
+        lat = np.frombuffer(self.lateness, dtype=np.float64) * 1000.0
+        return (f"Atraso por tick: médio {lat.mean():.2f}ms | p99 {np.percentile(lat, 99):.2f}ms"
+                f" | máx {lat.max():.2f}ms")
+
+
+class StaticFrameDetector:
+    """Detecta ticks sem mudança comparando uma amostra reduzida da ROI.
+
+    Compara `frame[::step, ::step]` com a amostra do último frame enviado
+    (buffers pré-alocados, poucos KB). Mudanças menores que `threshold` por
+    canal contam como estáticas; a cada `max_gap` ticks estáticos seguidos um
+    frame real é liberado, para que mudanças pequenas fora da amostra não
+    fiquem presas.
+    """
+    def __init__(self, shape, step: int = DEDUP_STEP, threshold: int = DEDUP_THRESHOLD,
+                 max_gap: int = 30):
+        h, w, c = shape
+        probe = ((h + step - 1) // step, (w + step - 1) // step, c)
+        self.step = step
+        self.threshold = threshold
+        self.max_gap = max_gap
+        self._cur = np.empty(probe, dtype=np.uint8)
+        self._prev = np.empty(probe, dtype=np.uint8)
+        self._diff = np.empty(probe, dtype=np.uint8)
+        self._has_prev = False
+        self._gap = 0
+
+    def is_static(self, frame: np.ndarray) -> bool:
+        np.copyto(self._cur, frame[::self.step, ::self.step])
+        if self._has_prev and self._gap < self.max_gap:
+            cv2.absdiff(self._cur, self._prev, dst=self._diff)
+            if int(self._diff.max()) <= self.threshold:
+                self._gap += 1
+                return True
+        self._cur, self._prev = self._prev, self._cur
+        self._has_prev = True
+        self._gap = 0
+        return False
+
+
+class RoiOutput:
+    """Uma saída de `record_video`: anel de frames + writer (thread própria) +
+    dedup opcional, para uma ROI. Recebe a view da ROI sobre o grab da união e
+    copia/converte para o próprio slot; contadores por saída."""
+    def __init__(self, region: dict, vw, channels: int, detector: Optional[StaticFrameDetector] = None):
+        self.region = region
+        self.vw = vw
+        self.channels = channels
+        self.detector = detector
+        self.ring = FrameRing((region['height'], region['width'], channels), FRAME_POOL_SIZE)
+        self.writer = FrameWriterThread(self.ring, vw)
+        self.slot: Optional[int] = None
+        self.frames = 0       # frames capturados
+        self.duplicated = 0   # ticks preenchidos com o frame anterior
+        self.lost = 0         # ticks que nem a duplicata coube na fila
+        self.static = 0       # ticks estáticos (dedup), repetidos e descartados no FFmpeg
+
+    def repeat(self, static: bool = False):
+        """Repete o último frame neste tick (ou conta o tick como perdido)."""
+        if self.ring.publish_repeat():
+            if static:
+                self.static += 1
+                METRICS.inc("video_static_frames_total")
+            else:
+                self.duplicated += 1
+                METRICS.inc("video_duplicated_frames_total")
+        else:
+            self.lost += 1
+            METRICS.inc("video_lost_ticks_total")
+
+    def acquire(self) -> bool:
+        """Reserva um slot para o tick; sem slot (encoder atrasado) repete o último."""
+        self.slot = self.ring.acquire()
+        if self.slot is None:
+            self.repeat()
+            return False
+        return True
+
+    def push(self, bgra: np.ndarray) -> bool:
+        """Copia a view BGRA da ROI para o slot reservado; False se for estática."""
+        slot, self.slot = self.slot, None
+        if self.detector is not None and self.detector.is_static(bgra):
+            # Nada mudou: devolve o slot e repete o último frame (descartado no FFmpeg)
+            self.ring.release(slot)
+            self.repeat(static=True)
+            return False
+        if self.channels == 4:
+            np.copyto(self.ring.buffers[slot], bgra)
+        else:
+            cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self.ring.buffers[slot])
+        self.ring.publish(slot)
+        self.frames += 1
+        METRICS.inc("video_frames_total")
+        return True
+
+    def close(self):
+        self.ring.close()
+        self.writer.join()
+        self.vw.release()
 
 
 # ========================= Vídeo (CFR) =========================
-def record_video(region, fps, temp_mp4: Path):
-    """Captura CFR com mss + OpenCV; retorna start_ts_video (perf_counter)."""
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    vw = cv2.VideoWriter(str(temp_mp4), fourcc, fps, (region['width'], region['height']))
-    sct = mss.mss()
+def record_video(region, fps, temp_mp4, ffmpeg: Optional[str] = None,
+                 qprof: Optional[dict] = None, segment_sec: float = 0, on_first_frame=None,
+                 sync_log: Optional[SyncLog] = None, writer=None, source=None,
+                 stop: Optional[threading.Event] = None):
+    """Captura CFR com mss + OpenCV; retorna start_ts_video (perf_counter).
+
+    Com `ffmpeg` e `qprof`, encoda em streaming no codec final (FFmpegVideoWriter),
+    recebendo BGRA direto do mss; caso contrário grava mp4v temporário via
+    cv2.VideoWriter (BGR convertido direto no buffer do anel). Com DEDUP_STATIC
+    (só em streaming), ticks estáticos viram repetições descartadas antes do
+    encoder e o vídeo sai em VFR. Com `segment_sec` (só em streaming), `temp_mp4`
+    é um padrão de segmentos; `on_first_frame(ts)` é chamado no 1º frame.
+    Com `sync_log`, registra instante e tick de cada frame capturado. Com
+    `writer` (objeto com write/release que recebe BGRA, ex.: o encoder do
+    replay), os frames vão para ele em vez de um arquivo.
+
+    `region` pode ser uma lista de ROIs (com `temp_mp4`/`writer` também em
+    lista, na mesma ordem): a união é capturada uma vez por tick (RoiGrabber) e
+    cada ROI vai para o próprio encoder, todas no mesmo relógio CFR. Com
+    `source` (ex.: `captura_hub.HubSubscriber`), os frames vêm dela em vez de um
+    grab próprio (e não é fechada aqui); a gravação termina quando a fonte
+    acaba. Com `stop`, termina quando o evento é sinalizado (além do CTRL+C).
+    """
+    regions = parse_regions(region)
+    paths = temp_mp4 if isinstance(temp_mp4, (list, tuple)) else [temp_mp4] * len(regions)
+    writers = writer if isinstance(writer, (list, tuple)) else [writer] * len(regions)
+    if len(paths) != len(regions) or len(writers) != len(regions):
+        raise ValueError("record_video: uma saída (temp_mp4/writer) por ROI")
+    if source is not None and len(source.regions) != len(regions):
+        # antes de abrir os encoders (senão ficariam processos FFmpeg órfãos)
+        raise ValueError(f"record_video: a fonte tem {len(source.regions)} ROI(s), "
+                         f"a gravação {len(regions)}")
+    streaming = bool(ffmpeg and qprof) or writer is not None
+    max_gap = max(1, int(round(fps * DEDUP_MAX_GAP_SEC)))
+    dedup = streaming and DEDUP_STATIC
+    if dedup and segment_sec > 0:
+        # VFR desalinharia os cortes de vídeo dos cortes de áudio
+        print("Aviso: DEDUP_STATIC ignorado no modo segmentado.")
+        dedup = False
+
+    # Uma saída (anel + writer em thread própria) por ROI
+    channels = 4 if streaming else 3
+    outputs = []
+    for reg, path, w in zip(regions, paths, writers):
+        detector = None
+        if dedup and w is None:
+            detector = StaticFrameDetector((reg['height'], reg['width'], 4), max_gap=max_gap)
+        if w is not None:
+            vw = w
+        elif streaming:
+            vw = FFmpegVideoWriter(ffmpeg, path, reg['width'], reg['height'], fps, qprof,
+                                   in_pix_fmt="bgra",
+                                   dedup_max_gap=max_gap if detector else 0,
+                                   segment_sec=segment_sec)
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            vw = cv2.VideoWriter(str(path), fourcc, fps, (reg['width'], reg['height']))
+        outputs.append(RoiOutput(reg, vw, channels, detector))
+    # Captura (esta thread, um grab da união por tick) -> anéis -> writers
+    grabber = source if source is not None else RoiGrabber(regions, mss.mss())
+    if source is not None:
+        print(f"Fonte: {type(source).__name__} ({len(regions)} ROI(s))")
+    elif len(regions) > 1:
+        u = grabber.union
+        print(f"ROIs: {len(regions)} | união {u['width']}x{u['height']}"
+              f" (cobertura {100 * grabber.coverage:.0f}%)")
+    for out in outputs:
+        out.writer.start()
 
     start_ts_video = None
-    last_idx = -1
-    t0 = time.perf_counter()
-    frames = 0
+    pacer = FramePacer(fps)
+
+    # Métricas (histogramas obtidos uma vez; no loop só observe/inc)
+    h_grab = METRICS.histogram("video_grab_seconds")
+    h_convert = METRICS.histogram("video_convert_seconds")
+    h_late = METRICS.histogram("video_tick_lateness_seconds")
+    METRICS.gauge("video_queue_depth", lambda: max(o.ring.depth() for o in outputs))
+    METRICS.gauge("video_dropped_frames", lambda: sum(o.ring.dropped for o in outputs))
+    METRICS.gauge("video_ticks", lambda: pacer.tick)
 
     print("\n>>> GRAVANDO (CTRL+C para parar)")
+    t0 = time.perf_counter()
+    pacer.start()
     try:
-        while True:
-            now = time.perf_counter()
-            target_idx = int((now - t0) * fps)
-            if target_idx <= last_idx:
-                time.sleep(0.001)
+        while stop is None or not stop.is_set():
+            missed = pacer.wait()
+            h_late.observe(pacer.lateness[-1])
+            for out in outputs:
+                if out.writer.error is not None:
+                    raise out.writer.error
+                for _ in range(missed):
+                    out.repeat()
+            # encoder atrasado: a saída sem slot repete o último frame; se
+            # nenhuma tiver slot, nem captura
+            ready = [out.acquire() for out in outputs]
+            if not any(ready):
                 continue
-            img = sct.grab(region)
-            frame = np.array(img)
-            frame_bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-            if start_ts_video is None:
+            t = time.perf_counter()
+            views = grabber.grab()
+            if views is None:
+                for out, ok in zip(outputs, ready):
+                    if ok:
+                        out.ring.release(out.slot)
+                break  # fonte encerrada (hub parou)
+            h_grab.observe(time.perf_counter() - t)
+            if not grabber.fresh:
+                # hub sem frame novo: o tick repete o último (duplicado) e fica
+                # fora do sync_log (o t_capture antigo contra o tick novo
+                # puxaria o início do vídeo para trás em estimate_sync)
+                for out, ok in zip(outputs, ready):
+                    if ok:
+                        out.ring.release(out.slot)
+                        out.slot = None
+                        out.repeat()
+                continue
+            if sync_log is not None:
+                sync_log.video_t.append(grabber.t_capture)
+                sync_log.video_k.append(pacer.tick - 1)
+            t = time.perf_counter()
+            pushed = False
+            for out, ok, bgra in zip(outputs, ready, views):
+                if ok:
+                    pushed = out.push(bgra) or pushed
+            h_convert.observe(time.perf_counter() - t)
+            if pushed and start_ts_video is None:
                 start_ts_video = time.perf_counter()
-            vw.write(frame_bgr)
-            frames += 1
-            last_idx = target_idx
+                if on_first_frame is not None:
+                    on_first_frame(start_ts_video)
     except KeyboardInterrupt:
         pass
     finally:
-        vw.release()
-        cv2.destroyAllWindows()
+        for out in outputs:
+            out.close()
+        if source is None:
+            grabber.close()
+        try:
+            cv2.destroyAllWindows()
+        except cv2.error:
+            pass  # opencv-python-headless (ex.: daemon/servidor) não tem highgui
         dur = max(time.perf_counter() - t0, 1e-6)
         print("Gravação finalizada! ✅")
-        print(f"Duração: {dur:.2f}s | FPS efetivo: {frames/dur:.2f}")
+        for i, out in enumerate(outputs):
+            tag = f"[ROI {i}] " if len(outputs) > 1 else ""
+            print(f"{tag}Duração: {dur:.2f}s | FPS efetivo: {(out.frames + out.duplicated + out.static)/dur:.2f}"
+                  f" (capturados: {out.frames/dur:.2f})")
+            print(f"{tag}Ticks: {pacer.tick} | Duplicados: {out.duplicated} | Descartados: {out.ring.dropped}"
+                  f" | Perdidos: {out.lost} | Fila: máx {out.ring.max_depth}")
+            if out.detector is not None:
+                print(f"{tag}Estáticos (dedup): {out.static}")
+        print(pacer.summary())
+    for out in outputs:
+        if out.writer.error is not None:
+            raise RuntimeError(str(out.writer.error))
     return start_ts_video
 
 
 # ========================= Mux (FFmpeg) =========================
 def mux_ffmpeg(ffmpeg, video_mp4: Path, audio_wav: Path, out_mp4: Path,
                fps: int, audio_rate: int, audio_bitrate: str,
-               offset_sec: float, qprof: dict):
-    """Junta vídeo+áudio com offset e correção de drift."""
+               offset_sec: float, qprof: dict, copy_video: bool = False,
+               drift_ratio: Optional[float] = None):
+    """Junta vídeo+áudio com offset e correção de drift.
+
+    `offset_sec` > 0 atrasa o áudio; < 0 atrasa o vídeo. Com `copy_video=True`
+    (vídeo já encodado em streaming) o vídeo é copiado sem reencode e só o áudio
+    é processado. Com `drift_ratio` (taxa real / nominal do áudio, de
+    `estimate_sync`) o áudio é reamostrado nessa razão exata; sem ele, o drift é
+    compensado por `aresample=async`.
+    """
     codec = qprof["codec"]; pix = qprof["pix"]; vopts = qprof["opts"]
     base = [ffmpeg, "-y"]
 
@@ -202,17 +843,19 @@ def mux_ffmpeg(ffmpeg, video_mp4: Path, audio_wav: Path, out_mp4: Path,
         base += ["-i", str(video_mp4), "-i", str(audio_wav)]
         map_v, map_a = "0:v:0", "1:a:0"
 
+    if copy_video:
+        vargs = ["-c:v", "copy"]
+    else:
+        vargs = ["-c:v", codec, *vopts, "-pix_fmt", pix, "-r", str(fps), "-vsync", "1"]
+
     cmd = base + [
         "-map", map_v, "-map", map_a,
-        "-c:v", codec, *vopts,
-        "-pix_fmt", pix,
-        "-r", str(fps),
-        "-vsync", "1",
+        *vargs,
         "-c:a", "aac",
         "-b:a", audio_bitrate,
         "-ar", str(audio_rate),
         "-ac", "2",
-        "-af", "aresample=async=1:first_pts=0",
+        "-af", audio_sync_filter(audio_rate, drift_ratio),
         "-shortest",
         "-movflags", "+faststart",
         str(out_mp4)
@@ -222,6 +865,82 @@ def mux_ffmpeg(ffmpeg, video_mp4: Path, audio_wav: Path, out_mp4: Path,
     if proc.returncode != 0:
         raise RuntimeError(f"FFmpeg falhou ({proc.returncode}). Saída:\n{proc.stdout}")
 
+def audio_sync_filter(audio_rate: int, drift_ratio: Optional[float]) -> str:
+    """Filtro de áudio do mux: reamostragem com razão fixa ou async (fallback).
+
+    asetrate só aceita inteiros; reinterpretar a 16x a taxa nominal antes do
+    aresample dá resolução de ~1 ppm na razão (vs ~21 ppm direto a 48 kHz).
+    """
+    if not drift_ratio:
+        return "aresample=async=1:first_pts=0"
+    a = audio_rate * 16
+    b = int(round(a / drift_ratio))
+    if a == b:
+        return "aresample=first_pts=0"
+    return f"asetrate={a},aresample={b}:first_pts=0,asetrate={audio_rate}"
+
+def segment_offsets(sync, n: int, segment_starts, segment_sec: float, fps: int,
+                    samplerate: int, fallback: float):
+    """Offset de mux (convenção de `mux_ffmpeg`) de cada par de segmentos.
+
+    Com `sync`, compara o instante real do 1º tick de cada segmento de vídeo com
+    o da 1ª amostra do WAV correspondente; sem ele, só o 1º par usa `fallback`.
+    """
+    if sync is None:
+        return [fallback] + [0.0] * (n - 1)
+    audio_start, video_start, rate = sync
+    offsets = []
+    for i in range(n):
+        v = video_start + np.ceil(i * segment_sec * fps - 1e-9) / fps
+        a = audio_start + segment_starts[i] / rate
+        offsets.append(a - v)
+    return offsets
+
+def concat_ffmpeg(ffmpeg, parts, out_mp4: Path):
+    """Concatena MP4s com mesmos codecs (concat demuxer), sem reencode."""
+    list_path = out_mp4.with_name(f"temp_{out_mp4.stem}_concat.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for p in parts:
+            f.write("file '" + str(Path(p).resolve()).replace("'", "'\\''") + "'\n")
+    cmd = [ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", str(list_path),
+           "-map", "0", "-c", "copy", "-movflags", "+faststart", str(out_mp4)]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    finally:
+        try:
+            list_path.unlink()
+        except Exception:
+            pass
+    if proc.returncode != 0:
+        raise RuntimeError(f"FFmpeg (concat) falhou ({proc.returncode}). Saída:\n{proc.stdout}")
+
+def mux_segments(ffmpeg, video_parts, audio_parts, out_mp4: Path,
+                 fps: int, audio_rate: int, audio_bitrate: str,
+                 offsets, qprof: dict, workers: int = SEGMENT_MUX_WORKERS,
+                 drift_ratio: Optional[float] = None):
+    """Multiplexa cada par (vídeo, áudio) em paralelo e concatena o resultado.
+
+    Os cortes de áudio são alinhados aos de vídeo (`AudioRecorder.set_segment_origin`);
+    `offsets` traz o offset residual de cada par (ver `segment_offsets`).
+    Retorna a lista de partes geradas.
+    """
+    n = min(len(video_parts), len(audio_parts))
+    if len(video_parts) != len(audio_parts):
+        print(f"Aviso: {len(video_parts)} segmentos de vídeo e {len(audio_parts)} de áudio;"
+              f" usando os {n} primeiros pares.")
+    parts = [out_mp4.with_name(f"temp_{out_mp4.stem}_p{i:03d}.mp4") for i in range(n)]
+
+    def job(i):
+        mux_ffmpeg(ffmpeg, video_parts[i], audio_parts[i], parts[i],
+                   fps, audio_rate, audio_bitrate, offsets[i], qprof,
+                   copy_video=True, drift_ratio=drift_ratio)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        list(ex.map(job, range(n)))
+    concat_ffmpeg(ffmpeg, parts, out_mp4)
+    return parts
+
 def verify_audio(ffprobe: Optional[str], path: Path):
     if not ffprobe:
         print("Aviso: ffprobe não encontrado; pulando verificação de áudio.")
@@ -238,18 +957,65 @@ def verify_audio(ffprobe: Optional[str], path: Path):
 
 
 # ========================= Main =========================
+def finish_segments(ffmpeg, ffprobe, outdir: Path, base: str, rec: "AudioRecorder",
+                    out_mp4: Path, sync, offset: float, drift_ratio: Optional[float],
+                    qprof: dict, extra_temps=()):
+    """Pós-processamento do modo segmentado: mux paralelo + concat sem reencode."""
+    # %03d vira 4+ dígitos a partir do segmento 1000: ordena pelo número, não pelo nome
+    video_parts = sorted((p for p in outdir.glob(f"temp_{base}_v[0-9]*.mp4")
+                          if p.stem.rsplit("_v", 1)[1].isdigit()),
+                         key=lambda p: int(p.stem.rsplit("_v", 1)[1]))
+    audio_parts = [p for p in rec.segments if p.exists() and p.stat().st_size > 0]
+    if not video_parts or not audio_parts:
+        print("ERRO: nenhum segmento de vídeo/áudio gravado."); return
+    print(f"Segmentos: {len(video_parts)}")
+
+    n = min(len(video_parts), len(audio_parts))
+    offsets = segment_offsets(sync, n, rec.segment_starts, SEGMENT_SEC, FPS,
+                              AUDIO_SAMPLERATE, offset)
+    temps = list(video_parts) + list(audio_parts) + list(extra_temps)
+    try:
+        temps += mux_segments(ffmpeg, video_parts, audio_parts, out_mp4,
+                              FPS, AUDIO_SAMPLERATE, AUDIO_BITRATE, offsets, qprof,
+                              drift_ratio=drift_ratio)
+        verify_audio(ffprobe, out_mp4)
+        print("Junção de áudio e vídeo concluída! ✅")
+    except Exception as e:
+        print(f"\n❌ Erro no FFmpeg:\n{e}\n")
+        print("Segmentos preservados (cada um é reproduzível):")
+        for p in video_parts + audio_parts:
+            print(f"  {p}")
+        return
+
+    if not KEEP_TEMP:
+        for p in temps:
+            try:
+                if p.exists(): p.unlink()
+            except Exception as e:
+                print(f"Aviso: não foi possível remover {p}: {e}")
+    print(f"\nVídeo salvo em: {out_mp4}")
+
 def main():
     outdir = Path(OUTPUT_DIR); outdir.mkdir(parents=True, exist_ok=True)
     ffmpeg = find_ffmpeg()
     ffprobe = find_ffprobe()
 
+    print("Procurando dispositivos de áudio...")
     loopback = find_loopback_device()
     if not loopback:
         print("ERRO: nenhum dispositivo de loopback encontrado.")
         return
 
+    source = HubSubscriber(CAPTURE_HUB) if CAPTURE_HUB else None
+    regions = source.regions if source is not None else parse_regions(MONITOR_REGIONS, MONITOR_REGION)
+    multi = len(regions) > 1
+
     use_nvenc = pick_nvenc()
-    qprof = quality_profile(QUALITY_MODE, use_nvenc)
+    quality_mode = QUALITY_MODE
+    if quality_mode == "auto":
+        quality_mode, qprof = auto_quality_profile(ffmpeg, use_nvenc, regions[0], FPS)
+    else:
+        qprof = quality_profile(quality_mode, use_nvenc)
 
     ts = time.strftime("%d-%m-%Y_%H-%M")   # ex.: 07-09-2025_17-13
     base = f"video_{ts}"
@@ -257,48 +1023,116 @@ def main():
     tmp_audio = outdir / f"temp_{base}.wav"
     out_mp4   = outdir / f"{base}.mp4"
 
+    segment_sec = SEGMENT_SEC if STREAM_ENCODE else 0
+    if SEGMENT_SEC and not STREAM_ENCODE:
+        print("Aviso: SEGMENT_SEC requer STREAM_ENCODE; gravando em arquivo único.")
+    if segment_sec and multi:
+        # inclui o hub com várias ROIs: o modo segmentado grava uma ROI só
+        origem = f"o hub '{CAPTURE_HUB}'" if source is not None else "MONITOR_REGIONS"
+        print(f"Aviso: SEGMENT_SEC não é suportado com várias ROIs ({origem} tem {len(regions)});"
+              f" gravando em arquivo único.")
+        segment_sec = 0
+    if multi:
+        tmp_videos = [outdir / f"temp_{base}_roi{i}.mp4" for i in range(len(regions))]
+        out_mp4s = [outdir / f"{base}_roi{i}.mp4" for i in range(len(regions))]
+    else:
+        tmp_videos, out_mp4s = [tmp_video], [out_mp4]
+
+    tmp_ts    = outdir / f"temp_{base}_ts.npz"
+    sync_log = SyncLog()
+
     # Inicia áudio
-    rec = AudioRecorder(tmp_audio, loopback, samplerate=AUDIO_SAMPLERATE)
+    mics = find_microphones(EXTRA_MICS, samplerate=AUDIO_SAMPLERATE, gain=EXTRA_MIC_GAIN)
+    rec = AudioRecorder(tmp_audio, loopback, samplerate=AUDIO_SAMPLERATE, segment_sec=segment_sec,
+                        sync_log=sync_log, sources=mics)
+    reporter = MetricsReporter(path=outdir / f"{base}_metrics.jsonl" if METRICS_JSONL else None,
+                               port=METRICS_PORT)
     rec.start()
 
-    print(f"Config: Encoder: {'NVENC' if use_nvenc else 'x264'} | Qualidade: {QUALITY_MODE} | FPS: {FPS}")
-    print(f"Saída: {out_mp4}")
+    print(f"Config: Encoder: {'NVENC' if use_nvenc else 'x264'} | Qualidade: {quality_mode} | FPS: {FPS}"
+          f" | Streaming: {'on' if STREAM_ENCODE else 'off'}"
+          f" | Segmentos: {f'{segment_sec}s' if segment_sec else 'off'}")
+    print(f"Saída: {', '.join(str(p) for p in out_mp4s)}")
 
     # Vídeo (CFR)
-    v0 = record_video(MONITOR_REGION, FPS, tmp_video)
+    try:
+        if segment_sec:
+            v0 = record_video(regions[0], FPS, outdir / f"temp_{base}_v%03d.mp4",
+                              ffmpeg=ffmpeg, qprof=qprof, segment_sec=segment_sec,
+                              on_first_frame=rec.set_segment_origin, sync_log=sync_log,
+                              source=source)
+        elif STREAM_ENCODE:
+            v0 = record_video(regions, FPS, tmp_videos, ffmpeg=ffmpeg, qprof=qprof,
+                              sync_log=sync_log, source=source)
+        else:
+            v0 = record_video(regions, FPS, tmp_videos, sync_log=sync_log, source=source)
+    except (RuntimeError, ValueError) as e:
+        # qualquer falha antes/durante a captura: o áudio já está gravando e precisa parar
+        rec.stop()
+        reporter.close()
+        if source is not None:
+            source.close()
+        print(f"\n❌ Erro na gravação do vídeo:\n{e}\n")
+        return
 
     # Para áudio
+    if source is not None:
+        source.close()
     rec.stop()
+    reporter.close()
     a0 = rec.start_ts or time.perf_counter()
+    print(rec.summary())
+    print(METRICS.summary())
+
+    # Sincronia: offset (convenção de mux_ffmpeg: >0 atrasa o áudio) e drift
+    sync_log.save(tmp_ts)
+    sync = estimate_sync(sync_log, AUDIO_SAMPLERATE, FPS)
+    if sync is not None:
+        audio_start, video_start, audio_rate = sync
+        offset = audio_start - video_start
+        drift_ratio = audio_rate / AUDIO_SAMPLERATE
+    else:
+        audio_start, video_start = a0, (v0 or a0)
+        offset = audio_start - video_start
+        drift_ratio = None
+    print(f"Offset medido (audio - vídeo): {offset:+.4f}s"
+          f" | Drift do áudio: {((drift_ratio or 1.0) - 1.0) * 1e6:+.1f} ppm")
+    for path, region in zip(out_mp4s, regions):
+        save_session_info(path.with_suffix(".json"), video_start, audio_start, offset, FPS, region)
+
+    if segment_sec:
+        finish_segments(ffmpeg, ffprobe, outdir, base, rec, out_mp4, sync, offset,
+                        drift_ratio, qprof, extra_temps=(tmp_ts,))
+        return
 
     # Sanidade
-    if not tmp_video.exists() or tmp_video.stat().st_size == 0:
-        print(f"ERRO: vídeo temporário vazio: {tmp_video}"); return
+    for tmp_video in tmp_videos:
+        if not tmp_video.exists() or tmp_video.stat().st_size == 0:
+            print(f"ERRO: vídeo temporário vazio: {tmp_video}"); return
     if not tmp_audio.exists() or tmp_audio.stat().st_size == 0:
         print(f"ERRO: áudio temporário vazio: {tmp_audio}"); return
 
-    # Offset e mux
-    offset = (v0 or a0) - a0
-    print(f"Offset medido (video - audio): {offset:+.4f}s")
-
+    # Mux (um MP4 por ROI, todos com o mesmo áudio e o mesmo offset)
     try:
-        mux_ffmpeg(ffmpeg, tmp_video, tmp_audio, out_mp4,
-                   FPS, AUDIO_SAMPLERATE, AUDIO_BITRATE, offset, qprof)
-        verify_audio(ffprobe, out_mp4)
+        for tmp_video, out_mp4 in zip(tmp_videos, out_mp4s):
+            mux_ffmpeg(ffmpeg, tmp_video, tmp_audio, out_mp4,
+                       FPS, AUDIO_SAMPLERATE, AUDIO_BITRATE, offset, qprof,
+                       copy_video=STREAM_ENCODE, drift_ratio=drift_ratio)
+            verify_audio(ffprobe, out_mp4)
         print("Junção de áudio e vídeo concluída! ✅")
     except Exception as e:
         print(f"\n❌ Erro no FFmpeg:\n{e}\n")
-        print(f"Temporários preservados:\n  {tmp_video}\n  {tmp_audio}")
+        print("Temporários preservados:\n  " + "\n  ".join(str(p) for p in tmp_videos + [tmp_audio]))
         return
-    finally:
-        if not KEEP_TEMP:
-            for p in (tmp_video, tmp_audio):
-                try:
-                    if p.exists(): p.unlink()
-                except Exception as e:
-                    print(f"Aviso: não foi possível remover {p}: {e}")
+    if not KEEP_TEMP:
+        for p in tmp_videos + [tmp_audio, tmp_ts]:
+            try:
+                if p.exists(): p.unlink()
+            except Exception as e:
+                print(f"Aviso: não foi possível remover {p}: {e}")
 
-    print(f"\nVídeo salvo em: {out_mp4}")
+    for out_mp4 in out_mp4s:
+        print(f"\nVídeo salvo em: {out_mp4}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+import json, time, threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+
+# ========================= CONFIG =========================
+# Limites (s) dos buckets dos histogramas de tempo: 50 µs .. 2 s, escala ~x2
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.004, 0.008,
+                0.016, 0.033, 0.066, 0.1, 0.25, 0.5, 1.0, 2.0)
+METRICS_INTERVAL = 1.0   # período (s) do snapshot em JSON lines
+METRICS_HOST = "127.0.0.1"
+METRICS_PREFIX = "captura_"
+
+# ========================= Métricas =========================
+class Histogram:
+    """Histograma de buckets fixos (estilo Prometheus) para tempos por etapa.
+
+    `observe` é só um `bisect` + dois incrementos (sem lock, sem alocação), para
+    poder ficar ligado a 60 fps. Cada histograma deve ter um único produtor
+    (a thread da etapa); o leitor (snapshot) tolera ver um valor intermediário.
+    """
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+        if v > self.max:
+            self.max = v
+
+    def quantile(self, q: float) -> float:
+        """Estimativa pelo limite superior do bucket que contém o quantil."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return dict(count=self.count, sum=self.sum, max=self.max,
+                    p50=self.quantile(0.5), p99=self.quantile(0.99))
+
+
+class Metrics:
+    """Registro de métricas compartilhado por gravadores e detector.
+
+    - `histogram(nome)`: tempos por etapa (grab, convert, write, inference...);
+      obter o objeto uma vez fora do loop e chamar só `observe` no caminho quente.
+    - `inc(nome, n)`: contadores (frames duplicados, descartados...).
+    - `gauge(nome, fn)`: valores lidos só no snapshot (ex.: profundidade de
+      fila, overruns já contados pelo próprio objeto), custo zero no loop.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, buckets=TIME_BUCKETS) -> Histogram:
+        with self._lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = Histogram(buckets)
+            return h
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, fn: Callable[[], float]):
+        with self._lock:
+            self.gauges[name] = fn
+
+    def reset(self):
+        """Zera tudo (ex.: entre cenários do bench.py); histogramas já obtidos
+        por quem ainda está rodando deixam de ser exportados."""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def _read_gauges(self) -> dict:
+        out = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                out[name] = float(fn())
+            except Exception:
+                pass
+        return out
+
+    def snapshot(self) -> dict:
+        return dict(ts=time.time(),
+                    counters=dict(self.counters),
+                    gauges=self._read_gauges(),
+                    histograms={k: h.snapshot() for k, h in list(self.histograms.items())})
+
+    def prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Exposição em texto no formato do Prometheus (0.0.4)."""
+        lines = []
+        for name, v in sorted(self.counters.items()):
+            lines += [f"# TYPE {prefix}{name} counter", f"{prefix}{name} {v}"]
+        for name, v in sorted(self._read_gauges().items()):
+            lines += [f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {v:g}"]
+        for name, h in sorted(self.histograms.items()):
+            n = prefix + name
+            lines.append(f"# TYPE {n} histogram")
+            acc = 0
+            for le, c in zip(h.bounds, h.counts):
+                acc += c
+                lines.append(f'{n}_bucket{{le="{le:g}"}} {acc}')
+            lines.append(f'{n}_bucket{{le="+Inf"}} {h.count}')
+            lines += [f"{n}_sum {h.sum:.9g}", f"{n}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Resumo legível (ms) dos histogramas, para o print do fim da sessão."""
+        parts = []
+        for name, h in sorted(self.histograms.items()):
+            if h.count:
+                parts.append(f"{name}: média {1000.0 * h.sum / h.count:.2f}ms"
+                             f" p99 {1000.0 * h.quantile(0.99):.2f}ms máx {1000.0 * h.max:.2f}ms")
+        return "\n".join(parts)
+
+
+# Registro global do processo (cada script publica no mesmo)
+METRICS = Metrics()
+
+
+# ========================= Exportação =========================
+class MetricsReporter:
+    """Exporta METRICS em segundo plano: JSON lines em arquivo e/ou HTTP local.
+
+    O arquivo recebe um snapshot a cada `interval` s (thread própria, fora do
+    caminho quente); com `port`, `GET /metrics` devolve o texto do Prometheus.
+    """
+    def __init__(self, metrics: Metrics = METRICS, path: Optional[Path] = None,
+                 port: int = 0, interval: float = METRICS_INTERVAL, host: str = METRICS_HOST):
+        self.metrics = metrics
+        self.path = Path(path) if path else None
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+        if port:
+            self._server = ThreadingHTTPServer((host, port), self._handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"Métricas: http://{host}:{port}/metrics")
+        if self.path is not None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _write(self, f):
+        f.write(json.dumps(self.metrics.snapshot()) + "\n")
+        f.flush()
+
+    def _loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while not self._stop.wait(self.interval):
+                self._write(f)
+            self._write(f)  # snapshot final
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
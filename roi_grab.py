@@ -0,0 +1,76 @@
+import time
+from typing import List, Optional
+
+import numpy as np
+import mss
+
+# ========================= Captura de várias ROIs =========================
+def bgra_view(shot) -> np.ndarray:
+    """View numpy (H, W, 4) BGRA sobre o buffer do ScreenShot do mss, sem cópia."""
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+
+def union_region(regions) -> dict:
+    """Menor retângulo (formato do mss) que contém todas as ROIs."""
+    left = min(r["left"] for r in regions)
+    top = min(r["top"] for r in regions)
+    right = max(r["left"] + r["width"] for r in regions)
+    bottom = max(r["top"] + r["height"] for r in regions)
+    return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+
+class RoiGrabber:
+    """Captura várias ROIs com um único `grab` da união por tick.
+
+    Cada ROI é devolvida como view numpy (H, W, 4) BGRA sobre o buffer do grab,
+    sem cópia: o custo do grab depende da área da união, não do nº de ROIs.
+    As views não são contíguas (passo de linha da união); quem precisa de um
+    buffer contíguo (encoder, modelo) copia para o próprio buffer, como já faz.
+    Com uma ROI só, a união é a própria ROI e nada muda.
+
+    Interface comum das fontes de frames (`grab`, `regions`, `t_capture`,
+    `fresh`, `close`), também implementada por `captura_hub.HubSubscriber`:
+    `grab` devolve None quando a fonte acabou; `fresh` diz se o último `grab`
+    trouxe um frame novo (False = repetiu o anterior, `t_capture` antigo).
+    """
+    def __init__(self, regions, sct=None):
+        self.regions = [dict(r) for r in regions]
+        if not self.regions:
+            raise ValueError("nenhuma ROI")
+        self.union = union_region(self.regions)
+        self.sct = sct if sct is not None else mss.mss()
+        self.t_capture = None  # perf_counter do último grab
+        self.fresh = True      # todo grab próprio é um frame novo
+        ul, ut = self.union["left"], self.union["top"]
+        self._slices = [(slice(r["top"] - ut, r["top"] - ut + r["height"]),
+                         slice(r["left"] - ul, r["left"] - ul + r["width"]))
+                        for r in self.regions]
+
+    @property
+    def coverage(self) -> float:
+        """Fração da união coberta pelas ROIs (baixa = ROIs distantes, grab desperdiçado)."""
+        area = sum(r["width"] * r["height"] for r in self.regions)
+        return min(1.0, area / max(1, self.union["width"] * self.union["height"]))
+
+    def views(self, bgra: np.ndarray) -> List[np.ndarray]:
+        """Fatia um frame da união nas ROIs (views, sem cópia)."""
+        return [bgra[ys, xs] for ys, xs in self._slices]
+
+    def grab(self) -> Optional[List[np.ndarray]]:
+        shot = self.sct.grab(self.union)
+        self.t_capture = time.perf_counter()
+        return self.views(bgra_view(shot))
+
+    def close(self):
+        close = getattr(self.sct, "close", None)
+        if close is not None:
+            close()
+
+
+def parse_regions(regions, default: Optional[dict] = None) -> list:
+    """Lista de ROIs a partir da config (`[]` / None = só a ROI padrão)."""
+    if not regions:
+        return [default] if default is not None else []
+    if isinstance(regions, dict):
+        return [regions]
+    return list(regions)
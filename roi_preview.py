@@ -1,41 +1,67 @@
 import cv2
-import numpy as np
 from mss import mss
 
+from roi_grab import RoiGrabber, parse_regions
+from captura_hub import HubSubscriber
+
 monitor = {'left': 469, 'top': 123, 'width': 511, 'height': 889}
+# Várias ROIs (uma janela para cada, um único grab da união por quadro); vazio = só `monitor`
+monitors = []
+# Nome de um captura_hub.py rodando: o preview lê o stream reduzido do hub
+# (sem grab próprio, sem competir com a gravação). None = grab próprio.
+hub = None  # ex.: "captura_metaglass_hub"
 
-with mss() as sct:
-    win = "Preview da area capturada (Q sai | M reposiciona)"
-    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+preview_max_w = 700
 
-    img0 = np.array(sct.grab(monitor))              # BGRA
-    frame0 = cv2.cvtColor(img0, cv2.COLOR_BGRA2BGR) # -> BGR
+with mss() as sct:
+    if hub:
+        source = HubSubscriber(hub, preview=True)  # já vem em BGR, reduzido e com FPS limitado
+        regions = source.regions
+        frames0 = [f.copy() for f in source.wait_newer()]
+    else:
+        regions = parse_regions(monitors, monitor)
+        source = RoiGrabber(regions, sct)
+        imgs0 = source.grab()                                             # BGRA (views, sem cópia)
+        frames0 = [cv2.cvtColor(img, cv2.COLOR_BGRA2BGR) for img in imgs0]  # -> BGR (buffers reaproveitados no loop)
+    wins = [f"Preview da area capturada {i} (Q sai | M reposiciona)" if len(regions) > 1
+            else "Preview da area capturada (Q sai | M reposiciona)" for i in range(len(regions))]
 
-    preview_max_w = 700
-    scale = min(1.0, preview_max_w / frame0.shape[1])
-    w = int(frame0.shape[1] * scale)
-    h = int(frame0.shape[0] * scale)
-    cv2.resizeWindow(win, w, h)  
+    sizes = []
+    for win, frame0 in zip(wins, frames0):
+        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+        scale = min(1.0, preview_max_w / frame0.shape[1])
+        w = int(frame0.shape[1] * scale)
+        h = int(frame0.shape[0] * scale)
+        cv2.resizeWindow(win, w, h)
+        sizes.append((w, h))
 
-    
     virtual = sct.monitors[0]
     margin = 20
 
     def place_safely():
-        x = monitor["left"] + monitor["width"] + margin
-        y = monitor["top"]
-        if x + w > virtual["left"] + virtual["width"]:
-            x = monitor["left"] - w - margin
-        if x < virtual["left"]:
-            x, y = virtual["left"] + margin, virtual["top"] + margin
-        cv2.moveWindow(win, x, y)
+        for win, region, (w, h) in zip(wins, regions, sizes):
+            x = region["left"] + region["width"] + margin
+            y = region["top"]
+            if x + w > virtual["left"] + virtual["width"]:
+                x = region["left"] - w - margin
+            if x < virtual["left"]:
+                x, y = virtual["left"] + margin, virtual["top"] + margin
+            cv2.moveWindow(win, x, y)
 
     place_safely()
 
     while True:
-        img = np.array(sct.grab(monitor))                # BGRA
-        frame = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)    # -> BGR
-        cv2.imshow(win, frame)
+        if hub:
+            frames = source.wait_newer(timeout=0.05)  # None = nada novo (ou hub encerrado)
+            if frames is None and source.closed:
+                break
+        else:
+            imgs = source.grab()                                          # BGRA (views, sem cópia)
+            frames = [cv2.cvtColor(img, cv2.COLOR_BGRA2BGR, dst=frame0)   # -> BGR
+                      for img, frame0 in zip(imgs, frames0)]
+        if frames is not None:
+            for win, frame in zip(wins, frames):
+                cv2.imshow(win, frame)
 
         k = cv2.waitKey(1) & 0xFF
         if k == ord('q'):
@@ -44,4 +70,7 @@ with mss() as sct:
             # Reposiciona fora da ROI se quiser (atalho)
             place_safely()
 
-cv2.destroyAllWindows()
\ No newline at end of file
+    if hub:
+        source.close()
+
+cv2.destroyAllWindows()
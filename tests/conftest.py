@@ -0,0 +1,12 @@
+import sys, types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Sem desktop/áudio (ex.: Linux headless) `soundcard`/`mss` podem nem importar;
+# os testes não abrem dispositivos, então basta que os módulos existam (como no bench.py).
+for _mod in ("soundcard", "mss"):
+    try:
+        __import__(_mod)
+    except Exception:
+        sys.modules[_mod] = types.ModuleType(_mod)
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from captura_replay import AnnexBSplitter
+
+
+def nal(nal_type, size=20, zeros=b"\x00\x00\x00\x01"):
+    return zeros + bytes([0x60 | nal_type]) + b"\xab" * size
+
+
+def gop(n_frames, short_start=False):
+    # SPS + PPS + IDR + P-slices; start codes de 3 bytes também são válidos
+    z = b"\x00\x00\x01" if short_start else b"\x00\x00\x00\x01"
+    out = nal(7) + nal(8) + nal(5, 100, z)
+    for _ in range(n_frames - 1):
+        out += nal(1, 30, z)
+    return out
+
+
+def split(stream, sizes):
+    gops = []
+    sp = AnnexBSplitter(lambda data, n: gops.append((data, n)))
+    pos = 0
+    while pos < len(stream):
+        n = next(sizes)
+        sp.feed(stream[pos:pos + n])
+        pos += n
+    sp.flush()
+    return gops
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 4, 5, 77, 4096, 1 << 20])
+def test_gops_independent_of_chunk_boundaries(chunk):
+    frames = [30, 30, 12, 30, 1, 30]
+    stream = b"".join(gop(n, short_start=i % 2) for i, n in enumerate(frames))
+    gops = split(stream, iter(lambda: chunk, None))
+    assert [n for _, n in gops] == frames
+    assert b"".join(d for d, _ in gops) == stream
+    # cada GOP começa no SPS que precede o IDR
+    assert all(d[d.index(b"\x00\x00\x01") + 3] & 0x1F == 7 for d, _ in gops)
+
+
+def test_random_chunks():
+    rng = random.Random(1234)
+    frames = [rng.randint(1, 60) for _ in range(20)]
+    stream = b"".join(gop(n) for n in frames)
+    gops = split(stream, iter(lambda: rng.randint(1, 200), None))
+    assert [n for _, n in gops] == frames
+    assert b"".join(d for d, _ in gops) == stream
+
+
+def test_flush_counts_trailing_frame_and_ignores_empty():
+    gops = []
+    sp = AnnexBSplitter(lambda data, n: gops.append((data, n)))
+    sp.flush()
+    assert gops == []
+    # o último slice termina no fim do buffer, sem start code depois
+    sp.feed(gop(3))
+    sp.flush()
+    assert [n for _, n in gops] == [3]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from captura_video import StaticFrameDetector
+
+
+def _frame(value=0):
+    return np.full((64, 48, 4), value, dtype=np.uint8)
+
+
+def test_static_until_max_gap_then_releases_a_real_frame():
+    det = StaticFrameDetector((64, 48, 4), step=8, threshold=8, max_gap=3)
+    frame = _frame(100)
+    results = [det.is_static(frame) for _ in range(9)]
+    # 1º frame é sempre real; depois max_gap estáticos e um real, em ciclo
+    assert results == [False, True, True, True, False, True, True, True, False]
+
+
+def test_threshold_and_reference_update():
+    det = StaticFrameDetector((64, 48, 4), step=8, threshold=8, max_gap=30)
+    assert not det.is_static(_frame(100))
+    assert det.is_static(_frame(108))      # diferença == threshold: estático
+    assert not det.is_static(_frame(109))  # acima: frame real, vira a nova referência
+    assert det.is_static(_frame(115))      # comparado com 109, não com 100
+
+
+def test_change_outside_the_sample_grid_is_caught_by_max_gap():
+    det = StaticFrameDetector((64, 48, 4), step=8, threshold=8, max_gap=2)
+    base = _frame(0)
+    assert not det.is_static(base)
+    changed = base.copy()
+    changed[3, 5] = 255  # fora da amostra [::8, ::8]
+    assert det.is_static(changed)
+    assert det.is_static(changed)
+    assert not det.is_static(changed)  # max_gap atingido: a mudança sai mesmo assim
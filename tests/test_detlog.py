@@ -0,0 +1,58 @@
+import queue
+
+import numpy as np
+
+from yolo_roi_detect import DetectionLog, load_detections
+
+
+def _boxes(n, cls=0):
+    return (np.zeros((n, 4), np.float32), np.full(n, cls, np.int64), np.ones(n, np.float32))
+
+
+def test_gap_rows_and_counts(tmp_path):
+    log = DetectionLog(tmp_path / "log", dict(names={0: "person"}), chunk_rows=4, flush_sec=10)
+    log.append(0.0, 0, *_boxes(3))
+    log.append(0.1, 1, *_boxes(0))           # frame sem detecções -> linha cls=-1
+    log.append(0.2, 2, *_boxes(6, cls=2))    # atravessa o limite do chunk
+    log.close()
+
+    rows, meta = load_detections(tmp_path / "log")
+    assert meta["names"] == {0: "person"}
+    assert log.rows == len(rows) == 10
+    assert log.detections == 9 == int((rows["cls"] >= 0).sum())
+    gap = rows[rows["frame"] == 1]
+    assert len(gap) == 1 and gap["cls"][0] == -1 and gap["conf"][0] == 0.0
+    assert rows["frame"].tolist() == [0, 0, 0, 1] + [2] * 6
+    assert sorted(p.name for p in (tmp_path / "log").glob("chunk_*.npy")) == \
+        ["chunk_000000.npy", "chunk_000001.npy", "chunk_000002.npy"]
+
+
+class RacyQueue(queue.Queue):
+    """Simula o `append` enchendo um buffer entre o timeout do writer e o lock."""
+    def __init__(self, on_timeout):
+        super().__init__()
+        self.on_timeout = on_timeout
+
+    def get(self, block=True, timeout=None):
+        if self.on_timeout is not None:
+            hook, self.on_timeout = self.on_timeout, None
+            hook()
+            raise queue.Empty
+        return super().get(block, timeout)
+
+
+def test_partial_flush_keeps_chunk_order(tmp_path):
+    log = DetectionLog(tmp_path / "log", {}, chunk_rows=4, flush_sec=10)
+    log.close()  # para a thread; o loop do writer roda abaixo, na thread do teste
+
+    def fill_during_timeout():
+        for frame in range(6):  # 4 linhas enchem um buffer (vai para _full), 2 ficam parciais
+            log.append(float(frame), frame, *_boxes(1))
+        log._closing = True
+
+    log._closing = False
+    log._full = RacyQueue(fill_during_timeout)
+    log._writer_loop()
+
+    rows, _ = load_detections(tmp_path / "log")
+    assert rows["frame"].tolist() == list(range(6))
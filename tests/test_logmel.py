@@ -0,0 +1,46 @@
+import numpy as np
+
+from captura_audio import LogMelTap, load_logmel, logmel_batch
+
+
+class FakeRecorder:
+    samplerate = 16000
+
+    def __init__(self):
+        self.taps = []
+
+    def add_tap(self, tap):
+        self.taps.append(tap)
+
+
+def test_logmel_incremental_matches_batch(tmp_path):
+    rng = np.random.default_rng(0)
+    rec = FakeRecorder()
+    tap = LogMelTap(rec, tmp_path / "logmel", n_fft=400, hop=160, n_mels=40, chunk_frames=7)
+
+    # blocos estéreo de tamanhos aleatórios (menores e maiores que n_fft)
+    blocks = [rng.uniform(-0.5, 0.5, (n, 2)).astype(np.float32)
+              for n in rng.integers(1, 1500, size=60)]
+    t = 100.0
+    for block in blocks:
+        t += len(block) / rec.samplerate
+        tap.on_block(block, t)
+    tap.on_close()
+
+    mono = np.concatenate(blocks).mean(axis=1, dtype=np.float32)
+    ref = logmel_batch(mono, rec.samplerate, n_fft=400, hop=160, n_mels=40)
+    got = load_logmel(tmp_path / "logmel")
+
+    assert tap.frames == len(ref) > 7  # vários chunks
+    assert got.shape == ref.shape
+    assert np.allclose(got, ref, rtol=1e-5, atol=1e-4)
+
+
+def test_logmel_short_signal_has_no_frames(tmp_path):
+    rec = FakeRecorder()
+    tap = LogMelTap(rec, tmp_path / "logmel", n_fft=400, hop=160, n_mels=40)
+    tap.on_block(np.zeros((100, 1), dtype=np.float32), 1.0)
+    tap.on_close()
+    assert tap.frames == 0
+    assert load_logmel(tmp_path / "logmel").shape == (0, 0)
+    assert logmel_batch(np.zeros(100), 16000, n_fft=400, n_mels=40).shape == (0, 40)
@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+
+from captura_audio import AudioSource
+
+
+def make_source(sr=48000, received_sec=1.0, last_ts=100.0):
+    # estado como se o microfone já tivesse entregue `received_sec` de tom constante
+    src = AudioSource(device="fake", samplerate=sr)
+    n = int(received_sec * sr)
+    src._buf[:n] = 0.5
+    src._written = n
+    src._last_ts = last_ts
+    src.is_recording = True
+    return src
+
+
+def test_read_ahead_of_mic_does_not_wait():
+    src = make_source()
+    out = np.empty(1024, np.float32)
+    t = time.perf_counter()
+    # bloco do loopback termina 10 ms depois da última chegada do microfone
+    src.read(1024, 100.0 + 0.010, out)
+    assert time.perf_counter() - t < 0.05
+    short = int(0.010 * 48000)
+    assert np.all(out[:1024 - short - 1] == 0.5)
+    assert np.all(out[1024 - short + 1:] == 0.0)   # o que não chegou sai como silêncio
+    assert src.underruns == 1
+
+
+def test_read_behind_mic_is_complete():
+    src = make_source()
+    out = np.empty(1024, np.float32)
+    src.read(1024, 100.0 - 0.1, out)
+    assert np.all(out == 0.5)
+    assert src.underruns == 0
+    assert "correção" in src.summary()
+
+
+def test_dead_source_reads_silence():
+    src = make_source()
+    src.dead = True
+    out = np.ones(256, np.float32)
+    src.read(256, 100.0, out)
+    assert np.all(out == 0.0)
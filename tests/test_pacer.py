@@ -0,0 +1,61 @@
+import types
+
+import pytest
+
+import captura_video
+from captura_video import FramePacer
+
+
+class FakeClock:
+    """perf_counter/sleep determinísticos; cada leitura avança `tick_sec` (o spin termina)."""
+    def __init__(self, t=1000.0, tick_sec=1e-6):
+        self.t = t
+        self.tick_sec = tick_sec
+        self.slept = []
+
+    def perf_counter(self):
+        self.t += self.tick_sec
+        return self.t
+
+    def sleep(self, dt):
+        self.slept.append(dt)
+        self.t += dt
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(captura_video, "time", types.SimpleNamespace(
+        perf_counter=c.perf_counter, sleep=c.sleep))
+    return c
+
+
+def test_on_time_ticks_hit_deadlines(clock):
+    pacer = FramePacer(fps=50, spin_sec=0.002)
+    pacer.start()
+    for k in range(10):
+        assert pacer.wait() == 0
+        assert clock.t == pytest.approx(pacer.t0 + k * pacer.period, abs=1e-4)
+    assert pacer.tick == 10
+    assert max(pacer.lateness) < 1e-4
+    # dorme até spin_sec antes do deadline e faz spin no resto
+    assert all(dt == pytest.approx(pacer.period - 0.002, abs=1e-4) for dt in clock.slept[1:])
+
+
+def test_late_capture_reports_missed_ticks(clock):
+    pacer = FramePacer(fps=50, spin_sec=0.0)
+    pacer.start()
+    assert pacer.wait() == 0            # tick 0, no prazo
+    clock.t += 2.5 * pacer.period       # captura lenta: passa do deadline do tick 1 em 1,5 período
+    assert pacer.wait() == 1            # tick 1 (atrasado) + tick 2 perdido
+    assert pacer.tick == 3
+    assert pacer.lateness[-1] == pytest.approx(0.5 * pacer.period, abs=1e-4)
+    assert pacer.wait() == 0            # volta a esperar o deadline do tick 3
+    assert clock.t == pytest.approx(pacer.t0 + 3 * pacer.period, abs=1e-4)
+
+
+def test_summary():
+    pacer = FramePacer(fps=30)
+    assert pacer.summary() == "Atraso por tick: -"
+    pacer.lateness.extend([0.001, 0.003])
+    assert "médio 2.00ms" in pacer.summary() and "máx 3.00ms" in pacer.summary()
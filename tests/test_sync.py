@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import captura_video
+from captura_video import SyncLog, audio_sync_filter, estimate_sync, mux_ffmpeg
+
+SR, FPS = 48000, 30
+
+
+def _synthetic_log(seconds=90.0, ppm=120.0, audio_start=10.0, video_start=10.25, seed=0):
+    """Áudio com clock `ppm` acima do nominal e latência de chegada aleatória (>= 0)."""
+    rng = np.random.default_rng(seed)
+    log = SyncLog()
+    rate = SR * (1 + ppm * 1e-6)
+    block = 480
+    n_blocks = int(seconds * SR / block)
+    n = np.arange(1, n_blocks + 1) * block
+    jitter = rng.uniform(0.0, 0.004, n_blocks)
+    jitter[::50] = 0.0  # algumas chegadas com latência mínima (envelope inferior)
+    log.audio_t.extend((audio_start + n / rate + jitter).tolist())
+    log.audio_n.extend(n.tolist())
+    k = np.arange(int(seconds * FPS))
+    vj = rng.uniform(0.0, 0.003, len(k))
+    vj[::20] = 0.0
+    log.video_t.extend((video_start + k / FPS + vj).tolist())
+    log.video_k.extend(k.tolist())
+    return log
+
+
+def test_estimate_sync_recovers_drift_and_starts():
+    a0, v0, ppm = 10.0, 10.25, 120.0
+    audio_start, video_start, rate = estimate_sync(_synthetic_log(ppm=ppm, audio_start=a0,
+                                                                  video_start=v0), SR, FPS)
+    assert (rate / SR - 1) * 1e6 == pytest.approx(ppm, abs=2.0)
+    assert audio_start == pytest.approx(a0, abs=2e-4)
+    assert video_start == pytest.approx(v0, abs=1e-6)
+    # convenção do mux: offset = audio - vídeo < 0 => áudio começou antes, atrasa o vídeo
+    assert audio_start - video_start == pytest.approx(a0 - v0, abs=2e-4)
+
+
+def test_estimate_sync_keeps_nominal_rate_on_short_or_implausible_logs():
+    _, _, rate = estimate_sync(_synthetic_log(seconds=5.0), SR, FPS)
+    assert rate == SR  # menos que SYNC_MIN_SEC: sem estimativa de drift
+    _, _, rate = estimate_sync(_synthetic_log(ppm=5000.0), SR, FPS)
+    assert rate == SR  # acima de SYNC_MAX_PPM: descartado
+    assert estimate_sync(SyncLog(), SR, FPS) is None
+
+
+def test_audio_sync_filter_direction():
+    # áudio rápido (ratio > 1): mais amostras por segundo real que o nominal,
+    # então a saída precisa de MENOS amostras (aresample para uma taxa menor)
+    ratio = 1 + 100e-6
+    f = audio_sync_filter(SR, ratio)
+    assert f == f"asetrate={SR * 16},aresample={round(SR * 16 / ratio)}:first_pts=0,asetrate={SR}"
+    a, b = SR * 16, round(SR * 16 / ratio)
+    assert b < a and (a / b - 1) * 1e6 == pytest.approx(100.0, abs=1.5)
+
+    slow = audio_sync_filter(SR, 1 - 100e-6)
+    assert int(slow.split("aresample=")[1].split(":")[0]) > SR * 16
+
+    assert audio_sync_filter(SR, None) == "aresample=async=1:first_pts=0"
+    assert audio_sync_filter(SR, 1.0) == "aresample=first_pts=0"
+
+
+@pytest.mark.parametrize("offset, delayed", [(0.5, "audio"), (-0.5, "video")])
+def test_mux_offset_sign(monkeypatch, tmp_path, offset, delayed):
+    seen = {}
+
+    class Proc:
+        returncode = 0
+        stdout = ""
+
+    def fake_run(cmd, **kw):
+        seen["cmd"] = cmd
+        return Proc()
+
+    monkeypatch.setattr(captura_video.subprocess, "run", fake_run)
+    v, a = tmp_path / "v.mp4", tmp_path / "a.wav"
+    mux_ffmpeg("ffmpeg", v, a, tmp_path / "o.mp4", FPS, SR, "320k", offset,
+               dict(codec="libx264", pix="yuv420p", opts=[]), copy_video=True)
+    cmd = seen["cmd"]
+    i = cmd.index("-itsoffset")
+    assert cmd[i + 1] == "0.500000"
+    assert cmd[i + 3] == str(a if delayed == "audio" else v)  # -itsoffset vale para o input seguinte
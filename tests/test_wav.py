@@ -0,0 +1,86 @@
+import struct
+import wave
+
+import numpy as np
+
+from captura_audio import MmapWavWriter
+
+
+def _pcm(n, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-32768, 32767, (n, channels), dtype=np.int16)
+
+
+def _read_wave(path):
+    with wave.open(str(path), "rb") as wf:
+        params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate())
+        data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    return params, data.reshape(-1, params[0])
+
+
+def test_roundtrip_with_wave(tmp_path):
+    path = tmp_path / "a.wav"
+    pcm = _pcm(20000)
+    wf = MmapWavWriter(path, 48000, 2, extent_mb=0)  # extent mínimo: cruza vários mmaps
+    for part in np.array_split(pcm, 7):
+        wf.writeframes(part)
+    wf.close()
+    params, data = _read_wave(path)
+    assert params == (2, 2, 48000)
+    assert np.array_equal(data, pcm)
+
+
+def test_header_valid_before_close(tmp_path):
+    # commit a cada 800 frames: o que passou do último commit fica de fora
+    path = tmp_path / "crash.wav"
+    pcm = _pcm(1300)
+    wf = MmapWavWriter(path, 8000, 2, commit_sec=0.1)
+    wf.writeframes(pcm[:1000])  # >= 800 frames: commit
+    wf.writeframes(pcm[1000:])  # 300 frames: ainda sem commit
+    params, data = _read_wave(path)  # como se o processo tivesse caído aqui
+    assert params == (2, 2, 8000)
+    assert np.array_equal(data, pcm[:1000])
+    wf.close()
+
+
+def test_switches_to_rf64(tmp_path, monkeypatch):
+    monkeypatch.setattr(MmapWavWriter, "RF64_THRESHOLD", 4000)
+    path = tmp_path / "big.wav"
+    pcm = _pcm(3000)  # 12000 bytes de dados > limite
+    wf = MmapWavWriter(path, 48000, 2)
+    wf.writeframes(pcm[:500])
+    assert path.read_bytes()[:4] == b"RIFF"  # ainda abaixo do limite
+    wf.writeframes(pcm[500:])
+    wf.close()
+
+    raw = path.read_bytes()
+    data_bytes = pcm.nbytes
+    assert raw[:4] == b"RF64" and raw[8:12] == b"WAVE"
+    assert struct.unpack("<I", raw[4:8])[0] == 0xFFFFFFFF
+    assert raw[12:16] == b"ds64"
+    size, riff, data, frames, table = struct.unpack("<IQQQI", raw[16:48])
+    assert (size, riff, data, frames, table) == (28, MmapWavWriter.HEADER_SIZE - 8 + data_bytes,
+                                                 data_bytes, len(pcm), 0)
+    assert raw[48:52] == b"fmt "
+    assert raw[72:76] == b"data" and struct.unpack("<I", raw[76:80])[0] == 0xFFFFFFFF
+    assert np.array_equal(np.frombuffer(raw[80:], dtype=np.int16).reshape(-1, 2), pcm)
+
+
+def test_riff_below_threshold(tmp_path):
+    path = tmp_path / "small.wav"
+    wf = MmapWavWriter(path, 48000, 1)
+    wf.writeframes(_pcm(100, channels=1))
+    wf.close()
+    raw = path.read_bytes()
+    assert raw[:4] == b"RIFF" and raw[12:16] == b"JUNK"
+    assert struct.unpack("<I", raw[4:8])[0] == len(raw) - 8
+
+
+def test_close_trims_preallocated_tail(tmp_path):
+    path = tmp_path / "trim.wav"
+    wf = MmapWavWriter(path, 48000, 2, extent_mb=1)
+    wf.writeframes(_pcm(1000))
+    assert path.stat().st_size >= 1024 * 1024  # extent pré-alocado
+    wf.close()
+    assert path.stat().st_size == MmapWavWriter.HEADER_SIZE + 1000 * 4
+    wf.close()  # idempotente
@@ -1,93 +1,985 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
 import cv2
 import numpy as np
 from ultralytics import YOLO
 from mss import mss
-import time
 
-# Load YOLOv8 Nano model
-model = YOLO("yolov8n.pt")
+from metrics import METRICS, MetricsReporter
+from roi_grab import RoiGrabber, parse_regions
+from captura_hub import HubSubscriber
+
+# ========================= CONFIG =========================
+MODEL_PATH = "yolov8n.pt"  # YOLOv8 Nano
+DEVICE = "auto"   # "auto" (cuda if available, else cpu) | "cuda" | "cpu"
+CONF = 0.4
+IOU = 0.7         # NMS threshold (same default as ultralytics)
+
+# Inference backend: "torch" (ultralytics/PyTorch), "openvino" or "onnx" (CPU
+# runtimes; the model is exported once and cached in BACKEND_CACHE, keyed by
+# the .pt hash and input size). "auto": torch on GPU, otherwise the first CPU
+# runtime installed. Compare them with `python yolo_roi_detect.py --bench-backends`.
+BACKEND = "auto"
+BACKEND_CACHE = Path.home() / ".captura_metaglass" / "yolo_export"
+INPUT_SIZE = 640  # long side of the network input; the short side follows the ROI aspect
+INFER_THREADS = 0  # CPU threads for inference (0 = all cores)
 
-# Set up screen capture
-sct = mss()
 monitor = {'left': 469, 'top': 123, 'width': 511, 'height': 889}  # Adjust as needed
+# Several ROIs at once (live mode): the union is grabbed once per tick and each
+# ROI gets its own detector thread and window. Empty = just `monitor`.
+MONITORS = []
+# Read frames from a running captura_hub.py (shared memory) instead of grabbing
+# the screen here; the ROIs then come from the hub. None = own grab.
+CAPTURE_HUB = None  # e.g. "captura_metaglass_hub"
+
+# Live mode: capture, inference and display run on separate threads. Display
+# follows the capture rate with the most recent boxes overlaid; inference
+# always takes the newest frame (no fixed frame skipping, no queue).
+LIVE_FPS = 30
+
+# Motion gating: the full model only runs when enough of the ROI changed since
+# the last inference (or MOTION_MAX_INTERVAL elapsed); in between, the last
+# boxes are moved with sparse optical flow. Check the trade-off on a recording
+# with `python yolo_roi_detect.py --eval-gate video.mp4`.
+MOTION_GATE = True
+MOTION_STEP = 4             # sample 1 of every N pixels per axis
+MOTION_PIXEL_DELTA = 16     # per-channel difference (0-255) counted as "changed"
+MOTION_THRESHOLD = 0.01     # fraction of changed samples that triggers inference
+MOTION_MAX_INTERVAL = 1.0   # seconds; forces a fresh inference at least this often
+TRACK_SCALE = 0.5           # optical flow runs on a downscaled gray frame
+TRACK_GRID = 4              # points per box side tracked by Lucas-Kanade
+
+# Metrics (metrics.py): per-stage timings as JSON lines and/or a local
+# Prometheus endpoint (http://127.0.0.1:<port>/metrics). None / 0 = off.
+METRICS_FILE = None  # e.g. "yolo_metrics.jsonl"
+METRICS_PORT = 0
+
+# Offline mode (`python yolo_roi_detect.py a.mp4 b.mp4 ...`): recordings are
+# decoded in a background thread and fed to the model in batches, at full
+# speed (no display / waitKey); several files run in parallel worker processes.
+OFFLINE_BATCH = 16
+OFFLINE_WORKERS = 2          # files processed concurrently (one model per process)
+OFFLINE_DECODE_QUEUE = 4     # decoded batches buffered ahead of inference
+OFFLINE_OUTPUT_DIR = None    # None = next to each video (<stem>_detections/)
+
+# Detection log: every processed frame is appended to a chunked columnar store
+# (one .npy record array per chunk + meta.json), written by a background thread.
+# Live timestamps are time.perf_counter(), the same clock captura_video.py
+# stores in the <video>.json sidecar (PTS = t - pts_origin). None = off.
+DETLOG_DIR = "detections"
+DETLOG_CHUNK_ROWS = 4096     # rows per chunk file
+DETLOG_FLUSH_SEC = 2.0       # partial chunks are flushed at least this often
+
+
+def resolve_device(device: str = DEVICE) -> str:
+    if device != "auto":
+        return device
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+def input_size(height: int, width: int, long_side: int = INPUT_SIZE, stride: int = 32):
+    """Rectangular network input (h, w) with the ROI aspect, multiples of `stride`.
+
+    For the 511x889 ROI this gives 640x384 instead of 640x640, so ~40% fewer
+    pixels go through the network for the same detail.
+    """
+    r = long_side / max(height, width)
+    h = int(np.ceil(height * r / stride) * stride)
+    w = int(np.ceil(width * r / stride) * stride)
+    return h, w
+
+
+def model_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def export_cached(fmt: str, imgsz, model_path=MODEL_PATH, cache_dir=BACKEND_CACHE):
+    """Export the .pt to `fmt` ("onnx" | "openvino") once; reuse it afterwards.
+
+    Cache key: model hash + input size + format. Class names are saved in a
+    JSON sidecar so later runs do not need to load the PyTorch model at all.
+    Returns (exported model path, sidecar path).
+    """
+    key = f"{Path(model_path).stem}_{model_hash(model_path)}_{imgsz[0]}x{imgsz[1]}_{fmt}"
+    cache_dir = Path(cache_dir)
+    target = cache_dir / (f"{key}.onnx" if fmt == "onnx" else key)
+    meta = cache_dir / f"{key}.json"
+    if target.exists() and meta.exists():
+        return target, meta
+    print(f"Exporting {model_path} to {fmt} ({imgsz[0]}x{imgsz[1]}), one time only...")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    model = YOLO(model_path)
+    exported = Path(model.export(format=fmt, imgsz=list(imgsz), dynamic=False, verbose=False))
+    if target.exists():
+        shutil.rmtree(target) if target.is_dir() else target.unlink()
+    shutil.move(str(exported), str(target))
+    meta.write_text(json.dumps({"names": {int(k): v for k, v in model.names.items()},
+                                "imgsz": list(imgsz)}))
+    return target, meta
+
+
+def _boxes_numpy(boxes):
+    return (boxes.xyxy.cpu().numpy().astype(np.float32),
+            boxes.cls.cpu().numpy().astype(np.int32),
+            boxes.conf.cpu().numpy().astype(np.float32))
+
+
+class TorchDetector:
+    """ultralytics/PyTorch path, with the rectangular input size of the ROI."""
+    name = "torch"
+
+    def __init__(self, imgsz, device: str = DEVICE, threads: int = INFER_THREADS):
+        self.device = resolve_device(device)
+        if threads and self.device == "cpu":
+            import torch
+            torch.set_num_threads(threads)
+        self.imgsz = tuple(imgsz)
+        self.model = YOLO(MODEL_PATH)
+        self.names = self.model.names
+
+    def detect(self, frame: np.ndarray):
+        """BGR frame -> (xyxy float32 (N, 4), cls int32 (N,), conf float32 (N,))."""
+        r = self.model(frame, conf=CONF, iou=IOU, imgsz=self.imgsz, device=self.device, verbose=False)
+        return _boxes_numpy(r[0].boxes)
+
+    def detect_batch(self, frames):
+        rs = self.model(frames, conf=CONF, iou=IOU, imgsz=self.imgsz, device=self.device, verbose=False)
+        return [_boxes_numpy(r.boxes) for r in rs]
+
+
+class CpuDetector:
+    """Exported model on a CPU runtime (OpenVINO or ONNX Runtime), batch 1.
+
+    Pre-processing reuses preallocated buffers (letterbox canvas, resized
+    frame and the float32 NCHW input), so no full-frame array is allocated per
+    call; post-processing (class scores, box decoding, class-aware NMS) is
+    plain NumPy + cv2.dnn.
+    """
+    def __init__(self, backend: str, frame_shape, imgsz, threads: int = INFER_THREADS):
+        self.name = backend
+        self.imgsz = tuple(imgsz)
+        path, meta = export_cached(backend, self.imgsz)
+        self.names = {int(k): v for k, v in json.loads(meta.read_text())["names"].items()}
+        threads = threads or (os.cpu_count() or 1)
+        if backend == "onnx":
+            import onnxruntime as ort
+            opts = ort.SessionOptions()
+            opts.intra_op_num_threads = threads
+            self._session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+            input_name = self._session.get_inputs()[0].name
+            self._run = lambda x: self._session.run(None, {input_name: x})[0]
+        else:
+            try:
+                from openvino import Core
+            except ImportError:
+                from openvino.runtime import Core
+            core = Core()
+            xml = next(Path(path).glob("*.xml"))
+            compiled = core.compile_model(core.read_model(xml), "CPU",
+                                          {"INFERENCE_NUM_THREADS": threads})
+            self._request = compiled.create_infer_request()
+            self._run = lambda x: self._request.infer({0: x})[compiled.output(0)]
+        self._set_geometry(frame_shape)
+
+    def _set_geometry(self, frame_shape):
+        fh, fw = frame_shape[:2]
+        ih, iw = self.imgsz
+        self.frame_shape = (fh, fw)
+        self.ratio = min(ih / fh, iw / fw)
+        nh, nw = int(round(fh * self.ratio)), int(round(fw * self.ratio))
+        self.pad = ((iw - nw) // 2, (ih - nh) // 2)  # (left, top)
+        self._resized = np.empty((nh, nw, 3), dtype=np.uint8)
+        self._canvas = np.full((ih, iw, 3), 114, dtype=np.uint8)
+        self._blob = np.empty((1, 3, ih, iw), dtype=np.float32)
+
+    def preprocess(self, frame: np.ndarray) -> np.ndarray:
+        if frame.shape[:2] != self.frame_shape:
+            self._set_geometry(frame.shape)
+        left, top = self.pad
+        nh, nw = self._resized.shape[:2]
+        cv2.resize(frame, (nw, nh), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        self._canvas[top:top + nh, left:left + nw] = self._resized
+        # BGR HWC uint8 -> RGB CHW float32 [0, 1], into the preallocated blob
+        for c in range(3):
+            np.multiply(self._canvas[..., 2 - c], 1.0 / 255.0, out=self._blob[0, c])
+        return self._blob
+
+    def postprocess(self, out: np.ndarray):
+        pred = out[0]                       # (4 + classes, anchors)
+        scores = pred[4:]
+        cls = scores.argmax(axis=0)
+        conf = scores[cls, np.arange(scores.shape[1])]
+        keep = conf >= CONF
+        if not keep.any():
+            return (np.zeros((0, 4), np.float32), np.zeros(0, np.int32), np.zeros(0, np.float32))
+        cx, cy, w, h = pred[:4, keep]
+        cls, conf = cls[keep].astype(np.int32), conf[keep].astype(np.float32)
+        left, top = self.pad
+        xyxy = np.stack([cx - w / 2 - left, cy - h / 2 - top,
+                         cx + w / 2 - left, cy + h / 2 - top], axis=1) / self.ratio
+        # class-aware NMS: shift each class to its own region of the plane
+        offset = (cls * 4096.0)[:, None]
+        xywh = np.concatenate([xyxy[:, :2] + offset, xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+        idx = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), conf.tolist(), CONF, IOU), dtype=np.int64).reshape(-1)
+        fh, fw = self.frame_shape
+        xyxy = xyxy[idx].astype(np.float32)
+        np.clip(xyxy[:, 0::2], 0, fw, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, fh, out=xyxy[:, 1::2])
+        return xyxy, cls[idx], conf[idx]
+
+    def detect(self, frame: np.ndarray):
+        return self.postprocess(self._run(self.preprocess(frame)))
+
+    def detect_batch(self, frames):
+        return [self.detect(f) for f in frames]
+
+
+def available_backends():
+    out = ["torch"]
+    for name, module in (("openvino", "openvino"), ("onnx", "onnxruntime")):
+        try:
+            __import__(module)
+            out.append(name)
+        except ImportError:
+            pass
+    return out
+
+
+def make_detector(frame_shape, backend: str = BACKEND, device: str = DEVICE,
+                  threads: int = INFER_THREADS):
+    """Build the detector for frames of `frame_shape` (H, W[, C])."""
+    imgsz = input_size(frame_shape[0], frame_shape[1])
+    if backend == "auto":
+        cpu_backends = [b for b in available_backends() if b != "torch"]
+        backend = "torch" if resolve_device(device) == "cuda" or not cpu_backends else cpu_backends[0]
+    if backend == "torch":
+        return TorchDetector(imgsz, device, threads)
+    return CpuDetector(backend, frame_shape, imgsz, threads)
+
+
+def benchmark_backends(n_frames: int = 100, backends=None):
+    """Time each backend on the ROI size (torch on CPU is the reference)."""
+    shape = (monitor["height"], monitor["width"], 3)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    print(f"ROI {shape[1]}x{shape[0]} -> input {input_size(*shape[:2])}, {n_frames} frames")
+    for backend in backends or available_backends():
+        try:
+            det = make_detector(shape, backend, device="cpu")
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            continue
+        for _ in range(5):  # warm-up
+            det.detect(frame)
+        times = []
+        for _ in range(n_frames):
+            t0 = time.perf_counter()
+            det.detect(frame)
+            times.append(time.perf_counter() - t0)
+        ms = np.array(times) * 1000.0
+        print(f"{backend:>8}: {1000.0 / ms.mean():6.1f} fps | mean {ms.mean():.1f}ms"
+              f" | p99 {np.percentile(ms, 99):.1f}ms")
+
+
+# ========================= Detection log =========================
+DETECTION_DTYPE = np.dtype([
+    ("t", np.float64),      # capture time (perf_counter live, container seconds offline)
+    ("frame", np.int64),    # frame index
+    ("cls", np.int16),      # class id; -1 = frame processed with no detections
+    ("conf", np.float32),
+    ("x1", np.float32), ("y1", np.float32), ("x2", np.float32), ("y2", np.float32),
+    ("tracked", np.bool_),  # box moved by the tracker (motion gate), not a fresh inference
+])
+
+
+class DetectionLog:
+    """Append-only, chunked columnar store of per-frame detections.
+
+    `append` only copies the rows into a preallocated record buffer (under a
+    short lock); full buffers are swapped for recycled ones and written as
+    `chunk_NNNNNN.npy` by a background thread, which also flushes partial
+    chunks every `flush_sec`. Chunks are written to a temp name and renamed, so
+    readers (`load_detections`) never see a half-written file.
+    """
+    def __init__(self, out_dir, meta: dict, chunk_rows: int = DETLOG_CHUNK_ROWS,
+                 flush_sec: float = DETLOG_FLUSH_SEC, spare_buffers: int = 3):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        info = dict(meta, dtype=DETECTION_DTYPE.descr, chunk_rows=chunk_rows,
+                    wall_minus_perf=time.time() - time.perf_counter())
+        (self.out_dir / "meta.json").write_text(json.dumps(info, indent=2))
+        self.chunk_rows = chunk_rows
+        self.flush_sec = flush_sec
+        self._buf = np.empty(chunk_rows, dtype=DETECTION_DTYPE)
+        self._fill = 0
+        self._free = queue.Queue()
+        for _ in range(spare_buffers):
+            self._free.put(np.empty(chunk_rows, dtype=DETECTION_DTYPE))
+        self._full = queue.Queue()
+        self._lock = threading.Lock()
+        self._chunks = 0
+        self._closing = False
+        self.rows = 0        # rows written, including the cls=-1 "no detections" markers
+        self.detections = 0  # real boxes only
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def append(self, t: float, frame: int, xyxy: np.ndarray, cls: np.ndarray,
+               conf: np.ndarray, tracked: bool = False):
+        n = len(cls)
+        with self._lock:
+            if n == 0:
+                self._put_rows(t, frame, None, None, None, tracked, 1)
+                return
+            done = 0
+            while done < n:
+                k = self._put_rows(t, frame, xyxy[done:], cls[done:], conf[done:], tracked, n - done)
+                done += k
+            self.detections += n
+
+    def _put_rows(self, t, frame, xyxy, cls, conf, tracked, n) -> int:
+        """Write up to `n` rows at the fill position (lock held); returns rows written."""
+        k = min(n, self.chunk_rows - self._fill)
+        rows = self._buf[self._fill:self._fill + k]
+        rows["t"] = t
+        rows["frame"] = frame
+        rows["tracked"] = tracked
+        if cls is None:
+            rows["cls"] = -1
+            rows["conf"] = 0.0
+            for c in ("x1", "y1", "x2", "y2"):
+                rows[c] = 0.0
+        else:
+            rows["cls"] = cls[:k]
+            rows["conf"] = conf[:k]
+            rows["x1"] = xyxy[:k, 0]; rows["y1"] = xyxy[:k, 1]
+            rows["x2"] = xyxy[:k, 2]; rows["y2"] = xyxy[:k, 3]
+        self._fill += k
+        self.rows += k
+        if self._fill == self.chunk_rows:
+            self._full.put(self._buf)
+            try:
+                self._buf = self._free.get_nowait()
+            except queue.Empty:
+                self._buf = np.empty(self.chunk_rows, dtype=DETECTION_DTYPE)  # writer behind
+            self._fill = 0
+        return k
+
+    def _write_chunk(self, rows: np.ndarray):
+        path = self.out_dir / f"chunk_{self._chunks:06d}.npy"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, rows)
+        os.replace(tmp, path)
+        self._chunks += 1
+
+    def _writer_loop(self):
+        while True:
+            try:
+                buf = self._full.get(timeout=self.flush_sec)
+            except queue.Empty:
+                buf = None
+            if buf is None:
+                # periodic / final flush of the partial buffer. `append` may have
+                # queued full buffers since the timeout: their rows are older than
+                # the partial, so they are taken under the same lock and written first
+                older = []
+                with self._lock:
+                    while True:
+                        try:
+                            full = self._full.get_nowait()
+                        except queue.Empty:
+                            break
+                        if full is not None:  # close() sentinel: _closing is already set
+                            older.append(full)
+                    partial = self._buf[:self._fill].copy() if self._fill else None
+                    self._fill = 0
+                for full in older:
+                    self._write_chunk(full)
+                    self._free.put(full)
+                if partial is not None:
+                    self._write_chunk(partial)
+                if self._closing:
+                    break
+                continue
+            self._write_chunk(buf)
+            self._free.put(buf)
+
+    def close(self):
+        self._closing = True
+        self._full.put(None)
+        self._thread.join()
+
+
+def load_detections(out_dir):
+    """Read a DetectionLog back: (record array with DETECTION_DTYPE, meta dict)."""
+    out_dir = Path(out_dir)
+    meta = json.loads((out_dir / "meta.json").read_text())
+    meta["names"] = {int(k): v for k, v in meta.get("names", {}).items()}  # JSON keys are str
+    parts = [np.load(p) for p in sorted(out_dir.glob("chunk_*.npy"))]
+    rows = np.concatenate(parts) if parts else np.zeros(0, dtype=DETECTION_DTYPE)
+    return rows, meta
+
+
+# ========================= Offline (recorded MP4s) =========================
+def _decode_loop(cap, batch: int, out: queue.Queue, stop: threading.Event):
+    """Decode thread: reads frames and hands them over in batches of `batch`."""
+    frames, stamps = [], []
+    try:
+        while not stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                break
+            # Position in ms from the container: correct for CFR and VFR (dedup) files
+            stamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+            frames.append(frame)
+            if len(frames) == batch:
+                out.put((frames, stamps))
+                frames, stamps = [], []
+        if frames:
+            out.put((frames, stamps))
+    finally:
+        cap.release()
+        out.put(None)
+
+
+_worker_threads = INFER_THREADS
+_worker_detectors = {}  # one detector per frame size, reused across files
+
+def _init_worker(threads: int):
+    """Process-pool initializer: split the CPU between workers."""
+    global _worker_threads
+    _worker_threads = threads
+    cv2.setNumThreads(1)
+
+
+def _detector_for(shape):
+    if shape not in _worker_detectors:
+        _worker_detectors[shape] = make_detector(shape, threads=_worker_threads)
+    return _worker_detectors[shape]
+
+
+def detect_video(path, detector=None, batch: int = OFFLINE_BATCH,
+                 out_dir=OFFLINE_OUTPUT_DIR) -> dict:
+    """Run the detector over a whole recording into a DetectionLog
+    (`<stem>_detections/`, rows as in DETECTION_DTYPE; `t` is the container
+    timestamp in seconds, frames without boxes get one cls=-1 row).
+    """
+    path = Path(path)
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    if detector is None:
+        shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        detector = _detector_for(shape)
+
+    batches = queue.Queue(maxsize=OFFLINE_DECODE_QUEUE)
+    stop = threading.Event()
+    decoder = threading.Thread(target=_decode_loop, args=(cap, batch, batches, stop), daemon=True)
+    decoder.start()
+
+    out_dir = Path(out_dir) if out_dir else path.parent
+    names = detector.names
+    log = DetectionLog(out_dir / f"{path.stem}_detections",
+                       dict(source=str(path), clock="video", names=names))
+    n_frames = 0
+    t0 = time.perf_counter()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            frames, stamps = item
+            for i, (xyxy, cls, conf) in enumerate(detector.detect_batch(frames)):
+                log.append(stamps[i], n_frames + i, xyxy, cls, conf)
+            n_frames += len(frames)
+    finally:
+        stop.set()
+        # unblock the decoder if it is waiting on a full queue
+        while decoder.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        log.close()
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    return dict(video=str(path), output=str(log.out_dir), frames=n_frames,
+                detections=log.detections, seconds=elapsed, fps=n_frames / elapsed)
+
+
+def run_offline(videos, workers: int = OFFLINE_WORKERS):
+    """Process several recordings concurrently (one worker process per file)."""
+    workers = max(1, min(workers, len(videos)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Offline detection: {len(videos)} file(s), {workers} worker(s) x {threads} thread(s),"
+          f" batch {OFFLINE_BATCH}")
+    t0 = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(detect_video, v): v for v in videos}
+        for fut in as_completed(futures):
+            try:
+                r = fut.result()
+            except Exception as e:
+                print(f"ERROR in {futures[fut]}: {e}")
+                continue
+            total += r["frames"]
+            print(f"{r['video']}: {r['frames']} frames, {r['detections']} boxes,"
+                  f" {r['fps']:.1f} fps -> {r['output']}")
+    elapsed = max(time.perf_counter() - t0, 1e-9)
+    print(f"Done: {total} frames in {elapsed:.1f}s ({total / elapsed:.1f} fps overall)")
+
+
+# ========================= Motion gating + tracking =========================
+class MotionGate:
+    """Decides when the full model must run, from a subsampled frame difference.
+
+    Compares `frame[::step, ::step]` against the sample taken at the last
+    inference (preallocated buffers, a few KB): the score is the fraction of
+    samples whose difference exceeds `pixel_delta` in any channel. Comparing to
+    the last *inferred* frame (not the previous one) catches slow drift too.
+    """
+    def __init__(self, step: int = MOTION_STEP, pixel_delta: int = MOTION_PIXEL_DELTA,
+                 threshold: float = MOTION_THRESHOLD, max_interval: float = MOTION_MAX_INTERVAL):
+        self.step = step
+        self.pixel_delta = pixel_delta
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self._cur = self._ref = self._diff = None
+        self._last_t = None
+        self.score = 0.0
+
+    def should_infer(self, frame: np.ndarray, t: float) -> bool:
+        sample = frame[::self.step, ::self.step]
+        if self._cur is None or self._cur.shape != sample.shape:
+            self._cur = np.empty(sample.shape, dtype=np.uint8)
+            self._ref = np.empty(sample.shape, dtype=np.uint8)
+            self._diff = np.empty(sample.shape, dtype=np.uint8)
+            self._last_t = None
+        np.copyto(self._cur, sample)
+        if self._last_t is None or t - self._last_t >= self.max_interval:
+            return True
+        cv2.absdiff(self._cur, self._ref, dst=self._diff)
+        changed = np.count_nonzero(self._diff.max(axis=2) > self.pixel_delta)
+        self.score = changed / (self._diff.shape[0] * self._diff.shape[1])
+        return self.score >= self.threshold
+
+    def mark_inferred(self, t: float):
+        """The sample from the last `should_infer` becomes the new reference."""
+        self._cur, self._ref = self._ref, self._cur
+        self._last_t = t
+
+
+class BoxTracker:
+    """Moves the last detections between inferences with sparse LK optical flow.
+
+    A `grid` x `grid` lattice of points inside each box is tracked from the
+    previous frame to the current one (gray, downscaled by `scale`); each box
+    is shifted by the median displacement of its well-tracked points. Boxes
+    with too few good points stay where they are.
+    """
+    def __init__(self, scale: float = TRACK_SCALE, grid: int = TRACK_GRID):
+        self.scale = scale
+        self.grid = grid
+        self._prev = None
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        u = (np.arange(grid, dtype=np.float32) + 0.5) / grid
+        self._uv = np.stack(np.meshgrid(u, u), axis=-1).reshape(-1, 2)  # (g*g, 2) in [0, 1]
+
+    def gray(self, frame: np.ndarray) -> np.ndarray:
+        g = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1.0:
+            g = cv2.resize(g, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return g
+
+    def reset(self, gray: np.ndarray, boxes: np.ndarray):
+        self._prev = gray
+        self.boxes = boxes.astype(np.float32, copy=True)
+
+    def update(self, gray: np.ndarray) -> np.ndarray:
+        if self._prev is None or not len(self.boxes):
+            self._prev = gray
+            return self.boxes
+        b = self.boxes * self.scale
+        size = (b[:, 2:] - b[:, :2])[:, None, :]
+        pts = (b[:, None, :2] + self._uv[None] * size).reshape(-1, 1, 2).astype(np.float32)
+        nxt, status, _ = cv2.calcOpticalFlowPyrLK(self._prev, gray, pts, None,
+                                                  winSize=(15, 15), maxLevel=2)
+        d = (nxt - pts).reshape(len(b), -1, 2)
+        ok = status.reshape(len(b), -1).astype(bool)
+        h, w = gray.shape[:2]
+        for i in range(len(b)):
+            if ok[i].sum() >= 3:
+                dx, dy = np.median(d[i][ok[i]], axis=0) / self.scale
+                self.boxes[i] += (dx, dy, dx, dy)
+        np.clip(self.boxes[:, 0::2], 0, w / self.scale, out=self.boxes[:, 0::2])
+        np.clip(self.boxes[:, 1::2], 0, h / self.scale, out=self.boxes[:, 1::2])
+        self._prev = gray
+        return self.boxes
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def evaluate_gating(path, detector=None):
+    """Compare gated + tracked boxes against running the model on every frame.
+
+    Reports the reduction in inference calls and, on the frames where the
+    model was skipped, the mean IoU of tracked boxes matched to the full
+    inference (same class, greedy) and the share of reference boxes recovered
+    with IoU >= 0.5.
+    """
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    if detector is None:
+        detector = make_detector((int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                                  int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3))
+    gate, tracker = MotionGate(), BoxTracker()
+    frames = inferences = 0
+    ious, matched, reference = [], 0, 0
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        ref_xyxy, ref_cls, _ = detector.detect(frame)
+        gray = tracker.gray(frame)
+        if gate.should_infer(frame, t):
+            gate.mark_inferred(t)
+            tracker.reset(gray, ref_xyxy)
+            cls = ref_cls
+            inferences += 1
+        else:
+            pred = tracker.update(gray)
+            reference += len(ref_xyxy)
+            if len(pred) and len(ref_xyxy):
+                iou = box_iou(ref_xyxy, pred)
+                iou[ref_cls[:, None] != cls[None, :]] = 0.0
+                while iou.size and iou.max() > 0:
+                    r, c = np.unravel_index(np.argmax(iou), iou.shape)
+                    ious.append(iou[r, c])
+                    matched += iou[r, c] >= 0.5
+                    iou[r, :] = 0.0
+                    iou[:, c] = 0.0
+        frames += 1
+    cap.release()
+    print(f"{path}: {frames} frames, {inferences} inferences"
+          f" ({frames / max(inferences, 1):.1f}x fewer calls)")
+    if reference:
+        print(f"Skipped frames: mean IoU {np.mean(ious) if ious else 0.0:.3f}"
+              f" | boxes recovered (IoU>=0.5) {100.0 * matched / reference:.1f}%")
+
+
+# ========================= Live (screen ROI) =========================
+class LatestSlot:
+    """Single-slot handoff between threads: the writer overwrites, readers wait
+    for something newer than what they last saw. Stale items are dropped, never
+    queued, so a slow consumer always picks up the freshest one."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._item = None
+        self.closed = False
+        self.error = None  # set by the producer when it dies (see `fail`)
+
+    def publish(self, item):
+        with self._cond:
+            self._seq += 1
+            self._item = item
+            self._cond.notify_all()
+
+    def wait_newer(self, seq: int, timeout=None):
+        """Return (seq, item) newer than `seq`, or None on timeout / close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq or self.closed, timeout)
+            if self._seq <= seq:
+                return None
+            return self._seq, self._item
+
+    def latest(self):
+        """Most recent item (or None), without waiting."""
+        with self._cond:
+            return self._item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def fail(self, error: BaseException):
+        """Close the slot recording why its producer stopped."""
+        with self._cond:
+            self.error = error
+        self.close()
+
+
+class Detections(NamedTuple):
+    index: int          # capture index of the frame the model saw
+    t_capture: float    # perf_counter when that frame was grabbed
+    t_done: float       # perf_counter when the boxes became available
+    xyxy: np.ndarray    # (N, 4) float32, ROI pixels
+    cls: np.ndarray     # (N,) int
+    conf: np.ndarray    # (N,) float32
+    tracked: bool = False  # boxes moved by the tracker, not a fresh inference
+
+
+def capture_loop(frames, stop: threading.Event, fps: float, regions=None, source=None):
+    """Capture thread: grab at `fps`, publish (index, t_capture, BGR frame).
+
+    Each frame gets its own BGR array: once published it is shared read-only by
+    the inference and display threads, which may hold it for different times.
+    With several `regions` (one LatestSlot each in `frames`), the union is
+    grabbed once and each ROI is converted straight from its view of the grab.
+    With `source` (a HubSubscriber) frames come from the capture hub instead.
+    """
+    if isinstance(frames, LatestSlot):
+        frames = [frames]
+    # mss handles are per-thread
+    grabber = source if source is not None else RoiGrabber(regions or [monitor], mss())
+    h_grab = METRICS.histogram("yolo_grab_seconds")
+    h_convert = METRICS.histogram("yolo_convert_seconds")
+    period = 1.0 / fps
+    next_t = time.perf_counter()
+    index = 0
+    while not stop.is_set():
+        grab_start = time.perf_counter()
+        views = grabber.grab()
+        if views is None:
+            break  # hub stopped
+        grabbed = time.perf_counter()
+        capture_start = grabber.t_capture  # grab time (the hub's, when reading from it)
+        converted = [cv2.cvtColor(v, cv2.COLOR_BGRA2BGR) for v in views]
+        h_grab.observe(grabbed - grab_start)
+        h_convert.observe(time.perf_counter() - grabbed)
+        # Last ROI first: whoever waits on frames[0] finds every ROI of this tick published
+        for slot, frame in reversed(list(zip(frames, converted))):
+            slot.publish((index, capture_start, frame))
+        METRICS.inc("yolo_frames_total")
+        index += 1
+        next_t += period
+        delay = next_t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_t = time.perf_counter()  # behind schedule: don't burst to catch up
+
+
+def inference_loop(detector, frames: LatestSlot, dets: LatestSlot, log: DetectionLog = None):
+    """Inference thread: always runs on the freshest frame; frames published
+    while the model was busy are skipped (counted as stale). With MOTION_GATE,
+    frames without enough change only get the tracker update. Every processed
+    frame (inferred or tracked) is appended to `log`, stamped with its capture time.
+    If the detector raises, the error is stored on `dets` (`dets.error`) and the
+    thread exits."""
+    h_inference = METRICS.histogram("yolo_inference_seconds")
+    h_latency = METRICS.histogram("yolo_detection_latency_seconds")
+    h_track = METRICS.histogram("yolo_track_seconds")
+    gate = MotionGate() if MOTION_GATE else None
+    tracker = BoxTracker()
+    last = None
+    seq = 0
+    try:
+        while True:
+            got = frames.wait_newer(seq)
+            if got is None:
+                break
+            new_seq, (index, t_capture, frame) = got
+            if seq:
+                METRICS.inc("yolo_stale_frames_total", new_seq - seq - 1)
+            seq = new_seq
+            t0 = time.perf_counter()
+            if gate is not None and last is not None and not gate.should_infer(frame, t_capture):
+                xyxy = tracker.update(tracker.gray(frame))
+                t_done = time.perf_counter()
+                h_track.observe(t_done - t0)
+                METRICS.inc("yolo_gated_total")
+                dets.publish(last._replace(index=index, t_capture=t_capture, t_done=t_done,
+                                           xyxy=xyxy.copy(), tracked=True))
+                if log is not None:
+                    log.append(t_capture, index, xyxy, last.cls, last.conf, tracked=True)
+                continue
+            if gate is not None and last is None:
+                gate.should_infer(frame, t_capture)  # takes the first reference sample
+            xyxy, cls, conf = detector.detect(frame)
+            t_done = time.perf_counter()
+            h_inference.observe(t_done - t0)
+            h_latency.observe(t_done - t_capture)
+            METRICS.inc("yolo_inferences_total")
+            last = Detections(index, t_capture, t_done, xyxy, cls, conf)
+            if gate is not None:
+                gate.mark_inferred(t_capture)
+                tracker.reset(tracker.gray(frame), last.xyxy)
+            dets.publish(last)
+            if log is not None:
+                log.append(t_capture, index, xyxy, cls, conf)
+    except Exception as e:
+        # A failing model (bad export, driver error, OOM...) must not leave the
+        # UI showing stale boxes forever: record it and let the display stop
+        METRICS.inc("yolo_inference_errors_total")
+        print(f"Inference failed: {type(e).__name__}: {e}")
+        dets.fail(e)
+
+
+def draw_detections(img: np.ndarray, det: Detections, names):
+    """Overlay boxes and labels in place (cheaper than results.plot(), and the
+    boxes can be drawn on a newer frame than the one that produced them)."""
+    for (x1, y1, x2, y2), c, p in zip(det.xyxy.astype(np.int32), det.cls, det.conf):
+        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(img, f"{names.get(int(c), c)} {p:.2f}", (x1, max(12, y1 - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+
+def run_live():
+    source = HubSubscriber(CAPTURE_HUB) if CAPTURE_HUB else None
+    regions = source.regions if source is not None else parse_regions(MONITORS, monitor)
+    multi = len(regions) > 1
+    # Load YOLOv8 Nano model on the selected backend, sized for each ROI
+    # (one detector per ROI: each runs on its own inference thread)
+    detectors = [make_detector((r["height"], r["width"], 3)) for r in regions]
+    names = detectors[0].names
+    for i, d in enumerate(detectors):
+        tag = f"ROI {i}: " if multi else ""
+        print(f"{tag}Backend: {d.name} | input {d.imgsz[1]}x{d.imgsz[0]}")
+
+    reporter = MetricsReporter(path=METRICS_FILE, port=METRICS_PORT)
+    h_plot = METRICS.histogram("yolo_plot_seconds")
+    h_display = METRICS.histogram("yolo_display_seconds")
+    h_display_latency = METRICS.histogram("yolo_display_latency_seconds")
+    logs = [None] * len(regions)
+    if DETLOG_DIR:
+        stamp = time.strftime("live_%Y%m%d_%H%M%S")
+        logs = [DetectionLog(Path(DETLOG_DIR) / (f"{stamp}_roi{i}" if multi else stamp),
+                             dict(source="live", clock="perf_counter", names=names, roi=r))
+                for i, r in enumerate(regions)]
+        print(f"Detection log: {', '.join(str(log.out_dir) for log in logs)}")
+
+    # Capture (one grab of the ROI union) -> (latest frame per ROI) -> inference
+    # per ROI -> (latest boxes) -> display (this thread)
+    frames = [LatestSlot() for _ in regions]
+    dets = [LatestSlot() for _ in regions]
+    stop = threading.Event()
+    capture = threading.Thread(target=capture_loop, args=(frames, stop, LIVE_FPS, regions, source),
+                               daemon=True)
+    inferences = [threading.Thread(target=inference_loop, args=(d, f, q, log), daemon=True)
+                  for d, f, q, log in zip(detectors, frames, dets, logs)]
+    capture.start()
+    for t in inferences:
+        t.start()
+
+    # Reused display buffers: the shared frame is copied once and annotated in place
+    canvases = [np.empty((r["height"], r["width"], 3), dtype=np.uint8) for r in regions]
+    windows = [f"YOLOv8 Live Detection [{i}]" if multi else "YOLOv8 Live Detection"
+               for i in range(len(regions))]
+    seq = 0
+    prev_time = time.perf_counter()
+
+    print("Starting livestream detection. Press 'q' to quit.")
+
+    try:
+        while True:
+            # frames[0] is published last each tick, so the other ROIs are already there
+            got = frames[0].wait_newer(seq, timeout=1.0)
+            failed = [i for i, t in enumerate(inferences) if not t.is_alive()]
+            if failed:
+                for i in failed:
+                    print(f"{f'ROI {i}: ' if multi else ''}inference stopped"
+                          f" ({dets[i].error!r}); quitting.")
+                break
+            if got is None:
+                if not capture.is_alive():
+                    break
+                continue
+            seq, item = got
+
+            curr_time = time.perf_counter()
+            fps = 1 / max(curr_time - prev_time, 1e-6)
+            prev_time = curr_time
+            key = 0xFF
+            for i, (slot, det_slot, canvas) in enumerate(zip(frames, dets, canvases)):
+                index, t_capture, frame = item if i == 0 else slot.latest()
 
-# Frame skipping: process every nth frame for detection
-frame_skip = 2  # Adjust this (1 = no skipping, 2 = every 2nd frame, etc.)
-count = 0
+                plot_start = time.perf_counter()
+                np.copyto(canvas, frame)
+                det = det_slot.latest()
+                if det is not None:
+                    draw_detections(canvas, det, names)
 
-# Variable to store the last annotated frame
-last_annotated_frame = None
+                # FPS and latency info
+                cv2.putText(canvas, f"FPS: {int(fps)}", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                if det is not None:
+                    cv2.putText(canvas, f"Detection: {1000 * (det.t_done - det.t_capture):.0f}ms"
+                                        f" (boxes {index - det.index} frames old)", (10, 60),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+                h_plot.observe(time.perf_counter() - plot_start)
 
-print("Starting livestream detection. Press 'q' to quit.")
+                # Show the frame (per-frame timings go to the metrics instead of stdout)
+                display_start = time.perf_counter()
+                cv2.imshow(windows[i], canvas)
+                if i == len(canvases) - 1:
+                    key = cv2.waitKey(1) & 0xFF  # one event pump for all windows
+                shown = time.perf_counter()
+                h_display.observe(shown - display_start)
+                h_display_latency.observe(shown - t_capture)
+                METRICS.inc("yolo_displayed_total")
 
-prev_time = time.time()
+            if key == ord("q"):
+                break
+    finally:
+        stop.set()
+        for slot in frames:
+            slot.close()
+        capture.join()
+        for t in inferences:
+            t.join()
+        for log in logs:
+            if log is not None:
+                log.close()
+        if source is not None:
+            source.close()
+        cv2.destroyAllWindows()
+        reporter.close()
+        lat_d = METRICS.histogram("yolo_display_latency_seconds")
+        lat_i = METRICS.histogram("yolo_detection_latency_seconds")
+        print(f"Display latency: p50 {1000 * lat_d.quantile(0.5):.1f}ms p99 {1000 * lat_d.quantile(0.99):.1f}ms"
+              f" | Detection latency: p50 {1000 * lat_i.quantile(0.5):.1f}ms p99 {1000 * lat_i.quantile(0.99):.1f}ms")
+        print(METRICS.summary())
 
-while True:
-    # Timing for capture
-    capture_start = time.time()
-    screenshot = sct.grab(monitor)
-    frame = np.array(screenshot)
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
-    capture_time = time.time() - capture_start
 
-    # Run detection only every 'frame_skip' frames
-    if count % frame_skip == 0:
-        inference_start = time.time()
-        results = model(frame, conf=0.4, device="cuda")
-        inference_time = time.time() - inference_start
-        annotated_frame = results[0].plot()
-        last_annotated_frame = annotated_frame  # Update the last annotated frame
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench-backends":
+        benchmark_backends(backends=sys.argv[2:] or None)
+    elif len(sys.argv) > 2 and sys.argv[1] == "--eval-gate":
+        for video in sys.argv[2:]:
+            evaluate_gating(video)
+    elif len(sys.argv) > 1:
+        run_offline(sys.argv[1:])
     else:
-        # Use the last annotated frame if available, otherwise raw frame
-        annotated_frame = (
-            last_annotated_frame if last_annotated_frame is not None else frame
-        )
-
-    # Calculate FPS
-    curr_time = time.time()
-    fps = 1 / (curr_time - prev_time)
-    prev_time = curr_time
-
-    # Add FPS and timing info to the frame
-    cv2.putText(
-        annotated_frame,
-        f"FPS: {int(fps)}",
-        (10, 30),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        1,
-        (0, 255, 0),
-        2,
-    )
-    cv2.putText(
-        annotated_frame,
-        f"Capture: {capture_time:.3f}s",
-        (10, 60),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.7,
-        (255, 0, 0),
-        2,
-    )
-    cv2.putText(
-        annotated_frame,
-        f"Inference: {inference_time if 'inference_time' in locals() else 0:.3f}s",
-        (10, 90),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.7,
-        (255, 0, 0),
-        2,
-    )
-
-    # Show the frame
-    cv2.imshow("YOLOv8 Live Detection", annotated_frame)
-
-    # Print timing logs
-    print(
-        f"Capture: {capture_time:.3f}s, Inference: {inference_time if 'inference_time' in locals() else 0:.3f}s, FPS: {fps:.1f}"
-    )
-
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
-
-    count += 1
-
-cv2.destroyAllWindows()
\ No newline at end of file
+        run_live()